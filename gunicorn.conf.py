@@ -0,0 +1,25 @@
+import os
+
+# gunicorn reads this file from the project folder:
+#   gunicorn                  -> WSGI (sync workers)
+#   ICU_SERVER=asgi gunicorn  -> ASGI (uvicorn workers, async read views, websockets)
+if os.environ.get('ICU_SERVER') == 'asgi':
+    wsgi_app = 'icu.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'icu.wsgi:application'
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+
+def post_worker_init(worker):
+    # build the medicines autocomplete index before the first request
+    from django.db import connections
+    from medicine.autocomplete import medicines_index
+    try:
+        medicines_index.build()
+    except Exception:
+        worker.log.exception('Medicines autocomplete index not built, built on the first request')
+    finally:
+        connections.close_all()
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
     # external installed apps
     'rest_framework',
     'rest_framework.authtoken',
+    'channels',
     "corsheaders",
     'django_filters',
     "phonenumber_field",
@@ -43,11 +44,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'users.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.ActorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,6 +74,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'icu.wsgi.application'
+ASGI_APPLICATION = 'icu.asgi.application'
+
+# ICU_SERVER=asgi runs gunicorn with uvicorn workers (gunicorn.conf.py)
+# and serves the hot read endpoints with the async views
+ASYNC_VIEWS = os.environ.get('ICU_SERVER') == 'asgi'
 
 
 # Database
@@ -138,8 +146,73 @@ STATICFILES_DIRS = [
 # Media Files
 MEDIA_ROOT = os.path.join(BASE_DIR, 'static/')
 
+# Photos of the users / patients (users/images.py), thumbnails made by
+# python manage.py process_images
+IMAGE_MAX_SIZE = 2048
+IMAGE_QUALITY = 85
+IMAGE_THUMBNAIL_SIZE = (160, 160)
+IMAGE_THUMBNAIL_QUALITY = 80
+IMAGE_JOB_MAX_ATTEMPTS = 3
+IMAGE_JOB_LEASE = 60 * 5
+
 AUTH_USER_MODEL = 'users.User'
 
+# Rest Framework
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'users.authentication.CachedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    # cursor pagination, used when the client sends ?cursor= or ?page_size=
+    'DEFAULT_PAGINATION_CLASS': 'users.pagination.KeysetCursorPagination',
+    'PAGE_SIZE': 50,
+}
+
+# Cache (local memory, or Redis when REDIS_URL is set)
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Channels (websocket care team events), Redis layer when REDIS_URL is set
+if os.environ.get('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.environ['REDIS_URL']]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+# Token -> user cache used by CachedTokenAuthentication, only with Redis: a
+# logout / deactivation must be seen by every worker (None: one query per request)
+AUTH_TOKEN_CACHE = 'default' if os.environ.get('REDIS_URL') else None
+AUTH_TOKEN_CACHE_TIMEOUT = 60 * 5
+
+# Response cache of the per user read endpoints (users/response_cache.py)
+# versions in the default cache with Redis (shared by the workers), else in the
+# database (None: a local memory cache is per worker), responses in a local LRU
+# of RESPONSE_CACHE_LOCAL_SIZE entries + the shared cache with Redis
+RESPONSE_CACHE_VERSIONS = 'default' if os.environ.get('REDIS_URL') else None
+RESPONSE_CACHE_SHARED = 'default' if os.environ.get('REDIS_URL') else None
+RESPONSE_CACHE_LOCAL_SIZE = 1000
+RESPONSE_CACHE_TIMEOUT = 60 * 5
+
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -147,3 +220,40 @@ EMAIL_USE_SSL = True
 EMAIL_PORT = 465
 EMAIL_HOST_USER = 'ma72207220@gmail.com'
 EMAIL_HOST_PASSWORD = 'ixoytmnzitrjnalx'
+
+# Outbox (python manage.py send_emails)
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_LEASE = 60 * 5
+
+# Full-text search of the reports (reports/search.py): PostgreSQL text search
+# configuration, the newest REPORT_SEARCH_WINDOW matches are ranked,
+# REPORT_SEARCH_BACKEND = dotted path of another backend
+REPORT_SEARCH_CONFIG = 'english'
+REPORT_SEARCH_LIMIT = 20
+REPORT_SEARCH_WINDOW = 1000
+# reports in one POST of reports/nurse_report/batch (reports/batch.py)
+REPORT_BATCH_LIMIT = 100
+
+# Streamed exports of the admin (users/export.py): rows read per chunk
+EXPORT_CHUNK_SIZE = 2000
+
+# Autocomplete of the medicines catalog (medicine/autocomplete.py): ranked by
+# the prescriptions of the last MEDICINES_USAGE_DAYS days, the other workers'
+# changes are seen after MEDICINES_INDEX_CHECK seconds at most
+MEDICINES_USAGE_DAYS = 90
+MEDICINES_INDEX_CHECK = 1
+MEDICINES_SIMILARITY = 0.3
+MEDICINES_AUTOCOMPLETE_LIMIT = 10
+MEDICINES_AUTOCOMPLETE_CACHE = 5000
+
+# Delta sync (api/sync), tombstones removed by python manage.py purge_tombstones
+SYNC_OVERLAP = 5
+SYNC_TOMBSTONE_DAYS = 30
+
+# Queries / timings of the requests (users/metrics.py): Server-Timing header,
+# /metrics for Prometheus (with "Authorization: Bearer METRICS_TOKEN", or a
+# staff session). Over the query_budget of a view the request fails when
+# QUERY_BUDGET_STRICT (set by the test runner)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+QUERY_BUDGET_STRICT = False
+TEST_RUNNER = 'users.testing.TestRunner'
@@ -15,6 +15,7 @@ class Medicines(admin.ModelAdmin):
 class Medicine(admin.ModelAdmin):
     list_display = ['name', 'quantity', 'dosage', 'doctor', 'patient']
     list_per_page = 10
+    list_select_related = ['name', 'doctor', 'patient']
 
     def get_model_perms(self, request):
         if not request.user.is_admin:
@@ -0,0 +1,21 @@
+from users.async_views import AsyncAPIView
+from users.conditional import aconditional_list
+from users.pagination import KeysetCursorPagination
+from .models import Medicine
+from .serializer import NurseResultMedicineSerializer
+from .views import MEDICINE_SCOPES
+
+
+# -------  Get Medicines for (Nurse) (async GetMedicineNurse)
+class GetMedicineNurseAsync(AsyncAPIView):
+
+    async def get(self, request):
+        medicine = Medicine.objects.select_related('doctor', 'patient', 'name').filter(
+            nurse=request.actor.nurse)
+
+        async def build():
+            paginator = KeysetCursorPagination(ordering='-created')
+            data = await paginator.aget_list_data(
+                request, medicine, NurseResultMedicineSerializer, 'medicines', result_key=None)
+            return self.render(data, headers=paginator.get_headers())
+        return await aconditional_list(request, medicine, build, scopes=MEDICINE_SCOPES)
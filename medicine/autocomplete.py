@@ -0,0 +1,172 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from users.response_cache import LocalLRU, bump, get_versions
+from users.search import normalize
+from .models import Medicine, Medicines
+
+
+# ============================================================================
+# Autocomplete of the Medicines catalog (in memory, per process)
+# ============================================================================
+# Sorted list of the names and of every word of the names: a prefix is a
+# bisect + a slice. Trigrams of the names answer the typos ("amoxcilin").
+# Ranking: whole name prefix > word prefix > trigrams, then the prescriptions
+# of the last MEDICINES_USAGE_DAYS days. The signals (medicine/signals.py)
+# update the index of the process and bump the "medicines" version (shared by
+# the workers, users/response_cache.py), the other processes rebuild when they
+# see a new version (checked every MEDICINES_INDEX_CHECK seconds, not per
+# keystroke). The answers are
+# kept until the next change: the short prefixes match thousands of names.
+def trigrams(value):
+    value = f'  {value} '
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+class MedicinesIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built = False
+        self.version = None
+        self.checked = 0
+        self.usage = Counter()
+        # answers of the last queries, emptied on every change of the index
+        self.results = LocalLRU(settings.MEDICINES_AUTOCOMPLETE_CACHE)
+        self.clear()
+
+    def clear(self):
+        self.names = {}          # id -> name
+        self.keys = {}           # id -> normalized name
+        self.full = []           # sorted (normalized name, id)
+        self.words = []          # sorted (word, id)
+        self.grams = defaultdict(set)
+        if hasattr(self, 'results'):
+            self.results.clear()
+
+    # ---- Build / refresh
+    def build(self, version=None):
+        since = timezone.now() - timedelta(days=settings.MEDICINES_USAGE_DAYS)
+        usage = Counter(dict(Medicine.objects.filter(created__gte=since, name__isnull=False)
+                             .values_list('name').annotate(uses=Count('*')).order_by()))
+        with self.lock:
+            # read before the names: a change made meanwhile is seen on the next check
+            self.version = get_versions(['medicines'])[0] if version is None else version
+            self.clear()
+            for pk, name in Medicines.objects.order_by().values_list('id', 'name').iterator():
+                self.index(pk, name)
+            self.full.sort()
+            self.words.sort()
+            self.usage = usage
+            self.built = True
+            self.checked = time.monotonic()
+
+    def ensure_current(self):
+        if not self.built:
+            self.build()
+        elif time.monotonic() - self.checked > settings.MEDICINES_INDEX_CHECK:
+            self.checked = time.monotonic()
+            version = get_versions(['medicines'])[0]
+            if version != self.version:
+                self.build(version)
+
+    def index(self, pk, name, insort=False):
+        key = normalize(name)
+        self.names[pk] = name
+        self.keys[pk] = key
+        entries = [(self.full, (key, pk))] + [(self.words, (word, pk)) for word in set(key.split())]
+        for entries_list, entry in entries:
+            if insort:
+                entries_list.insert(bisect_left(entries_list, entry), entry)
+            else:
+                entries_list.append(entry)
+        for gram in trigrams(key):
+            self.grams[gram].add(pk)
+
+    def unindex(self, pk):
+        key = self.keys.pop(pk, None)
+        if key is None:
+            return
+        del self.names[pk]
+        for entries_list, entry in [(self.full, (key, pk))] + [(self.words, (word, pk)) for word in set(key.split())]:
+            position = bisect_left(entries_list, entry)
+            if position < len(entries_list) and entries_list[position] == entry:
+                del entries_list[position]
+        for gram in trigrams(key):
+            self.grams[gram].discard(pk)
+
+    # ---- Used by the signals
+    def saved(self, pk, name):
+        if self.built:
+            with self.lock:
+                self.unindex(pk)
+                self.index(pk, name, insort=True)
+                self.results.clear()
+        bump('medicines')
+
+    def deleted(self, pk):
+        if self.built:
+            with self.lock:
+                self.unindex(pk)
+                self.usage.pop(pk, None)
+                self.results.clear()
+        bump('medicines')
+
+    def used(self, pk):
+        if self.built and pk is not None:
+            with self.lock:
+                self.usage[pk] += 1
+                self.results.clear()
+
+    # ---- Search
+    def prefix(self, entries, query):
+        start = bisect_left(entries, (query,))
+        end = bisect_left(entries, (query + '\U0010ffff',), start)
+        return entries[start:end]
+
+    def search(self, query, limit=10):
+        self.ensure_current()
+        query = normalize(query)
+        if not query:
+            return []
+        cached = self.results.get((query, limit))
+        if cached is not None:
+            return cached
+        with self.lock:
+            # rank: (match, score), match 2 = name prefix, 1 = word prefix, 0 = trigrams
+            ranked = {}
+            for key, pk in self.prefix(self.full, query):
+                ranked[pk] = (2, self.usage[pk])
+            if len(ranked) < limit and ' ' not in query:
+                for word, pk in self.prefix(self.words, query):
+                    ranked.setdefault(pk, (1, self.usage[pk]))
+            if len(ranked) < limit and len(query) >= 3:
+                for pk, similarity in self.similar(query, limit):
+                    ranked.setdefault(pk, (0, similarity))
+            # best match, most used, then the shortest name
+            best = heapq.nsmallest(limit, ranked.items(), key=lambda item: (
+                -item[1][0], -item[1][1], len(self.keys[item[0]]), self.keys[item[0]]))
+            medicines = [{"id": pk, "name": self.names[pk], "uses": self.usage[pk]} for pk, rank in best]
+            self.results.set((query, limit), medicines, 60 * 60)
+            return medicines
+
+    def similar(self, query, limit):
+        grams = trigrams(query)
+        # the rare trigrams find the candidates ("  a" is in thousands of names)
+        postings = sorted((self.grams.get(gram, set()) for gram in grams), key=len)
+        postings = [posting for posting in postings if len(posting) <= 1000] or postings[:1]
+        shared = Counter()
+        for posting in postings:
+            shared.update(posting)
+        threshold = settings.MEDICINES_SIMILARITY
+        for pk, count in shared.most_common(limit * 5):
+            similarity = len(grams & trigrams(self.keys[pk])) / len(grams | trigrams(self.keys[pk]))
+            if similarity >= threshold:
+                yield pk, similarity
+
+medicines_index = MedicinesIndex()
@@ -40,6 +40,16 @@ class Medicine(models.Model):
         verbose_name = 'Medicine'
         verbose_name_plural = 'Medicine'
         ordering = ['-updated']
+        indexes = [
+            # medicines of the doctor (list ordering and cursor pagination)
+            models.Index(fields=['doctor', '-updated'],
+                         name='medicine_doctor_updated_idx'),
+            models.Index(fields=['doctor', '-created'],
+                         name='medicine_doctor_created_idx'),
+            # timeline of the patient
+            models.Index(fields=['patient', '-created'],
+                         name='medicine_timeline_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.name.name
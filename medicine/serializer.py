@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import Medicines, Medicine
 from users.models import Nurse, Doctor
+from users.fields import BulkSlugRelatedField
 from rest_framework.validators import ValidationError
 
 
@@ -12,7 +13,7 @@ class MedicinesSerializer(serializers.ModelSerializer):
 
 # Add to Nurse
 class AddMedicineSerializer(serializers.ModelSerializer):
-    nurse = serializers.SlugRelatedField(
+    nurse = BulkSlugRelatedField(
         slug_field="user_id", queryset=Nurse.objects.all(), many=True)
 
     class Meta:
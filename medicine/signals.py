@@ -0,0 +1,51 @@
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from users.events import publish_patient_event, publish_recipients_event
+from users.sync import record_deleted, record_recipients_removed, touch
+from users.models import Nurse
+from .models import Medicine, Medicines
+from .autocomplete import medicines_index
+
+
+# ========= Push the new medicines to the care team (websocket)
+@receiver(post_save, sender=Medicine)
+def medicine_created(sender, instance, created, **kwargs):
+    if created:
+        publish_patient_event('medicine.created', instance)
+        medicines_index.used(instance.name_id)
+
+
+@receiver(m2m_changed, sender=Medicine.nurse.through)
+def medicine_nurses_added(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and not reverse:
+        publish_recipients_event('medicine.received', instance, Nurse, pk_set)
+
+
+# ========= Delta sync (users/sync.py)
+@receiver(pre_delete, sender=Medicine)
+def medicine_deleted(sender, instance, **kwargs):
+    record_deleted(instance, instance.nurse)
+
+
+@receiver(m2m_changed, sender=Medicine.nurse.through)
+def medicine_nurses_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if reverse:
+        return
+    # recipients are in the responses: a new "updated" (sync, ETag) on every change
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        touch(instance)
+    if action == 'post_remove':
+        record_recipients_removed(instance, model, pk_set)
+    elif action == 'pre_clear':
+        record_recipients_removed(instance, model, instance.nurse.values_list('pk', flat=True))
+
+
+# ========= Autocomplete of the catalog (medicine/autocomplete.py)
+@receiver(post_save, sender=Medicines)
+def medicines_saved(sender, instance, **kwargs):
+    medicines_index.saved(instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=Medicines)
+def medicines_deleted(sender, instance, **kwargs):
+    medicines_index.deleted(instance.pk)
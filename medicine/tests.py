@@ -1,3 +1,105 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users.models import CacheVersion
+from users.testing import analyze, assert_no_full_scans, seed_care_team
+from .autocomplete import medicines_index
+from .models import Medicine, Medicines
 
-# Create your tests here.
+
+# ========= Indexes used by the medicine queries
+class MedicineIndexUsageTest(TestCase):
+    def setUp(self):
+        admin, doctors, self.nurses, patients = seed_care_team()
+        name = Medicines.objects.create(name='paracetamol')
+        Medicine.objects.bulk_create(
+            [Medicine(name=name, dosage='500mg', doctor=doctors[i % len(doctors)].user, patient=patient)
+             for i, patient in enumerate(patients * 5)])
+        analyze()
+        self.client = APIClient()
+        self.client.force_authenticate(doctors[0].user)
+
+    def test_medicines_of_doctor(self):
+        with assert_no_full_scans(self):
+            response = self.client.get(reverse('medicines_user'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], 10)
+
+    def test_medicines_of_doctor_page(self):
+        with assert_no_full_scans(self):
+            response = self.client.get(reverse('medicines_user'), {'page_size': 3})
+        self.assertEqual(response.data['results'], 3)
+
+    def test_medicines_of_nurse(self):
+        # query_budget: the same number of queries for any number of rows
+        nurse = self.nurses[0]
+        for medicine in Medicine.objects.all()[:20]:
+            medicine.nurse.add(nurse)
+        self.client.force_authenticate(nurse.user)
+        response = self.client.get(reverse('medicines_nurse'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['medicines']), 20)
+        self.assertEqual(response.data['medicines'][0]['name'], 'paracetamol')
+
+
+# ========= Autocomplete of the catalog
+class MedicinesAutocompleteTest(TestCase):
+    def setUp(self):
+        admin, doctors, nurses, patients = seed_care_team()
+        self.client = APIClient()
+        self.client.force_authenticate(doctors[0].user)
+        self.names = {name: Medicines.objects.create(name=name) for name in
+                      ['Paracetamol', 'Panadol Extra', 'Amoxicillin', 'Co-amoxiclav', 'Amlodipine']}
+        Medicine.objects.bulk_create([Medicine(name=self.names['Amlodipine'], dosage='5mg', patient=patients[0])
+                                      for i in range(3)])
+        medicines_index.built = False
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('medicines_autocomplete'), {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [medicine['name'] for medicine in response.data['medicines']]
+
+    def test_prefix_ranked_by_usage(self):
+        self.assertEqual(self.search('am'), ['Amlodipine', 'Amoxicillin', 'Co-amoxiclav'])
+        self.assertEqual(self.search('PA'), ['Paracetamol', 'Panadol Extra'])
+        self.assertEqual(self.search('extra'), ['Panadol Extra'])
+        self.assertEqual(self.search('am', limit=1), ['Amlodipine'])
+        self.assertEqual(self.search(''), [])
+
+    def test_typos(self):
+        self.assertEqual(self.search('amoxcilin')[0], 'Amoxicillin')
+
+    def test_signals_update_the_index(self):
+        self.search('am')
+        Medicines.objects.create(name='Amikacin')
+        self.names['Amoxicillin'].name = 'Ampicillin'
+        self.names['Amoxicillin'].save()
+        self.names['Co-amoxiclav'].delete()
+        self.assertEqual(self.search('am'), ['Amlodipine', 'Amikacin', 'Ampicillin'])
+        Medicine.objects.create(name=self.names['Amoxicillin'], dosage='1g')
+        self.assertEqual(self.search('amp'), ['Ampicillin'])
+        self.assertEqual(self.search('am')[1], 'Ampicillin')
+
+    @override_settings(MEDICINES_INDEX_CHECK=0)
+    def test_change_of_another_worker(self):
+        self.search('am')
+        # renamed by another worker: no signal here, only its bump of "medicines"
+        Medicines.objects.filter(pk=self.names['Amoxicillin'].pk).update(name='Ampicillin')
+        CacheVersion.objects.update_or_create(scope='medicines', defaults={'version': 100})
+        self.assertEqual(self.search('amp'), ['Ampicillin'])
+
+
+# ========= Medicine sent to all the nurses of the patient
+class AddMedicineAllNursesTest(TestCase):
+    def test_nurses_of_the_patient(self):
+        admin, doctors, nurses, patients = seed_care_team()
+        name = Medicines.objects.create(name='Paracetamol')
+        client = APIClient()
+        client.force_authenticate(doctors[0].user)
+        response = client.post(reverse('medicine_nurses'), {
+            'patient': str(patients[0].pk), 'name': name.pk, 'dosage': '500mg'})
+        self.assertEqual(response.status_code, 201)
+        medicine = Medicine.objects.get(pk=response.data['medicine']['id'])
+        self.assertEqual(set(medicine.nurse.all()), set(patients[0].nurse.all()))
+        self.assertEqual(medicine.doctor, doctors[0].user)
+        self.assertEqual(len(response.data['medicine']['nurse']), 2)
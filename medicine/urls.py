@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.urls import path
-from .views import (MedicinesView, MedicineDetails, AddMedicineAllNurses,
+from .views import (MedicinesView, MedicinesAutocomplete, MedicineDetails, AddMedicineAllNurses,
                     AddMedicineNurse, GetMedicineUser, GetMedicineNurse)
+from .async_views import GetMedicineNurseAsync
+
+GetMedicineNurseView = GetMedicineNurseAsync if settings.ASYNC_VIEWS else GetMedicineNurse
 
 urlpatterns = [
     # Medicine
@@ -14,7 +18,9 @@ urlpatterns = [
     path('medicines/<str:pk>', GetMedicineUser.as_view(),
          name='medicines_user_details'),
 
-    path('medicines_nurse', GetMedicineNurse.as_view(), name='medicines_nurse'),
+    path('medicines_nurse', GetMedicineNurseView.as_view(), name='medicines_nurse'),
+
+    path('autocomplete', MedicinesAutocomplete.as_view(), name='medicines_autocomplete'),
 
     path('', MedicinesView.as_view(), name='medicines'),
     path('<str:pk>', MedicineDetails.as_view(), name='medicine_detail'),
@@ -1,12 +1,22 @@
 from django.shortcuts import render
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework.response import Response
 from rest_framework import generics, status
 from .models import Medicines, Medicine
 from rest_framework.permissions import IsAuthenticated
 from .serializer import (MedicinesSerializer, AddMedicineSerializer, NurseResultMedicineSerializer,
                          AddAllNursesMedicineSerializer, ResultMedicineSerializer, SimpleResultMedicineSerializer)
-from users.models import Nurse, Patient
+from users.models import Nurse
+from users.care_team import fan_out
 from users.permissions import IsDoctor,IsNurse
+from users.conditional import conditional_list, conditional_object
+from users.pagination import KeysetCursorPagination
+from django.conf import settings
+from .autocomplete import medicines_index
+
+# in the ETags: the medicines show the names of the patients, doctors, nurses and medicines
+MEDICINE_SCOPES = ['patients', 'users', 'medicines']
 
 # ------- Name of Medicines
 class MedicinesView(generics.ListCreateAPIView):
@@ -14,6 +24,20 @@ class MedicinesView(generics.ListCreateAPIView):
     queryset = Medicines.objects.all()
 
 
+# ------- Autocomplete of the names (?q=amox&limit=10)
+class MedicinesAutocomplete(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = 3
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get('limit', settings.MEDICINES_AUTOCOMPLETE_LIMIT)), 50)
+        except ValueError:
+            return Response({"message": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        medicines = medicines_index.search(request.query_params.get('q', ''), max(limit, 1))
+        return Response({"result": len(medicines), "medicines": medicines}, status=status.HTTP_200_OK)
+
+
 # ------- Details Medicines
 class MedicineDetails(generics.RetrieveUpdateDestroyAPIView):
     queryset = Medicines.objects.all()
@@ -44,19 +68,24 @@ class AddMedicineNurse(generics.ListCreateAPIView):
 # ------- Get Medicine for Doctor
 class GetMedicineUser(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'GET': 4}
 
     def get(self, request, pk=None):
 
         doctor = request.user
 
         if pk:
-            medicine = Medicine.objects.prefetch_related('doctor').get(id=pk)
-            serializer = SimpleResultMedicineSerializer(medicine)
-            return Response({"medicine": serializer.data}, status=status.HTTP_200_OK)
+            def build():
+                medicine = Medicine.objects.prefetch_related('doctor').get(id=pk)
+                serializer = SimpleResultMedicineSerializer(medicine)
+                return Response({"medicine": serializer.data}, status=status.HTTP_200_OK)
+            return conditional_object(request, Medicine.objects, pk, build, scopes=MEDICINE_SCOPES)
         else:
-            medicine = Medicine.objects.filter(doctor=doctor)
-            serializer = ResultMedicineSerializer(medicine, many=True)
-            return Response({"results": medicine.count(), "medicines": serializer.data}, status=status.HTTP_200_OK)
+            medicine = Medicine.objects.filter(doctor=doctor).select_related('patient', 'name').prefetch_related(
+                Prefetch('nurse', queryset=Nurse.objects.select_related('user')))
+            paginator = KeysetCursorPagination(ordering='-created')
+            return conditional_list(request, medicine, lambda: paginator.get_list_response(
+                request, medicine, ResultMedicineSerializer, 'medicines', result_key='results'), scopes=MEDICINE_SCOPES)
 
     def delete(self, request, pk=None):
         medicine = Medicine.objects.prefetch_related('doctor').get(id=pk)
@@ -67,29 +96,33 @@ class GetMedicineUser(generics.RetrieveUpdateDestroyAPIView):
 # -------  Get Medicines for (Nurse)
 class GetMedicineNurse(generics.ListAPIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 4
 
     def get(self, request):
-        user = request.user
-        nurse = Nurse.objects.get(user_id=user.id)
-        medicine = Medicine.objects.filter(nurse=nurse)
-        serializer = NurseResultMedicineSerializer(medicine, many=True)
-        return Response({"medicines": serializer.data}, status=status.HTTP_200_OK)
+        nurse = request.actor.nurse
+        # the serializer shows the doctor, patient and name of every row
+        medicine = Medicine.objects.select_related('doctor', 'patient', 'name').filter(nurse=nurse)
+        paginator = KeysetCursorPagination(ordering='-created')
+        return conditional_list(request, medicine, lambda: paginator.get_list_response(
+            request, medicine, NurseResultMedicineSerializer, 'medicines', result_key=None), scopes=MEDICINE_SCOPES)
 
 
 # -------  Add Medicines for all Nurses
 class AddMedicineAllNurses(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'POST': 9}
     serializer_class = AddAllNursesMedicineSerializer
 
     def post(self, request):
         data = request.data
         doctor_added = request.user
-        patient = Patient.objects.get(id=data.get('patient'))
-        nurses = patient.nurse.all()
         serializer = self.serializer_class(data=data)
 
         if serializer.is_valid():
-            medicine = serializer.save(doctor=doctor_added, nurse=nurses)
+            # the nurses of the patient are copied in SQL (users/care_team.py)
+            with transaction.atomic():
+                medicine = serializer.save(doctor=doctor_added)
+                fan_out(medicine, 'nurse', 'nurse')
             response = {
                 "medicine": ResultMedicineSerializer(medicine, context=self.get_serializer_context()).data,
                 "message": "Medicine saved successfully",
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rays', '0002_alter_rays_options_rays_created_rays_updated'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='rays',
+            index=models.Index(fields=['patient', '-created'], name='rays_timeline_idx'),
+        ),
+    ]
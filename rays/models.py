@@ -16,6 +16,11 @@ class Rays(models.Model):
     class Meta:
         verbose_name = 'Rays'
         verbose_name_plural = 'Rays'
+        indexes = [
+            # timeline of the patient
+            models.Index(fields=['patient', '-created'],
+                         name='rays_timeline_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -1,9 +1,10 @@
 from rest_framework import serializers
+from users.fields import BulkSlugRelatedField
 from .models import Rays, Nurse
 
 
 class DoctorRaysSerializer(serializers.ModelSerializer):
-    nurse = serializers.SlugRelatedField(
+    nurse = BulkSlugRelatedField(
         slug_field="user_id", queryset=Nurse.objects.all(), many=True)
 
     class Meta:
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_save, m2m_changed
+from django.dispatch import receiver
+from users.events import publish_patient_event, publish_recipients_event
+from users.models import Nurse
+from .models import Rays
+
+
+# ========= Push the new rays to the care team (websocket)
+@receiver(post_save, sender=Rays)
+def rays_created(sender, instance, created, **kwargs):
+    if created:
+        publish_patient_event('rays.created', instance)
+
+
+@receiver(m2m_changed, sender=Rays.nurse.through)
+def rays_nurses_added(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and not reverse:
+        publish_recipients_event('rays.received', instance, Nurse, pk_set)
@@ -1,11 +1,12 @@
 from rest_framework import generics, views
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Rays, Doctor, Nurse, Patient
+from .models import Rays, Nurse, Patient
 from .serializer import (DoctorRaysSerializer, ResultDoctorRaysSerializer)
 from rest_framework.permissions import IsAuthenticated
 from notifications.signals import notify
 from api.models import User
+from users.pagination import KeysetCursorPagination
 # ====================== Doctor =======================================
 
 
@@ -15,7 +16,7 @@ class AddDoctorRays(generics.ListCreateAPIView):
 
     def post(self, serializer):
         data = self.request.data
-        doctor = Doctor.objects.get(user=self.request.user)
+        doctor = self.request.actor.doctor
         serializer = self.serializer_class(data=data)
         nurses = data.get('nurse')
         nurse_instance = User.objects.filter(id__in=nurses)
@@ -34,12 +35,10 @@ class AddDoctorRays(generics.ListCreateAPIView):
             return Response(serializer.errors)
 
     def get(self, request):
-        user = request.user
-        current_doctor = Doctor.objects.get(user=user)
+        current_doctor = request.actor.doctor
         report = current_doctor.doctor_rays.all()
-        serializer = ResultDoctorRaysSerializer(report, many=True)
-
-        return Response({"result": report.count(), 'rays': serializer.data})
+        paginator = KeysetCursorPagination(ordering='-created')
+        return paginator.get_list_response(request, report, ResultDoctorRaysSerializer, 'rays')
 
 
 # ====================== Nurse =======================================
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from users.aggregates import team_names
 from .models import DoctorReport, NurseReport
 
 
@@ -6,9 +7,14 @@ from .models import DoctorReport, NurseReport
 @admin.register(DoctorReport)
 class DoctorReport(admin.ModelAdmin):
     list_display = ['title', 'patient', 'get_nurses', 'added_by']
+    list_select_related = ['patient', 'added_by__user']
+
+    def get_queryset(self, request):
+        qs = super(DoctorReport, self).get_queryset(request)
+        return qs.annotate(nurse_names=team_names(qs.model, 'nurse'))
 
     def get_nurses(self, obj):
-        return "\n".join([nurse.user.username for nurse in obj.nurse.all()])
+        return obj.nurse_names
 
     def patient(self, obj):
         return obj.patient.name
@@ -23,9 +29,14 @@ class DoctorReport(admin.ModelAdmin):
 @admin.register(NurseReport)
 class NurseReport(admin.ModelAdmin):
     list_display = ['title', 'patient', 'get_doctors', 'added_by']
+    list_select_related = ['patient', 'added_by__user']
+
+    def get_queryset(self, request):
+        qs = super(NurseReport, self).get_queryset(request)
+        return qs.annotate(doctor_names=team_names(qs.model, 'doctor'))
 
     def get_doctors(self, obj):
-        return "\n".join([doctor.user.username for doctor in obj.doctor.all()])
+        return obj.doctor_names
 
     def patient(self, obj):
         return obj.patient.name
@@ -0,0 +1,63 @@
+from rest_framework import status
+from users.async_views import AsyncAPIView
+from users.conditional import aconditional_list, aconditional_object
+from users.pagination import KeysetCursorPagination
+from users.permissions import IsDoctor, IsNurse
+from rest_framework.permissions import IsAuthenticated
+from .models import DoctorReport, NurseReport
+from .serializer import ResultDoctorReportAddedNurseSerializer, ResultNurseReportAddedDoctorSerializer
+from .views import REPORT_SCOPES
+
+
+# Return Report For Doctor (That Nurse added for him) (async GetDoctorReport)
+class GetDoctorReportAsync(AsyncAPIView):
+    permission_classes = [IsAuthenticated, IsDoctor]
+
+    async def get(self, request, id=None):
+        reports = NurseReport.objects.select_related('added_by__user', 'patient')
+        if id:
+            async def build():
+                try:
+                    report = await reports.aget(id=id)
+                except NurseReport.DoesNotExist:
+                    return self.render({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+                serializer = ResultDoctorReportAddedNurseSerializer(report)
+                return self.render({"report": serializer.data})
+            return await aconditional_object(request, NurseReport.objects, id, build, 'added_nurse',
+                                             scopes=REPORT_SCOPES)
+
+        reports = reports.filter(doctor=request.actor.doctor)
+
+        async def build_list():
+            paginator = KeysetCursorPagination(ordering='-created')
+            data = await paginator.aget_list_data(
+                request, reports, ResultDoctorReportAddedNurseSerializer, 'reports')
+            return self.render(data, headers=paginator.get_headers())
+        return await aconditional_list(request, reports, build_list, scopes=REPORT_SCOPES)
+
+
+# Return Report For Nurse (That Doctor added for her) (async GetNurseReport)
+class GetNurseReportAsync(AsyncAPIView):
+    permission_classes = [IsAuthenticated, IsNurse]
+
+    async def get(self, request, id=None):
+        reports = DoctorReport.objects.select_related('added_by__user', 'patient')
+        if id:
+            async def build():
+                try:
+                    report = await reports.aget(id=id)
+                except DoctorReport.DoesNotExist:
+                    return self.render({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+                serializer = ResultNurseReportAddedDoctorSerializer(report)
+                return self.render({"report": serializer.data})
+            return await aconditional_object(request, DoctorReport.objects, id, build, 'added_doctor',
+                                             scopes=REPORT_SCOPES)
+
+        reports = reports.filter(nurse=request.actor.nurse)
+
+        async def build_list():
+            paginator = KeysetCursorPagination(ordering='-created')
+            data = await paginator.aget_list_data(
+                request, reports, ResultNurseReportAddedDoctorSerializer, 'reports')
+            return self.render(data, headers=paginator.get_headers())
+        return await aconditional_list(request, reports, build_list, scopes=REPORT_SCOPES)
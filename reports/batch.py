@@ -0,0 +1,96 @@
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from rest_framework import serializers
+from users.events import make_event, publish, publish_patient_event, user_group
+from users.models import Doctor, Patient
+from .models import NurseReport
+from .search import get_backend
+
+
+# ============================================================================
+# Batch of nurse reports (end of shift: one report per patient)
+# ============================================================================
+# The items are checked without queries, then the patients and the doctors of
+# the whole batch are read with one "in" query each. The valid reports are
+# written with one bulk_create and one insert in the through table. bulk_create
+# sends no post_save / m2m_changed: the search index and the websocket events
+# of reports/signals.py are done here. An invalid item does not stop the
+# others, every item has its own result.
+class BatchItemSerializer(serializers.Serializer):
+    title = serializers.CharField()
+    patient = serializers.UUIDField()
+    # user ids of the doctors
+    doctor = serializers.ListField(child=serializers.UUIDField(), required=False, default=list)
+
+
+def check_batch(data):
+    # the list of reports, or {"reports": [...]}
+    items = data.get('reports') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        raise serializers.ValidationError({"message": "reports must be a non-empty list"})
+    if len(items) > settings.REPORT_BATCH_LIMIT:
+        raise serializers.ValidationError(
+            {"message": f"at most {settings.REPORT_BATCH_LIMIT} reports in a batch"})
+    return items
+
+
+def resolve_batch(items):
+    # (index, data) of the valid items, {index: errors} of the others
+    valid, errors = [], {}
+    for index, item in enumerate(items):
+        serializer = BatchItemSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors[index] = serializer.errors
+
+    patients = Patient.objects.only('id', 'name').in_bulk({data['patient'] for index, data in valid})
+    doctors = dict(Doctor.objects.filter(
+        user_id__in={user_id for index, data in valid for user_id in data['doctor']},
+    ).values_list('user_id', 'id'))
+
+    items = []
+    for index, data in valid:
+        missing = sorted(str(user_id) for user_id in data['doctor'] if user_id not in doctors)
+        if data['patient'] not in patients:
+            errors[index] = {"patient": ["Patient not found"]}
+        elif missing:
+            errors[index] = {"doctor": [f"Doctor not found: {', '.join(missing)}"]}
+        else:
+            items.append((index, data, patients[data['patient']],
+                          {user_id: doctors[user_id] for user_id in data['doctor']}))
+    return items, errors
+
+
+def create_nurse_reports(nurse, items):
+    # items: (index, data, patient, {doctor user id: doctor id}) -> {index: report}
+    using = router.db_for_write(NurseReport)
+    reports = {index: NurseReport(title=data['title'], patient=patient, added_by=nurse)
+               for index, data, patient, doctors in items}
+    through = NurseReport.doctor.through
+    bulk = connections[using].features.can_return_rows_from_bulk_insert
+    with transaction.atomic(using=using):
+        if bulk:
+            NurseReport.objects.using(using).bulk_create(reports.values())
+            get_backend(using).index_many(list(reports.values()), using)
+        else:
+            # no ids back from bulk_create: saved one by one (post_save indexes and publishes)
+            for report in reports.values():
+                report.save(using=using)
+        through.objects.using(using).bulk_create(
+            [through(nursereport_id=reports[index].pk, doctor_id=doctor_id)
+             for index, data, patient, doctors in items for doctor_id in doctors.values()])
+
+    # reports/signals.py: nurse_report_created, nurse_report_doctors_added
+    for index, data, patient, doctors in items:
+        report = reports[index]
+        if bulk:
+            publish_patient_event('nurse_report.created', report)
+        if doctors:
+            publish([user_group(user_id) for user_id in doctors], make_event('nurse_report.received', report))
+    # the response lists the doctors: one query with their users
+    prefetch_related_objects(
+        list(reports.values()), Prefetch('doctor', queryset=Doctor.objects.select_related('user')))
+    return reports
+
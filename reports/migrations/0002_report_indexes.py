@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorreport',
+            index=models.Index(fields=['patient', 'added_by', '-created'], name='doctorreport_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorreport',
+            index=models.Index(fields=['added_by', '-created'], name='doctorreport_added_by_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nursereport',
+            index=models.Index(fields=['patient', 'added_by', '-created'], name='nursereport_patient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nursereport',
+            index=models.Index(fields=['added_by', '-created'], name='nursereport_added_by_idx'),
+        ),
+    ]
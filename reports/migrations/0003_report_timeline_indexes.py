@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0002_report_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctorreport',
+            index=models.Index(fields=['patient', '-created'], name='doctorreport_timeline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nursereport',
+            index=models.Index(fields=['patient', '-created'], name='nursereport_timeline_idx'),
+        ),
+    ]
@@ -19,6 +19,17 @@ class DoctorReport(models.Model):
         verbose_name = 'Doctor Report'
         verbose_name_plural = 'Doctor Report'
         ordering = ['-created']
+        indexes = [
+            # reports of the patient added by the doctor
+            models.Index(fields=['patient', 'added_by', '-created'],
+                         name='doctorreport_patient_idx'),
+            # reports added by the doctor
+            models.Index(fields=['added_by', '-created'],
+                         name='doctorreport_added_by_idx'),
+            # timeline of the patient
+            models.Index(fields=['patient', '-created'],
+                         name='doctorreport_timeline_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -41,6 +52,17 @@ class NurseReport(models.Model):
         verbose_name = 'Nurse Report'
         verbose_name_plural = 'Nurse Report'
         ordering = ['-created']
+        indexes = [
+            # reports of the patient added by the nurse
+            models.Index(fields=['patient', 'added_by', '-created'],
+                         name='nursereport_patient_idx'),
+            # reports added by the nurse
+            models.Index(fields=['added_by', '-created'],
+                         name='nursereport_added_by_idx'),
+            # timeline of the patient
+            models.Index(fields=['patient', '-created'],
+                         name='nursereport_timeline_idx'),
+        ]
 
     def __str__(self):
         return self.title
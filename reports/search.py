@@ -0,0 +1,195 @@
+import re
+from django.conf import settings
+from django.db import connections, router
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from .models import DoctorReport, NurseReport
+
+
+# ============================================================================
+# Full-text search over the titles of the reports
+# ============================================================================
+# One backend per database vendor (REPORT_SEARCH_BACKEND to choose another):
+#   PostgreSQL: GIN index on to_tsvector(title), kept by the database itself
+#   SQLite:     FTS5 table per model, written by the signals (reports/signals.py)
+#   others:     LIKE, no index
+# install() creates the index (post_migrate, reports/apps.py). search() reads
+# the ids of the REPORT_SEARCH_WINDOW newest matches of the queryset, then
+# ranks these rows only: "rank" (higher is better) and "headline" (matches
+# marked by the database, made HTML by headline_html(): title escaped, matches
+# in <b>). A common word matches a third of the reports, ranking all of them
+# is hundreds of ms on a million rows.
+SEARCH_MODELS = [DoctorReport, NurseReport]
+WORD_RE = re.compile(r'\w+')
+# the database marks the matches with these, <b> / </b> are added after the escaping
+START_SEL, STOP_SEL = '\x02', '\x03'
+
+
+class SearchBackend:
+    def install(self, model, using):
+        pass
+
+    def index(self, instance, using):
+        pass
+
+    def index_many(self, instances, using):
+        # new rows of bulk_create (no post_save)
+        for instance in instances:
+            self.index(instance, using)
+
+    def remove(self, instance, using):
+        pass
+
+    def rebuild(self, model, using):
+        pass
+
+    def window(self, queryset, query):
+        # ids of the newest matches
+        raise NotImplementedError
+
+    def ranked(self, queryset, query, ids):
+        raise NotImplementedError
+
+    def search(self, queryset, query):
+        ids = list(self.window(queryset, query)[:settings.REPORT_SEARCH_WINDOW])
+        return self.ranked(queryset.filter(pk__in=ids), query, ids).order_by('-rank', '-created')
+
+
+# ---- PostgreSQL
+class PostgresSearch(SearchBackend):
+    def vector(self, model):
+        return f"to_tsvector('{settings.REPORT_SEARCH_CONFIG}', {model._meta.db_table}.title)"
+
+    def tsquery(self):
+        return f"websearch_to_tsquery('{settings.REPORT_SEARCH_CONFIG}', %s)"
+
+    def install(self, model, using):
+        table = model._meta.db_table
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_title_fts ON {table} '
+                           f'USING gin ({self.vector(model)})')
+
+    def window(self, queryset, query):
+        return queryset.extra(
+            where=[f'{self.vector(queryset.model)} @@ {self.tsquery()}'], params=[query],
+        ).order_by('-pk').values_list('pk', flat=True)
+
+    def ranked(self, queryset, query, ids):
+        model = queryset.model
+        return queryset.extra(
+            select={
+                'rank': f'ts_rank({self.vector(model)}, {self.tsquery()})',
+                'headline': f"ts_headline('{settings.REPORT_SEARCH_CONFIG}', {model._meta.db_table}.title, "
+                            f"{self.tsquery()}, %s)",
+            },
+            select_params=[query, query, f'StartSel={START_SEL}, StopSel={STOP_SEL}, MaxFragments=2'],
+        )
+
+
+# ---- SQLite (FTS5)
+class SqliteSearch(SearchBackend):
+    def table(self, model):
+        return f'{model._meta.db_table}_fts'
+
+    def install(self, model, using):
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [self.table(model)])
+            if cursor.fetchone():
+                return
+            cursor.execute(f'CREATE VIRTUAL TABLE {self.table(model)} USING fts5(title)')
+        self.rebuild(model, using)
+
+    def index(self, instance, using):
+        table = self.table(type(instance))
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [instance.pk])
+            cursor.execute(f'INSERT INTO {table} (rowid, title) VALUES (%s, %s)', [instance.pk, instance.title])
+
+    def index_many(self, instances, using):
+        if not instances:
+            return
+        with connections[using].cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {self.table(type(instances[0]))} (rowid, title) VALUES (%s, %s)',
+                               [(instance.pk, instance.title) for instance in instances])
+
+    def remove(self, instance, using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table(type(instance))} WHERE rowid = %s', [instance.pk])
+
+    def rebuild(self, model, using):
+        table = self.table(model)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.execute(f'INSERT INTO {table} (rowid, title) SELECT id, title FROM {model._meta.db_table}')
+
+    def match(self, query):
+        # every word, as a prefix ("pneum" finds "pneumonia"), no FTS5 syntax from the client
+        return ' '.join(f'"{word}"*' for word in WORD_RE.findall(query))
+
+    def window(self, queryset, query):
+        # FTS5 reads the matches in rowid order: stops after the window
+        table = self.table(queryset.model)
+        return queryset.extra(
+            tables=[table],
+            where=[f'{table}.rowid = {queryset.model._meta.db_table}.id', f'{table} MATCH %s'],
+            params=[self.match(query)],
+            select={'match_id': f'{table}.rowid'},
+        ).order_by('-match_id').values_list('pk', flat=True)
+
+    def ranked(self, queryset, query, ids):
+        # bm25() only for the rows of the window (rowid range read by FTS5)
+        table = self.table(queryset.model)
+        return queryset.extra(
+            tables=[table],
+            where=[f'{table}.rowid = {queryset.model._meta.db_table}.id', f'{table} MATCH %s',
+                   f'{table}.rowid BETWEEN %s AND %s'],
+            params=[self.match(query), min(ids, default=0), max(ids, default=0)],
+            select={
+                # bm25: lower is better
+                'rank': f'-bm25({table})',
+                'headline': f"highlight({table}, 0, %s, %s)",
+            },
+            select_params=[START_SEL, STOP_SEL],
+        )
+
+
+# ---- Any other database
+class LikeSearch(SearchBackend):
+    def window(self, queryset, query):
+        for word in WORD_RE.findall(query):
+            queryset = queryset.filter(title__icontains=word)
+        return queryset.order_by('-pk').values_list('pk', flat=True)
+
+    def ranked(self, queryset, query, ids):
+        return queryset.extra(select={'rank': '0', 'headline': 'title'})
+
+
+BACKENDS = {
+    'postgresql': PostgresSearch,
+    'sqlite': SqliteSearch,
+}
+
+
+def get_backend(using='default'):
+    path = getattr(settings, 'REPORT_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return BACKENDS.get(connections[using].vendor, LikeSearch)()
+
+
+def install(using='default', **kwargs):
+    backend = get_backend(using)
+    tables = connections[using].introspection.table_names()
+    for model in SEARCH_MODELS:
+        if model._meta.db_table in tables:
+            backend.install(model, using)
+
+
+def headline_html(headline):
+    # the title escaped, the matches in <b>
+    return escape(headline or '').replace(START_SEL, '<b>').replace(STOP_SEL, '</b>')
+
+
+def search_reports(queryset, query):
+    using = router.db_for_read(queryset.model)
+    return get_backend(using).search(queryset, query)
@@ -1,9 +1,10 @@
 from rest_framework import serializers
+from users.fields import BulkSlugRelatedField
 from .models import Nurse, DoctorReport, NurseReport, Doctor
 
 
 class DoctorReportSerializer(serializers.ModelSerializer):
-    nurse = serializers.SlugRelatedField(
+    nurse = BulkSlugRelatedField(
         slug_field="user_id", queryset=Nurse.objects.all(), many=True)
 
     class Meta:
@@ -41,7 +42,7 @@ class ResultDoctorReportAddedNurseSerializer(serializers.ModelSerializer):
 
 # =================== Nurse ===========================================
 class NurseReportSerializer(serializers.ModelSerializer):
-    doctor = serializers.SlugRelatedField(
+    doctor = BulkSlugRelatedField(
         slug_field="user_id", queryset=Doctor.objects.all(), many=True)
 
     class Meta:
@@ -81,7 +82,7 @@ class ResultNurseReportAddedDoctorSerializer(serializers.ModelSerializer):
 
 # =================== Patient ===========================================
 class ReportDoctorPatientSerializer(serializers.ModelSerializer):
-    nurse = serializers.SlugRelatedField(
+    nurse = BulkSlugRelatedField(
         slug_field="user_id", queryset=Nurse.objects.all(), many=True)
 
     class Meta:
@@ -90,7 +91,7 @@ class ReportDoctorPatientSerializer(serializers.ModelSerializer):
 
 
 class ReportNursePatientSerializer(serializers.ModelSerializer):
-    doctor = serializers.SlugRelatedField(
+    doctor = BulkSlugRelatedField(
         slug_field="user_id", queryset=Doctor.objects.all(), many=True)
 
     class Meta:
@@ -0,0 +1,69 @@
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from users.events import publish_patient_event, publish_recipients_event
+from users.sync import record_deleted, record_recipients_removed, touch
+from users.models import Doctor, Nurse
+from .models import DoctorReport, NurseReport
+from .search import get_backend
+
+
+# ========= Push the new reports to the care team (websocket)
+@receiver(post_save, sender=DoctorReport)
+def doctor_report_created(sender, instance, created, **kwargs):
+    if created:
+        publish_patient_event('doctor_report.created', instance)
+
+
+@receiver(m2m_changed, sender=DoctorReport.nurse.through)
+def doctor_report_nurses_added(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and not reverse:
+        publish_recipients_event(
+            'doctor_report.received', instance, Nurse, pk_set)
+
+
+@receiver(post_save, sender=NurseReport)
+def nurse_report_created(sender, instance, created, **kwargs):
+    if created:
+        publish_patient_event('nurse_report.created', instance)
+
+
+@receiver(m2m_changed, sender=NurseReport.doctor.through)
+def nurse_report_doctors_added(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_add' and not reverse:
+        publish_recipients_event(
+            'nurse_report.received', instance, Doctor, pk_set)
+
+
+# ========= Delta sync (users/sync.py)
+@receiver(pre_delete, sender=DoctorReport)
+@receiver(pre_delete, sender=NurseReport)
+def report_deleted(sender, instance, **kwargs):
+    record_deleted(instance, instance.nurse if sender is DoctorReport else instance.doctor)
+
+
+@receiver(m2m_changed, sender=DoctorReport.nurse.through)
+@receiver(m2m_changed, sender=NurseReport.doctor.through)
+def report_recipients_changed(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if reverse:
+        return
+    # recipients are in the responses: a new "updated" (sync, ETag) on every change
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        touch(instance)
+    if action == 'post_remove':
+        record_recipients_removed(instance, model, pk_set)
+    elif action == 'pre_clear':
+        manager = instance.nurse if sender is DoctorReport.nurse.through else instance.doctor
+        record_recipients_removed(instance, model, manager.values_list('pk', flat=True))
+
+
+# ========= Full-text search of the titles (reports/search.py)
+@receiver(post_save, sender=DoctorReport)
+@receiver(post_save, sender=NurseReport)
+def report_saved(sender, instance, using, **kwargs):
+    get_backend(using).index(instance, using)
+
+
+@receiver(post_delete, sender=DoctorReport)
+@receiver(post_delete, sender=NurseReport)
+def report_removed(sender, instance, using, **kwargs):
+    get_backend(using).remove(instance, using)
@@ -1,3 +1,175 @@
+from unittest import mock
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from users.testing import analyze, assert_no_full_scans, seed_care_team
+from .models import DoctorReport, NurseReport
+from .search import search_reports
 
-# Create your tests here.
+
+# ========= Indexes used by the report queries
+class ReportsIndexUsageTest(TestCase):
+    def setUp(self):
+        admin, self.doctors, nurses, self.patients = seed_care_team()
+        DoctorReport.objects.bulk_create(
+            [DoctorReport(patient=patient, added_by=self.doctors[i % len(self.doctors)], title=f'report{i}')
+             for i, patient in enumerate(self.patients * 5)])
+        analyze()
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctors[0].user)
+
+    def test_doctor_patient_report(self):
+        # the doctor and nurse urls share the name "patient_report"
+        url = f'/api/reports/{self.patients[0].pk}/doctor_patient_report/'
+        with assert_no_full_scans(self):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['result'], 5)
+
+
+# ========= Full-text search of the titles
+class SearchReportsTest(TestCase):
+    def setUp(self):
+        admin, doctors, nurses, self.patients = seed_care_team()
+        # patients 0 and 19 are patients of doctor 0, patient 1 is not
+        self.report = DoctorReport.objects.create(
+            patient=self.patients[0], added_by=doctors[0], title='Suspected pneumonia, start antibiotics')
+        DoctorReport.objects.create(patient=self.patients[1], added_by=doctors[1], title='Pneumonia confirmed')
+        NurseReport.objects.create(patient=self.patients[19], added_by=nurses[0], title='Pneumothorax excluded')
+        self.client = APIClient()
+        self.client.force_authenticate(doctors[0].user)
+
+    def search(self, **params):
+        response = self.client.get(reverse('search_reports'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_search_patients_of_user(self):
+        data = self.search(q='pneum')
+        self.assertEqual([report['id'] for report in data['doctor_reports']], [self.report.id])
+        self.assertIn('<b>pneumonia</b>', data['doctor_reports'][0]['headline'])
+        self.assertEqual(len(data['nurse_reports']), 1)
+        self.assertEqual(self.search(q='pneum', patient=self.patients[0].id)['nurse_reports'], [])
+        self.assertEqual(self.search(q='pneumonia antibiotics')['doctor_reports'][0]['id'], self.report.id)
+        self.assertEqual(self.search(q='pneumonia*( "')['doctor_reports'][0]['id'], self.report.id)
+
+    def test_index_updated_on_save(self):
+        self.report.title = 'Sepsis, blood cultures taken'
+        self.report.save()
+        self.assertEqual(self.search(q='pneumonia')['doctor_reports'], [])
+        self.assertEqual(len(self.search(q='sepsis')['doctor_reports']), 1)
+        self.report.delete()
+        self.assertEqual(self.search(q='sepsis')['doctor_reports'], [])
+
+    def test_query_required(self):
+        response = self.client.get(reverse('search_reports'), {'q': ' ,'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_headline_escaped(self):
+        self.report.title = '<img src=x onerror=alert(1)> fever'
+        self.report.save()
+        headline = self.search(q='fever')['doctor_reports'][0]['headline']
+        self.assertEqual(headline, '&lt;img src=x onerror=alert(1)&gt; <b>fever</b>')
+
+    def test_invalid_patient(self):
+        response = self.client.get(reverse('search_reports'), {'q': 'pneum', 'patient': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+# ========= Reports sent to the whole care team of the patient
+class FanOutReportTest(TestCase):
+    def setUp(self):
+        admin, self.doctors, self.nurses, patients = seed_care_team()
+        self.patient = patients[0]
+        self.client = APIClient()
+
+    def post(self, user, url, title='night shift'):
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse(url), {'title': title, 'patient': str(self.patient.pk)})
+        self.assertEqual(response.status_code, 201)
+        return response, len(queries)
+
+    def test_doctor_report(self):
+        with mock.patch('reports.signals.publish_recipients_event') as publish:
+            response, small = self.post(self.doctors[0].user, 'doctor_reports')
+        report = DoctorReport.objects.get(pk=response.data['report']['id'])
+        self.assertEqual(set(report.nurse.all()), set(self.patient.nurse.all()))
+        self.assertEqual(sorted(nurse['name'] for nurse in response.data['report']['nurse']), ['nurse0', 'nurse1'])
+        self.assertEqual(publish.call_args.args[3], {nurse.pk for nurse in self.patient.nurse.all()})
+
+        # same number of queries whatever the size of the team
+        self.patient.nurse.add(*self.nurses)
+        response, large = self.post(self.doctors[0].user, 'doctor_reports')
+        self.assertEqual(len(response.data['report']['nurse']), 20)
+        self.assertEqual(large, small)
+
+    def test_nurse_report(self):
+        response, queries = self.post(self.nurses[0].user, 'all_doctors_reports')
+        report = NurseReport.objects.get(pk=response.data['report']['id'])
+        self.assertEqual(set(report.doctor.all()), set(self.patient.doctor.all()))
+        self.assertGreater(NurseReport.objects.get(pk=report.pk).updated, report.created)
+
+
+# ========= End of shift: the reports of many patients in one request
+class BatchNurseReportsTest(TestCase):
+    def setUp(self):
+        admin, self.doctors, self.nurses, self.patients = seed_care_team()
+        self.client = APIClient()
+        self.client.force_authenticate(self.nurses[0].user)
+
+    def items(self, count):
+        return [{'title': f'shift {i}', 'patient': str(patient.pk),
+                 'doctor': [str(doctor.user_id) for doctor in self.doctors[i % 10:i % 10 + 2]]}
+                for i, patient in enumerate(self.patients[:count])]
+
+    def post(self, reports):
+        return self.client.post(reverse('nurse_reports_batch'), {'reports': reports}, format='json')
+
+    def test_created(self):
+        with mock.patch('reports.batch.publish') as publish, \
+                mock.patch('reports.batch.publish_patient_event') as publish_patient_event:
+            response = self.post(self.items(3))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+        report = NurseReport.objects.get(pk=response.data['results'][1]['report']['id'])
+        self.assertEqual((report.title, report.patient, report.added_by), ('shift 1', self.patients[1], self.nurses[0]))
+        self.assertEqual(set(report.doctor.all()), set(self.doctors[1:3]))
+        self.assertEqual([doctor['name'] for doctor in response.data['results'][1]['report']['doctor']],
+                         ['doctor1', 'doctor2'])
+        # doctors of the report and watchers of the patient
+        self.assertEqual(publish.call_count, 3)
+        self.assertEqual(publish_patient_event.call_count, 3)
+        # indexed for the search
+        self.assertEqual({report.pk for report in search_reports(NurseReport.objects.all(), 'shift')},
+                         {item['report']['id'] for item in response.data['results']})
+
+    def test_queries_do_not_grow(self):
+        # the nurse of the user is read once
+        self.post(self.items(1))
+        with CaptureQueriesContext(connection) as small:
+            self.post(self.items(2))
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.post(self.items(30)).status_code, 201)
+        self.assertEqual(len(large), len(small))
+
+    def test_errors_per_item(self):
+        items = self.items(3)
+        items[0]['patient'] = '00000000-0000-0000-0000-000000000000'
+        items[1]['doctor'] = [str(self.nurses[1].user_id)]
+        del items[2]['title']
+        items.append(self.items(4)[3])
+        response = self.post(items)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([item['status'] for item in response.data['results']], [400, 400, 400, 201])
+        self.assertIn('patient', response.data['results'][0]['errors'])
+        self.assertIn('doctor', response.data['results'][1]['errors'])
+        self.assertIn('title', response.data['results'][2]['errors'])
+        self.assertEqual(NurseReport.objects.count(), 1)
+
+        self.assertEqual(self.post(items[:3]).status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+        with self.settings(REPORT_BATCH_LIMIT=2):
+            self.assertEqual(self.post(self.items(3)).status_code, 400)
@@ -1,7 +1,13 @@
+from django.conf import settings
 from django.urls import path
 from .views import (DoctorDetailsReport, NurseDetailsReport, AddDoctorReportForAllNurse,
                     AddDoctorReport, AddNurseReport, GetNurseReport, GetDoctorReport, AddNurseReportForAllDoctors,
-                    DoctorPatientReport, DoctorPatientReportDetail, NursePatientReport, NursePatientReportDetail)
+                    DoctorPatientReport, DoctorPatientReportDetail, NursePatientReport, NursePatientReportDetail,
+                    SearchReports, BatchNurseReports)
+from .async_views import GetDoctorReportAsync, GetNurseReportAsync
+
+GetDoctorReportView = GetDoctorReportAsync if settings.ASYNC_VIEWS else GetDoctorReport
+GetNurseReportView = GetNurseReportAsync if settings.ASYNC_VIEWS else GetNurseReport
 
 urlpatterns = [
 
@@ -15,15 +21,21 @@ urlpatterns = [
     # Add report by nurse
     path("nurse_report/", AddNurseReport.as_view(), name="nurse_reports"),
 
+    # Add the reports of many patients by nurse (end of shift)
+    path("nurse_report/batch", BatchNurseReports.as_view(), name="nurse_reports_batch"),
+
     # Get report by nurse
     path("nurse_report/<int:id>", NurseDetailsReport.as_view(), name="nurse_reports"),
 
     # Get report that nurses added for doctor
-    path("doctor_reports/", GetDoctorReport.as_view(), name="doctor_reports"),
+    path("doctor_reports/", GetDoctorReportView.as_view(), name="doctor_reports"),
 
     # Get report that doctors added for nurse
-    path("nurse_reports/", GetNurseReport.as_view(), name="nurse_reports"),
+    path("nurse_reports/", GetNurseReportView.as_view(), name="nurse_reports"),
+
 
+    # Full-text search of the titles
+    path("search", SearchReports.as_view(), name="search_reports"),
 
     # Will Be Removed
     path("<str:pk>/doctor_patient_report/",
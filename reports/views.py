@@ -1,3 +1,6 @@
+import uuid
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from rest_framework import generics, views
 from rest_framework.response import Response
 from rest_framework import status
@@ -8,8 +11,17 @@ from .serializer import (
     DoctorReportSerializer, ReportDoctorPatientSerializer,
     ResultDoctorReportSerializer, NurseReportSerializer, ResultNurseReportSerializer)
 from rest_framework.permissions import IsAuthenticated
-from users.models import Nurse, Patient, Doctor
+from users.models import Patient
+from users.care_team import fan_out
 from users.permissions import IsDoctor, IsNurse
+from users.conditional import conditional_list, conditional_object
+from users.pagination import KeysetCursorPagination
+from django.conf import settings
+from .search import WORD_RE, headline_html, search_reports
+from .batch import check_batch, create_nurse_reports, resolve_batch
+
+# in the ETags: the reports show the names of the patients, doctors and nurses
+REPORT_SCOPES = ['patients', 'users']
 
 
 # ======================= Doctor =======================================
@@ -19,11 +31,13 @@ class AddDoctorReport(generics.ListCreateAPIView):
 
     def post(self, serializer):
         data = self.request.data
-        doctor = Doctor.objects.get(user=self.request.user)
+        doctor = self.request.actor.doctor
         serializer = self.serializer_class(data=data)
 
         if serializer.is_valid(raise_exception=True):
             result = serializer.save(added_by=doctor)
+            # the response lists the nurses: one query with their users
+            prefetch_related_objects([result], 'nurse__user')
             response = {
                 "report": ResultDoctorReportSerializer(result, context=self.get_serializer_context()).data,
                 "message": "Report Created successfully",
@@ -34,12 +48,11 @@ class AddDoctorReport(generics.ListCreateAPIView):
             return Response(serializer.errors)
 
     def get(self, request):
-        user = request.user
-        current_doctor = Doctor.objects.get(user=user)
-        report = current_doctor.doctor_reports.all()
-        serializer = ResultDoctorReportSerializer(report, many=True)
-
-        return Response({"result": report.count(), 'reports': serializer.data})
+        current_doctor = request.actor.doctor
+        report = current_doctor.doctor_reports.select_related('patient').prefetch_related('nurse__user')
+        paginator = KeysetCursorPagination(ordering='-created')
+        return conditional_list(request, report, lambda: paginator.get_list_response(
+            request, report, ResultDoctorReportSerializer, 'reports'), scopes=REPORT_SCOPES)
 
 
 class DoctorDetailsReport(generics.RetrieveUpdateDestroyAPIView):
@@ -47,18 +60,22 @@ class DoctorDetailsReport(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = DoctorReportSerializer
 
     def get(self, request, id=None):
-        report = DoctorReport.objects.get(id=id)
-        serializer = ResultDoctorReportSerializer(report)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        def build():
+            report = DoctorReport.objects.get(id=id)
+            serializer = ResultDoctorReportSerializer(report)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        return conditional_object(request, DoctorReport.objects, id, build, scopes=REPORT_SCOPES)
 
     def put(self, request, id=None):
         report = DoctorReport.objects.get(id=id)
-        doctor = Doctor.objects.get(user=self.request.user)
+        doctor = self.request.actor.doctor
         data = request.data
         serializer = self.serializer_class(instance=report, data=data)
 
         if serializer.is_valid(raise_exception=True):
             result = serializer.save(added_by=doctor)
+            # the response lists the nurses: one query with their users
+            prefetch_related_objects([result], 'nurse__user')
             response = {
                 "message": "Report Updated successfully",
                 "data": ResultDoctorReportSerializer(result).data,
@@ -76,21 +93,22 @@ class DoctorDetailsReport(generics.RetrieveUpdateDestroyAPIView):
 # Return Report For Doctor (That Nurse added for him)
 class GetDoctorReport(views.APIView):
     permission_classes = [IsAuthenticated, IsDoctor]
+    query_budget = 4
 
     def get(self, request, id=None):
-        user = request.user
         if id:
-            report = NurseReport.objects.get(id=id)
-            serializer = ResultDoctorReportAddedNurseSerializer(report)
-            return Response({"report": serializer.data}, status=status.HTTP_200_OK)
+            def build():
+                report = NurseReport.objects.get(id=id)
+                serializer = ResultDoctorReportAddedNurseSerializer(report)
+                return Response({"report": serializer.data}, status=status.HTTP_200_OK)
+            return conditional_object(request, NurseReport.objects, id, build, 'added_nurse', scopes=REPORT_SCOPES)
 
         else:
-            current_doctor = Doctor.objects.get(user_id=user)
-            report = current_doctor.doctors_reports.all()
-
-            serializer = ResultDoctorReportAddedNurseSerializer(
-                report, many=True)
-            return Response({'result': len(serializer.data), "reports": serializer.data}, status=status.HTTP_200_OK)
+            current_doctor = request.actor.doctor
+            report = current_doctor.doctors_reports.select_related('added_by__user', 'patient')
+            paginator = KeysetCursorPagination(ordering='-created')
+            return conditional_list(request, report, lambda: paginator.get_list_response(
+                request, report, ResultDoctorReportAddedNurseSerializer, 'reports'), scopes=REPORT_SCOPES)
 
 
 # ======================= Nurse =======================================
@@ -100,11 +118,13 @@ class AddNurseReport(generics.ListCreateAPIView):
 
     def post(self, serializer):
         data = self.request.data
-        nurse = Nurse.objects.get(user=self.request.user)
+        nurse = self.request.actor.nurse
         serializer = self.serializer_class(data=data)
 
         if serializer.is_valid(raise_exception=True):
             result = serializer.save(added_by=nurse)
+            # the response lists the doctors: one query with their users
+            prefetch_related_objects([result], 'doctor__user')
             response = {
                 "report": ResultNurseReportSerializer(result, context=self.get_serializer_context()).data,
                 "message": "Report Created successfully",
@@ -115,31 +135,61 @@ class AddNurseReport(generics.ListCreateAPIView):
             return Response(serializer.errors)
 
     def get(self, request):
-        user = request.user
-        current_nurse = Nurse.objects.get(user=user)
-        report = current_nurse.nurses_reports.all()
+        current_nurse = request.actor.nurse
+        report = current_nurse.nurses_reports.select_related('patient').prefetch_related('doctor__user')
         serializer = ResultNurseReportSerializer(report, many=True)
 
         return Response({"result": report.count(), 'reports': serializer.data})
 
 
+class BatchNurseReports(views.APIView):
+    # end of shift: [{"title", "patient", "doctor": [user ids]}, ...] in one request (reports/batch.py)
+    permission_classes = [IsAuthenticated, IsNurse]
+    query_budget = 9
+
+    def post(self, request):
+        items = check_batch(request.data)
+        valid, errors = resolve_batch(items)
+        reports = create_nurse_reports(request.actor.nurse, valid) if valid else {}
+
+        results = []
+        for index in range(len(items)):
+            if index in reports:
+                report = ResultNurseReportSerializer(reports[index], context={'request': request}).data
+                results.append({"index": index, "status": status.HTTP_201_CREATED, "report": report})
+            else:
+                results.append({"index": index, "status": status.HTTP_400_BAD_REQUEST, "errors": errors[index]})
+
+        if not errors:
+            code = status.HTTP_201_CREATED
+        elif not reports:
+            code = status.HTTP_400_BAD_REQUEST
+        else:
+            code = status.HTTP_207_MULTI_STATUS
+        return Response({"created": len(reports), "failed": len(errors), "results": results}, status=code)
+
+
 class NurseDetailsReport(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [IsAuthenticated, IsNurse]
     serializer_class = NurseReportSerializer
 
     def get(self, request, id=None):
-        report = NurseReport.objects.get(id=id)
-        serializer = ResultNurseReportSerializer(report)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        def build():
+            report = NurseReport.objects.get(id=id)
+            serializer = ResultNurseReportSerializer(report)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        return conditional_object(request, NurseReport.objects, id, build, scopes=REPORT_SCOPES)
 
     def put(self, request, id=None):
         report = NurseReport.objects.get(id=id)
-        nurse = Nurse.objects.get(user=self.request.user)
+        nurse = self.request.actor.nurse
         data = request.data
         serializer = self.serializer_class(instance=report, data=data)
 
         if serializer.is_valid(raise_exception=True):
             result = serializer.save(added_by=nurse)
+            # the response lists the doctors: one query with their users
+            prefetch_related_objects([result], 'doctor__user')
             response = {
                 "message": "Report Updated successfully",
                 "data": ResultNurseReportSerializer(result).data,
@@ -157,36 +207,40 @@ class NurseDetailsReport(generics.RetrieveUpdateDestroyAPIView):
 # Return Report For Nurse (That Doctor added for her)
 class GetNurseReport(views.APIView):
     permission_classes = [IsAuthenticated, IsNurse]
+    query_budget = 4
 
     def get(self, request, id=None):
-        user = request.user
         if id:
-            report = DoctorReport.objects.get(id=id)
-            serializer = ResultNurseReportAddedDoctorSerializer(report)
-            return Response({"report": serializer.data}, status=status.HTTP_200_OK)
+            def build():
+                report = DoctorReport.objects.get(id=id)
+                serializer = ResultNurseReportAddedDoctorSerializer(report)
+                return Response({"report": serializer.data}, status=status.HTTP_200_OK)
+            return conditional_object(request, DoctorReport.objects, id, build, 'added_doctor', scopes=REPORT_SCOPES)
 
         else:
-            current_nurse = Nurse.objects.get(user_id=user)
-            report = current_nurse.nurse_reports.all()
-
-            serializer = ResultNurseReportAddedDoctorSerializer(
-                report, many=True)
-            return Response({'result': len(serializer.data), "reports": serializer.data}, status=status.HTTP_200_OK)
+            current_nurse = request.actor.nurse
+            report = current_nurse.nurse_reports.select_related('added_by__user', 'patient')
+            paginator = KeysetCursorPagination(ordering='-created')
+            return conditional_list(request, report, lambda: paginator.get_list_response(
+                request, report, ResultNurseReportAddedDoctorSerializer, 'reports'), scopes=REPORT_SCOPES)
 
 
 # ======================= Return & Add Report For patient =======================================
 class DoctorPatientReport(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'GET': 4}
     serializer_class = ReportDoctorPatientSerializer
 
     def post(self, serializer, pk=None):
         data = self.request.data
-        doctor = Doctor.objects.get(user=self.request.user)
+        doctor = self.request.actor.doctor
         serializer = self.serializer_class(data=data)
 
         if data['patient'] == pk:
             if serializer.is_valid(raise_exception=True):
                 result = serializer.save(added_by=doctor)
+                # the response lists the nurses: one query with their users
+                prefetch_related_objects([result], 'nurse__user')
                 response = {
                     "report": ResultDoctorReportSerializer(result, context=self.get_serializer_context()).data,
                     "message": "Report Created successfully",
@@ -199,9 +253,10 @@ class DoctorPatientReport(generics.ListCreateAPIView):
             return Response({'ID of patient not equal in the body'}, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request, pk=None):
-        doctor = Doctor.objects.get(user=self.request.user)
+        doctor = self.request.actor.doctor
         patient = Patient.objects.get(pk=pk)
-        reports = patient.patient_reports.filter(added_by=doctor)
+        reports = patient.patient_reports.filter(added_by=doctor).select_related('patient').prefetch_related(
+            'nurse__user')
         serializer = ResultDoctorReportSerializer(reports, many=True)
         return Response({'result': len(serializer.data), "reports": serializer.data}, status=status.HTTP_200_OK)
 
@@ -243,16 +298,19 @@ class DoctorPatientReportDetail(generics.RetrieveUpdateDestroyAPIView):
 
 class NursePatientReport(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'GET': 4}
     serializer_class = ReportNursePatientSerializer
 
     def post(self, serializer, pk=None):
         data = self.request.data
-        nurse = Nurse.objects.get(user=self.request.user)
+        nurse = self.request.actor.nurse
         serializer = self.serializer_class(data=data)
 
         if data['patient'] == pk:
             if serializer.is_valid(raise_exception=True):
                 result = serializer.save(added_by=nurse)
+                # the response lists the doctors: one query with their users
+                prefetch_related_objects([result], 'doctor__user')
                 response = {
                     "report": ResultNurseReportSerializer(result, context=self.get_serializer_context()).data,
                     "message": "Report Created successfully",
@@ -266,9 +324,10 @@ class NursePatientReport(generics.ListCreateAPIView):
             return Response({'ID of patient not equal in the body'}, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request, pk=None):
-        nurse = Nurse.objects.get(user=self.request.user)
+        nurse = self.request.actor.nurse
         patient = Patient.objects.get(pk=pk)
-        reports = patient.patients_reports.filter(added_by=nurse)
+        reports = patient.patients_reports.filter(added_by=nurse).select_related('patient').prefetch_related(
+            'doctor__user')
         serializer = ResultNurseReportSerializer(reports, many=True)
         return Response({'result': len(serializer.data), "reports": serializer.data}, status=status.HTTP_200_OK)
 
@@ -312,18 +371,19 @@ class NursePatientReportDetail(generics.RetrieveUpdateDestroyAPIView):
 # ========== AddDoctorReportForAllNurse ===========
 class AddDoctorReportForAllNurse(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'POST': 11}
     serializer_class = DoctorReportAllNursesSerializer
 
     def post(self, serializer, pk=None):
         data = self.request.data
-        doctor = Doctor.objects.get(user=self.request.user)
-        patient = Patient.objects.get(id=data.get('patient'))
-        nurses = patient.nurse.all()
-
+        doctor = self.request.actor.doctor
         serializer = self.serializer_class(data=data)
 
         if serializer.is_valid(raise_exception=True):
-            result = serializer.save(added_by=doctor, nurse=nurses)
+            # the nurses of the patient are copied in SQL (users/care_team.py)
+            with transaction.atomic():
+                result = serializer.save(added_by=doctor)
+                fan_out(result, 'nurse', 'nurse')
             response = {
                 "report": ResultDoctorReportSerializer(result, context=self.get_serializer_context()).data,
                 "message": "Report Created successfully",
@@ -337,21 +397,58 @@ class AddDoctorReportForAllNurse(generics.ListCreateAPIView):
 # ========== AddNurseReportForAllDoctors ===========
 class AddNurseReportForAllDoctors(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
+    query_budget = {'POST': 11}
     serializer_class = NurseReportAllDoctorsSerializer
 
     def post(self, serializer, pk=None):
         data = self.request.data
-        nurse = Nurse.objects.get(user=self.request.user)
-        patient = Patient.objects.get(id=data['patient'])
-        doctors = patient.doctor.all()
-
+        nurse = self.request.actor.nurse
         serializer = self.serializer_class(data=data)
 
         if serializer.is_valid(raise_exception=True):
-            result = serializer.save(added_by=nurse, doctor=doctors)
+            # the doctors of the patient are copied in SQL (users/care_team.py)
+            with transaction.atomic():
+                result = serializer.save(added_by=nurse)
+                fan_out(result, 'doctor', 'doctor')
             response = {
                 "report": ResultNurseReportSerializer(result, context=self.get_serializer_context()).data,
                 "message": "Report Created successfully",
             }
 
         return Response(data=response, status=status.HTTP_201_CREATED)
+
+
+# ======================= Search =======================================
+class SearchReports(views.APIView):
+    # ?q=words&patient=<id>&limit=20: reports of the patients of the user, best match first
+    permission_classes = [IsAuthenticated]
+    query_budget = 4
+
+    def get(self, request):
+        query = request.query_params.get('q', '')
+        if not WORD_RE.search(query):
+            return Response({"message": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', settings.REPORT_SEARCH_LIMIT)), 1), 100)
+        except ValueError:
+            return Response({"message": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+
+        patients = Patient.objects.visible_to(request.user).values('pk')
+        if request.query_params.get('patient'):
+            try:
+                patients = patients.filter(pk=uuid.UUID(request.query_params['patient']))
+            except ValueError:
+                return Response({"message": "patient must be a UUID"}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = {}
+        for name, model in [('doctor_reports', DoctorReport), ('nurse_reports', NurseReport)]:
+            reports = search_reports(model.objects.filter(patient__in=patients), query)[:limit]
+            response[name] = [{
+                "id": report.id,
+                "title": report.title,
+                "headline": headline_html(report.headline),
+                "rank": report.rank,
+                "patient": report.patient_id,
+                "created": report.created,
+            } for report in reports]
+        return Response(response, status=status.HTTP_200_OK)
@@ -0,0 +1,64 @@
+from django.db import router
+from .models import Admin, Doctor, Nurse, User
+
+
+# Reverse one-to-one of the user -> role profile model
+PROFILE_RELATIONS = (
+    ('users_doctor', Doctor),
+    ('users_nurse', Nurse),
+    ('users_admin', Admin),
+)
+
+
+def get_profile_ids(user):
+    # {relation: profile id or None}, the profiles must be loaded (select_related)
+    ids = {}
+    for relation, model in PROFILE_RELATIONS:
+        profile = User._meta.get_field(relation).get_cached_value(user, None)
+        ids[relation] = profile.id if profile is not None else None
+    return ids
+
+
+def attach_profiles(user, profile_ids):
+    # Fill the reverse one-to-one caches of the user without a query
+    db = user._state.db or router.db_for_read(User)
+    for relation, model in PROFILE_RELATIONS:
+        profile = None
+        profile_id = profile_ids.get(relation)
+        if profile_id is not None:
+            profile = model.from_db(db, ['id', 'user_id'], [profile_id, user.pk])
+            model._meta.get_field('user').set_cached_value(profile, user)
+        User._meta.get_field(relation).set_cached_value(user, profile)
+
+
+# ============================================================================
+# Actor (the logged in user with his Doctor / Nurse / Admin row)
+# ============================================================================
+class Actor:
+    def __init__(self, user):
+        self.user = user
+
+    # raise Doctor.DoesNotExist, ... like Doctor.objects.get(user=user)
+    @property
+    def doctor(self):
+        return self.user.users_doctor
+
+    @property
+    def nurse(self):
+        return self.user.users_nurse
+
+    @property
+    def admin(self):
+        return self.user.users_admin
+
+
+def resolve_actor(user):
+    if user is None or not user.is_authenticated:
+        return Actor(user)
+
+    relations = [relation for relation, model in PROFILE_RELATIONS]
+    if not all(User._meta.get_field(relation).is_cached(user) for relation in relations):
+        # one query for all the profiles of the user
+        loaded = User.objects.select_related(*relations).get(pk=user.pk)
+        attach_profiles(user, get_profile_ids(loaded))
+    return Actor(user)
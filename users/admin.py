@@ -1,4 +1,5 @@
 from django.contrib import admin
+from .aggregates import team_names
 from .models import (User, Admin, Doctor, Nurse, Patient)
 
 # =========== User ==============
@@ -27,6 +28,7 @@ class UserAdmin(admin.ModelAdmin):
 class AdminModel(admin.ModelAdmin):
     list_display = ['username', 'name', 'email']
     list_per_page = 10
+    list_select_related = ['user']
 
     def username(self, obj):
         return (obj.user.username)
@@ -48,6 +50,7 @@ class AdminModel(admin.ModelAdmin):
 class DoctorAdmin(admin.ModelAdmin):
     list_display = ['username', 'name', 'email']
     list_per_page = 10
+    list_select_related = ['user']
 
     def username(self, obj):
         return (obj.user.username)
@@ -69,6 +72,7 @@ class DoctorAdmin(admin.ModelAdmin):
 class NurseAdmin(admin.ModelAdmin):
     list_display = ['username', 'name', 'email']
     list_per_page = 10
+    list_select_related = ['user']
 
     def username(self, obj):
         return (obj.user.username)
@@ -93,13 +97,16 @@ class PatientAdmin(admin.ModelAdmin):
     search_fields = ['name', 'room_number', 'age', 'gender']
     list_per_page = 12
 
+    def get_queryset(self, request):
+        qs = super(PatientAdmin, self).get_queryset(request)
+        return qs.annotate(doctor_names=team_names(Patient, 'doctor'),
+                           nurse_names=team_names(Patient, 'nurse'))
+
     def doctors(self, obj):
-        for doctor in obj.doctor.all():
-            return (doctor)
+        return obj.doctor_names
 
     def nurses(self, obj):
-        for nurse in obj.nurse.all():
-            return (nurse)
+        return obj.nurse_names
 
     def get_model_perms(self, request):
         if not request.user.is_admin:
@@ -0,0 +1,31 @@
+from django.db.models import Aggregate, CharField, OuterRef, Subquery
+
+
+# ============================================================================
+# Names of the care team computed in SQL (admin changelists)
+# ============================================================================
+# One correlated subquery per column: the page stays one query whatever the
+# number of rows, and two teams on the same row (doctors and nurses of a
+# patient) do not multiply each other as two joins would.
+class GroupConcat(Aggregate):
+    # STRING_AGG on PostgreSQL, GROUP_CONCAT on SQLite / MySQL
+    function = 'STRING_AGG'
+    template = "%(function)s(%(expressions)s, ', ')"
+    output_field = CharField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='GROUP_CONCAT', **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='GROUP_CONCAT',
+                              template="%(function)s(%(expressions)s SEPARATOR ', ')", **extra_context)
+
+
+def team_names(model, field):
+    # usernames of the doctors / nurses of the row (ManyToManyField name)
+    m2m = model._meta.get_field(field)
+    through = m2m.remote_field.through
+    source, target = m2m.m2m_field_name(), m2m.m2m_reverse_name()
+    names = (through.objects.filter(**{source: OuterRef('pk')}).order_by().values(source)
+             .annotate(names=GroupConcat(f'{target}__user__username')).values('names'))
+    return Subquery(names, output_field=CharField())
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import signals  # noqa: F401
+        from .metrics import time_serializers
+        from .search import install
+        # trigram index of the search column (users/search.py)
+        post_migrate.connect(install, sender=self)
+        # time of the serializers in the metrics (users/metrics.py)
+        time_serializers()
@@ -0,0 +1,92 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from .actor import resolve_actor
+from .authentication import CachedTokenAuthentication
+from .conditional import aconditional_list, aconditional_object
+from .models import Patient
+from .serializer import PatientDoctorsSerializer, PatientNurseSerializer
+from .views import PATIENT_SCOPES
+
+
+# ============================================================================
+# Async read views (used when the project runs under ASGI, see settings.ASYNC_VIEWS)
+# Same responses as the DRF views, the querysets are loaded with the async ORM
+# and must select / prefetch everything the serializer reads.
+# ============================================================================
+class AsyncAPIView(View):
+    permission_classes = [IsAuthenticated]
+    http_method_names = ['get', 'head', 'options']
+
+    async def dispatch(self, request, *args, **kwargs):
+        # authentication + permissions like the DRF APIView
+        drf_request = Request(request)
+        try:
+            drf_request.user = await sync_to_async(self.authenticate)(request)
+            for permission in self.permission_classes:
+                if not permission().has_permission(drf_request, self):
+                    if not drf_request.user.is_authenticated:
+                        return self.render({'detail': 'Authentication credentials were not provided.'},
+                                           status.HTTP_401_UNAUTHORIZED, {'WWW-Authenticate': 'Token'})
+                    return self.render({'detail': 'You do not have permission to perform this action.'},
+                                       status.HTTP_403_FORBIDDEN)
+            drf_request.actor = await sync_to_async(resolve_actor)(drf_request.user)
+            return await super().dispatch(drf_request, *args, **kwargs)
+        except APIException as error:
+            return self.render({'detail': error.detail}, error.status_code)
+
+    @staticmethod
+    def authenticate(request):
+        result = CachedTokenAuthentication().authenticate(request)
+        if result is not None:
+            return result[0]
+        return get_user(request)
+
+    @staticmethod
+    def render(data, status_code=status.HTTP_200_OK, headers=None):
+        response = HttpResponse(JSONRenderer().render(data),
+                                content_type='application/json', status=status_code)
+        for name, value in (headers or {}).items():
+            response[name] = value
+        return response
+
+
+# ----- Return Patient for doctor and nurse (async PatientUser)
+class PatientUserAsync(AsyncAPIView):
+
+    async def get(self, request, pk=None):
+        user = request.user
+        if user.role == 'doctor':
+            serializer_class = PatientDoctorsSerializer
+            patients = Patient.objects.with_care_team(doctors=False)
+        elif user.role == 'nurse':
+            serializer_class = PatientNurseSerializer
+            patients = Patient.objects.with_care_team(nurses=False)
+        else:
+            return self.render({'message': 'Not Have Access'}, status.HTTP_403_FORBIDDEN)
+
+        if pk:
+            async def build():
+                patient = [row async for row in patients.filter(id=pk)]
+                if not patient:
+                    return self.render({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+                return self.render(serializer_class(patient[0]).data)
+            return await aconditional_object(request, Patient.objects, pk, build, user.role,
+                                             fallback='date_joined', scopes=PATIENT_SCOPES)
+
+        if user.role == 'doctor':
+            patients = patients.filter(doctor=request.actor.doctor)
+        else:
+            patients = patients.filter(nurse=request.actor.nurse)
+
+        async def build_list():
+            rows = [row async for row in patients]
+            serializer = serializer_class(rows, many=True)
+            return self.render({"result": len(rows), "patients_data": serializer.data})
+        return await aconditional_list(request, patients, build_list, scopes=PATIENT_SCOPES)
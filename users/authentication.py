@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from .actor import PROFILE_RELATIONS, attach_profiles, get_profile_ids
+from .models import User
+
+
+# Fields of the user kept in the cache, the other fields are deferred
+# and loaded from the database only if a view reads them.
+SNAPSHOT_FIELDS = ('id', 'email', 'username', 'name', 'role', 'is_active', 'is_staff',
+                   'is_superuser', 'is_doctor', 'is_nurse', 'is_admin')
+
+
+def get_auth_cache():
+    # None: no cache, a local memory cache is not invalidated in the other workers
+    alias = getattr(settings, 'AUTH_TOKEN_CACHE', None)
+    return caches[alias] if alias else None
+
+
+def token_cache_key(key):
+    return f'auth:token:{key}'
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def invalidate_token(key):
+    cache = get_auth_cache()
+    if cache is not None:
+        cache.delete(token_cache_key(key))
+
+
+def invalidate_user(user_id):
+    cache = get_auth_cache()
+    if cache is None:
+        return
+    key = cache.get(user_cache_key(user_id))
+    if key is not None:
+        cache.delete_many([token_cache_key(key), user_cache_key(user_id)])
+
+
+# ============================================================================
+# Token Authentication with cache
+# ============================================================================
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        cache = get_auth_cache()
+        cached = cache.get(token_cache_key(key)) if cache is not None else None
+
+        if cached is None:
+            # token, user and the Doctor / Nurse / Admin row in one query
+            relations = [f'user__{relation}' for relation, model in PROFILE_RELATIONS]
+            try:
+                token = Token.objects.select_related('user', *relations).get(key=key)
+            except Token.DoesNotExist:
+                raise AuthenticationFailed(_('Invalid token.'))
+
+            snapshot = {field: getattr(token.user, field)
+                        for field in SNAPSHOT_FIELDS}
+            cached = (snapshot, get_profile_ids(token.user))
+            if cache is not None:
+                timeout = getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 300)
+                cache.set_many({token_cache_key(key): cached,
+                                user_cache_key(snapshot['id']): key}, timeout)
+
+        snapshot, profile_ids = cached
+        if not snapshot['is_active']:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+
+        db = router.db_for_read(User)
+        user = User.from_db(db, list(snapshot), list(snapshot.values()))
+        attach_profiles(user, profile_ids)
+        token = Token.from_db(db, ['key', 'user_id'], [key, user.id])
+        return (user, token)
@@ -0,0 +1,313 @@
+import json
+import statistics
+import time
+from contextlib import ExitStack
+from importlib import import_module
+from urllib.parse import urlencode
+from django.db import connections, transaction
+from django.test import Client
+from rest_framework.authtoken.models import Token
+from medicine.models import Medicine, Medicines
+from reports.models import DoctorReport, NurseReport
+from .metrics import QueryCounter
+from .models import Patient, User
+
+
+# ============================================================================
+# Latency and queries of every endpoint (benchmark command)
+# ============================================================================
+# The requests go through the whole Django stack in the process (test client,
+# middlewares, authentication by token, response cache) against the current
+# database, usually filled by generate_data. Every route of users, reports and
+# medicine urls is listed: a method without a scenario below is in "skipped"
+# with the reason. The writes run in a transaction rolled back after every
+# request, the data stays the same from one run to the next. The result is
+# JSON, compare() gives the regressions against a previous result.
+URLCONFS = [('/api/', 'users.urls'), ('/api/reports/', 'reports.urls'), ('/api/medicine/', 'medicine.urls')]
+METHODS = ['get', 'post', 'put', 'patch', 'delete']
+
+# route -> reason, for every method
+SKIPPED = {
+    'api/logout': 'deletes the token of the benchmark user',
+    'api/send_code': 'sends an email',
+    'api/verify_otp': 'needs the code of the email',
+    'api/password_confirm': 'needs the code of the email',
+    'api/import-patients': 'file upload (patient_import tests)',
+}
+
+
+class Scenario:
+    def __init__(self, method, route, role, kwargs=None, query=None, data=None):
+        self.method = method
+        self.route = route
+        self.role = role
+        self.kwargs = kwargs or {}
+        self.query = query or {}
+        self.data = data
+
+    @property
+    def name(self):
+        # the same from one dataset to another (no ids)
+        query = '?' + urlencode(self.query) if self.query else ''
+        return f'{self.method} /{self.route}{query}'
+
+    @property
+    def path(self):
+        path = '/' + self.route
+        for key, value in self.kwargs.items():
+            for converter in ('str', 'int'):
+                path = path.replace(f'<{converter}:{key}>', str(value))
+        if self.query:
+            path += '?' + urlencode(self.query)
+        return path
+
+
+def routes():
+    # {route: view class} of the three urlconfs, in their order
+    found = {}
+    for prefix, module in URLCONFS:
+        for pattern in import_module(module).urlpatterns:
+            callback = pattern.callback
+            found.setdefault(prefix[1:] + str(pattern.pattern),
+                             getattr(callback, 'cls', None) or getattr(callback, 'view_class', None))
+    return found
+
+
+def view_methods(view_class):
+    # handlers of the view, and the ones of the DRF generic views with a queryset (MedicinesView)
+    methods = []
+    for method in METHODS:
+        handler = getattr(view_class, method, None)
+        if handler and (not handler.__module__.startswith('rest_framework')
+                        or getattr(view_class, 'queryset', None) is not None):
+            methods.append(method.upper())
+    return methods
+
+
+class Sample:
+    # users and rows of the requests: the authors of the newest reports and their patient
+    def __init__(self, password):
+        self.password = password
+        doctor_report = DoctorReport.objects.select_related('added_by__user', 'patient').filter(
+            patient__isnull=False).order_by('-id').first()
+        if doctor_report is None:
+            raise ValueError('no reports in the database, run generate_data first')
+        self.patient = doctor_report.patient
+        self.doctor_report = doctor_report.pk
+        self.doctor = doctor_report.added_by.user
+        nurse_report = (NurseReport.objects.select_related('added_by__user').filter(patient=self.patient).first()
+                        or NurseReport.objects.select_related('added_by__user').order_by('-id').first())
+        self.nurse_report = nurse_report.pk
+        self.nurse = nurse_report.added_by.user
+        self.admin = self.patient.added_by.user
+        self.superuser = User.objects.filter(is_superuser=True).order_by('date_joined').first()
+        medicine = Medicine.objects.filter(doctor=self.doctor).only('pk').first()
+        self.medicine = medicine.pk if medicine else None
+        self.catalog = Medicines.objects.order_by('name').values_list('pk', flat=True).first()
+        self.team_nurses = [str(user_id) for user_id in self.patient.nurse.values_list('user_id', flat=True)]
+        self.team_doctors = [str(user_id) for user_id in self.patient.doctor.values_list('user_id', flat=True)]
+
+    def user(self, role):
+        return getattr(self, role)
+
+
+def scenarios(s):
+    patient = str(s.patient.pk)
+    doctor, nurse = str(s.doctor.pk), str(s.nurse.pk)
+    report = {'title': 'Benchmark report, blood pressure 120/80', 'patient': patient}
+    medicine = {'name': str(s.catalog), 'quantity': 1, 'dosage': 'twice a day', 'patient': patient,
+                'start_date': '2024-01-01', 'end_date': '2024-01-10'}
+    return [
+        # ---- users
+        Scenario('POST', 'api/login', None, data={'username': s.nurse.email, 'password': s.password}),
+        Scenario('GET', 'api/user/profile', 'nurse'),
+        Scenario('GET', 'api/doctors_name', 'admin'),
+        Scenario('GET', 'api/nurses_name', 'admin'),
+        Scenario('GET', 'api/active_admin', 'superuser'),
+        Scenario('GET', 'api/pending_admin', 'superuser'),
+        Scenario('GET', 'api/pending_admin/<str:pk>', 'superuser', {'pk': s.admin.pk}),
+        Scenario('GET', 'api/get_related_user/<str:pk>', 'admin', {'pk': doctor}),
+        Scenario('GET', 'api/doctors/', 'admin'),
+        Scenario('GET', 'api/nurses/', 'admin'),
+        Scenario('GET', 'api/user/<str:pk>', 'admin', {'pk': doctor}),
+        Scenario('POST', 'api/add_nurses', 'admin', data={'doctor': [doctor], 'nurse': s.team_nurses}),
+        Scenario('POST', 'api/care_team', 'admin', data={'doctors': [doctor], 'nurses': s.team_nurses}),
+        Scenario('PUT', 'api/care_team', 'admin', data={'patients': [patient], 'doctors': s.team_doctors,
+                                                         'nurses': s.team_nurses}),
+        Scenario('DELETE', 'api/care_team', 'admin', data={'patients': [patient], 'nurses': [nurse]}),
+        Scenario('GET', 'api/nurse/', 'doctor'),
+        Scenario('GET', 'api/nurse/<str:pk>', 'doctor', {'pk': nurse}),
+        Scenario('GET', 'api/doctor/', 'nurse'),
+        Scenario('GET', 'api/doctor/<str:pk>', 'nurse', {'pk': doctor}),
+        Scenario('GET', 'api/export/<str:dataset>', 'admin', {'dataset': 'patients'}),
+        Scenario('GET', 'api/patients/', 'admin'),
+        Scenario('GET', 'api/patients/', 'admin', query={'search': 'sepsis'}),
+        Scenario('GET', 'api/patients/<str:pk>', 'admin', {'pk': patient}),
+        Scenario('DELETE', 'api/patients/<str:pk>', 'admin', {'pk': patient}),
+        Scenario('GET', 'api/patients/<str:pk>/timeline', 'doctor', {'pk': patient}),
+        Scenario('GET', 'api/get_patients_user/<str:pk>', 'admin', {'pk': nurse}),
+        Scenario('GET', 'api/sync', 'nurse'),
+        Scenario('GET', 'api/patient_user/', 'nurse'),
+        Scenario('GET', 'api/patient_user/<str:pk>', 'doctor', {'pk': patient}),
+        # ---- reports
+        Scenario('GET', 'api/reports/doctor_report/', 'doctor'),
+        Scenario('POST', 'api/reports/doctor_report/', 'doctor', data=dict(report, nurse=s.team_nurses)),
+        Scenario('GET', 'api/reports/doctor_report/<int:id>', 'doctor', {'id': s.doctor_report}),
+        Scenario('PUT', 'api/reports/doctor_report/<int:id>', 'doctor', {'id': s.doctor_report},
+                 data=dict(report, nurse=s.team_nurses)),
+        Scenario('DELETE', 'api/reports/doctor_report/<int:id>', 'doctor', {'id': s.doctor_report}),
+        Scenario('GET', 'api/reports/nurse_report/', 'nurse'),
+        Scenario('POST', 'api/reports/nurse_report/', 'nurse', data=dict(report, doctor=s.team_doctors)),
+        Scenario('POST', 'api/reports/nurse_report/batch', 'nurse',
+                 data={'reports': [dict(report, doctor=s.team_doctors)] * 20}),
+        Scenario('GET', 'api/reports/nurse_report/<int:id>', 'nurse', {'id': s.nurse_report}),
+        Scenario('PUT', 'api/reports/nurse_report/<int:id>', 'nurse', {'id': s.nurse_report},
+                 data=dict(report, doctor=s.team_doctors)),
+        Scenario('DELETE', 'api/reports/nurse_report/<int:id>', 'nurse', {'id': s.nurse_report}),
+        Scenario('GET', 'api/reports/doctor_reports/', 'doctor'),
+        Scenario('GET', 'api/reports/nurse_reports/', 'nurse'),
+        Scenario('GET', 'api/reports/search', 'doctor', query={'q': 'blood pressure'}),
+        Scenario('GET', 'api/reports/<str:pk>/doctor_patient_report/', 'doctor', {'pk': patient}),
+        Scenario('POST', 'api/reports/<str:pk>/doctor_patient_report/', 'doctor', {'pk': patient},
+                 data=dict(report, nurse=s.team_nurses)),
+        Scenario('GET', 'api/reports/<str:pk>/doctor_patient_report/<int:id>', 'doctor',
+                 {'pk': patient, 'id': s.doctor_report}),
+        Scenario('GET', 'api/reports/<str:pk>/nurse_patient_report/', 'nurse', {'pk': patient}),
+        Scenario('POST', 'api/reports/<str:pk>/nurse_patient_report/', 'nurse', {'pk': patient},
+                 data=dict(report, doctor=s.team_doctors)),
+        Scenario('GET', 'api/reports/<str:pk>/nurse_patient_report/<int:id>', 'nurse',
+                 {'pk': patient, 'id': s.nurse_report}),
+        Scenario('POST', 'api/reports/add_all_nurses_report', 'doctor', data=report),
+        Scenario('POST', 'api/reports/add_all_doctors_report', 'nurse', data=report),
+        # ---- medicine
+        Scenario('POST', 'api/medicine/add_medicine', 'doctor', data=dict(medicine, nurse=s.team_nurses)),
+        Scenario('POST', 'api/medicine/add_medicine_all_nurses', 'doctor', data=medicine),
+        Scenario('GET', 'api/medicine/medicines', 'doctor'),
+        Scenario('GET', 'api/medicine/medicines/<str:pk>', 'doctor', {'pk': s.medicine}),
+        Scenario('DELETE', 'api/medicine/medicines/<str:pk>', 'doctor', {'pk': s.medicine}),
+        Scenario('GET', 'api/medicine/medicines_nurse', 'nurse'),
+        Scenario('GET', 'api/medicine/autocomplete', 'doctor', query={'q': 'amox'}),
+        Scenario('GET', 'api/medicine/', 'doctor'),
+        Scenario('POST', 'api/medicine/', 'doctor', data={'name': 'Benchmark 10 mg'}),
+        Scenario('GET', 'api/medicine/<str:pk>', 'doctor', {'pk': s.catalog}),
+    ]
+
+
+def percentile(values, fraction):
+    # nearest rank, as bench_server
+    return values[max(int(len(values) * fraction) - 1, 0)]
+
+
+class Benchmark:
+    def __init__(self, requests=50, warmup=5, password='password', only=None, log=None):
+        self.requests = requests
+        self.warmup = warmup
+        self.password = password
+        # substrings of the names ("GET /api/patients/") to run
+        self.only = only
+        self.log = log or (lambda message: None)
+        self.clients = {}
+
+    def client(self, user):
+        if user is None:
+            return Client(raise_request_exception=False)
+        if user.pk not in self.clients:
+            token, created = Token.objects.get_or_create(user=user)
+            # an exception of the view is a 500 of the endpoint, not the end of the run
+            self.clients[user.pk] = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f'Token {token.key}')
+        return self.clients[user.pk]
+
+    def call(self, client, scenario):
+        # (status, ms, queries, bytes), the streamed bodies are read
+        data = json.dumps(scenario.data) if scenario.data is not None else ''
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = client.generic(scenario.method, scenario.path, data, content_type='application/json')
+            size = sum(len(chunk) for chunk in response.streaming_content) if response.streaming \
+                else len(response.content)
+            response.close()
+        return response.status_code, (time.perf_counter() - start) * 1000, counter.count, size
+
+    def measure(self, scenario):
+        client = self.client(scenario.role and self.sample.user(scenario.role))
+        results = []
+        for index in range(self.warmup + self.requests):
+            if scenario.method == 'GET':
+                result = self.call(client, scenario)
+            else:
+                # the writes are undone
+                with transaction.atomic():
+                    result = self.call(client, scenario)
+                    transaction.set_rollback(True)
+            if index >= self.warmup:
+                results.append(result)
+        latencies = sorted(latency for status, latency, queries, size in results)
+        status, latency, queries, size = results[-1]
+        return {
+            'name': scenario.name, 'method': scenario.method, 'route': '/' + scenario.route,
+            'path': scenario.path, 'role': scenario.role, 'status': status,
+            'errors': sum(1 for status, latency, queries, size in results if status >= 400),
+            'p50_ms': round(statistics.median(latencies), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'queries': max(queries for status, latency, queries, size in results),
+            'bytes': size,
+        }
+
+    def dataset(self):
+        return {
+            'users': User.objects.count(), 'patients': Patient.objects.count(),
+            'doctor_reports': DoctorReport.objects.count(), 'nurse_reports': NurseReport.objects.count(),
+            'medicines': Medicine.objects.count(),
+        }
+
+    def run(self):
+        self.sample = Sample(self.password)
+        planned = scenarios(self.sample)
+        covered = {(scenario.method, scenario.route) for scenario in planned}
+        endpoints, skipped = [], []
+        for route, view_class in routes().items():
+            for method in view_methods(view_class):
+                if route in SKIPPED:
+                    skipped.append({'name': f'{method} /{route}', 'reason': SKIPPED[route]})
+                elif (method, route) not in covered:
+                    skipped.append({'name': f'{method} /{route}', 'reason': 'no scenario'})
+        for scenario in planned:
+            if self.only and not any(part in scenario.name for part in self.only):
+                continue
+            if None in scenario.kwargs.values():
+                skipped.append({'name': scenario.name, 'reason': 'no row in the database'})
+                continue
+            endpoints.append(self.measure(scenario))
+            self.log('{name}: p50 {p50_ms} ms, p95 {p95_ms} ms, {queries} queries, status {status}'.format(
+                **endpoints[-1]))
+        return {
+            'database': connections['default'].vendor,
+            'dataset': self.dataset(),
+            'requests': self.requests,
+            'warmup': self.warmup,
+            'endpoints': endpoints,
+            'skipped': skipped,
+        }
+
+
+def compare(baseline, result, threshold=20, min_ms=1.0):
+    # regressions of result against baseline: p95 over threshold % (and min_ms), more queries, other status
+    before = {endpoint['name']: endpoint for endpoint in baseline['endpoints']}
+    regressions = []
+    for endpoint in result['endpoints']:
+        old = before.get(endpoint['name'])
+        if old is None:
+            continue
+        name = endpoint['name']
+        if endpoint['status'] != old['status']:
+            regressions.append(f"{name}: status {old['status']} -> {endpoint['status']}")
+        if endpoint['queries'] > old['queries']:
+            regressions.append(f"{name}: {old['queries']} -> {endpoint['queries']} queries")
+        if (endpoint['p95_ms'] > old['p95_ms'] * (1 + threshold / 100)
+                and endpoint['p95_ms'] - old['p95_ms'] >= min_ms):
+            regressions.append(f"{name}: p95 {old['p95_ms']} -> {endpoint['p95_ms']} ms")
+    return regressions
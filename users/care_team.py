@@ -0,0 +1,168 @@
+from itertools import product
+from django.db import connections, router, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.signals import m2m_changed
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from .models import Doctor, Nurse, Patient
+from .response_cache import bump
+
+
+# ============================================================================
+# Care team assignment (doctors <-> nurses, patients <-> doctors / nurses)
+# ============================================================================
+# Set-based writes on the M2M through tables: one query to read the current
+# rows, one bulk insert and one delete, whatever the number of ids.
+RELATIONS = {
+    'doctor_nurse': (Doctor.nurse.through, 'doctor_id', 'nurse_id'),
+    'patient_doctor': (Patient.doctor.through, 'patient_id', 'doctor_id'),
+    'patient_nurse': (Patient.nurse.through, 'patient_id', 'nurse_id'),
+}
+
+
+def as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def parse_ids(value, name):
+    # UUIDs of the request (400 on anything else), as strings
+    try:
+        ids = serializers.ListField(child=serializers.UUIDField()).run_validation(as_list(value))
+    except ValidationError as e:
+        raise ValidationError({name: e.detail})
+    return {str(pk) for pk in ids}
+
+
+def resolve_profiles(model, user_ids, name, admin_user=None):
+    # user id -> Doctor / Nurse id, all in one query (only the staff of the admin)
+    user_ids = parse_ids(user_ids, name.lower())
+    if not user_ids:
+        return {}
+    profiles = model.objects.filter(user_id__in=user_ids)
+    if admin_user is not None:
+        profiles = profiles.filter(user__added_by=admin_user)
+    profiles = {str(user_id): pk for user_id, pk in profiles.values_list('user_id', 'id')}
+    missing = user_ids - set(profiles)
+    if missing:
+        raise ValidationError({"message": f"{name} not found: {', '.join(sorted(missing))}"})
+    return profiles
+
+
+def resolve_patients(patient_ids, admin_user=None):
+    patient_ids = parse_ids(patient_ids, 'patient')
+    if not patient_ids:
+        return {}
+    patients = Patient.objects.filter(id__in=patient_ids)
+    if admin_user is not None:
+        patients = patients.filter(added_by__user=admin_user)
+    patients = {str(pk): pk for pk in patients.values_list('id', flat=True)}
+    missing = patient_ids - set(patients)
+    if missing:
+        raise ValidationError({"message": f"Patient not found: {', '.join(sorted(missing))}"})
+    return patients
+
+
+def change_relation(relation, left, right, action):
+    # action: "add" the pairs, "remove" them or "replace" the rows of the left ids by them
+    through, left_field, right_field = RELATIONS[relation]
+    left_ids = {pk: key for key, pk in left.items()}
+    right_ids = {pk: key for key, pk in right.items()}
+    wanted = set(product(left_ids, right_ids))
+
+    current = through.objects.filter(**{f'{left_field}__in': list(left_ids)})
+    if action != 'replace':
+        current = current.filter(**{f'{right_field}__in': list(right_ids)})
+    # user id of the doctors / nurses removed by "replace" (not in the request)
+    right_user = right_field.replace('_id', '__user_id')
+    existing = {}
+    for pk, left_id, right_id, user_id in current.values_list('pk', left_field, right_field, right_user):
+        existing[(left_id, right_id)] = pk
+        right_ids.setdefault(right_id, str(user_id))
+
+    added = [] if action == 'remove' else sorted(wanted - set(existing), key=str)
+    if action == 'add':
+        removed = []
+    elif action == 'remove':
+        removed = [pair for pair in existing if pair in wanted]
+    else:
+        removed = [pair for pair in existing if pair not in wanted]
+
+    if added:
+        through.objects.bulk_create(
+            [through(**{left_field: left_id, right_field: right_id}) for left_id, right_id in added],
+            ignore_conflicts=True)
+    if removed:
+        through.objects.filter(pk__in=[existing[pair] for pair in removed]).delete()
+
+    # the ids the API uses (user id of the doctor / nurse, id of the patient)
+    left_name, right_name = relation.split('_')
+    return {
+        'added': [{left_name: left_ids[left_id], right_name: right_ids[right_id]}
+                  for left_id, right_id in added],
+        'removed': [{left_name: left_ids[left_id], right_name: right_ids[right_id]}
+                    for left_id, right_id in removed],
+    }
+
+
+def change_care_team(action, doctors=None, nurses=None, patients=None, admin_user=None):
+    # with patients: the doctors / nurses of the patients, without: the nurses of the doctors
+    # admin_user: only the doctors, nurses and patients of this admin are found
+    with transaction.atomic():
+        doctor_ids = resolve_profiles(Doctor, doctors, 'Doctor', admin_user)
+        nurse_ids = resolve_profiles(Nurse, nurses, 'Nurse', admin_user)
+        changes = {}
+        if patients is not None:
+            patient_ids = resolve_patients(patients, admin_user)
+            if doctors is not None:
+                changes['patient_doctor'] = change_relation('patient_doctor', patient_ids, doctor_ids, action)
+            if nurses is not None:
+                changes['patient_nurse'] = change_relation('patient_nurse', patient_ids, nurse_ids, action)
+            # the through rows are written without signals
+            changed = {change['patient'] for relation in changes.values()
+                       for change in relation['added'] + relation['removed']}
+            if changed:
+                Patient.objects.filter(pk__in=changed).touch()
+                bump('patients')
+        else:
+            changes['doctor_nurse'] = change_relation('doctor_nurse', doctor_ids, nurse_ids, action)
+            # the through rows are written without signals
+            if changes['doctor_nurse']['added'] or changes['doctor_nurse']['removed']:
+                bump('care_team')
+        return changes
+
+
+# ---- Reports / medicines sent to the whole care team of the patient
+def fan_out(instance, field, team):
+    # recipients ("field" of the new row) = the doctors / nurses ("team" field of Patient) of its
+    # patient, copied with one INSERT ... SELECT between the through tables (RETURNING the ids)
+    model = type(instance)
+    recipients = model._meta.get_field(field)
+    members = Patient._meta.get_field(team)
+    using = instance._state.db or router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    sql = (f'INSERT INTO {qn(recipients.m2m_db_table())} '
+           f'({qn(recipients.m2m_column_name())}, {qn(recipients.m2m_reverse_name())}) '
+           f'SELECT %s, {qn(members.m2m_reverse_name())} FROM {qn(members.m2m_db_table())} '
+           f'WHERE {qn(members.m2m_column_name())} = %s')
+    params = [model._meta.pk.get_db_prep_value(instance.pk, connection),
+              Patient._meta.pk.get_db_prep_value(instance.patient_id, connection)]
+    with connection.cursor() as cursor:
+        if connection.features.can_return_rows_from_bulk_insert:
+            cursor.execute(f'{sql} RETURNING {qn(recipients.m2m_reverse_name())}', params)
+            pk_set = {row[0] for row in cursor.fetchall()}
+        else:
+            cursor.execute(sql, params)
+            pk_set = set(recipients.remote_field.through.objects.using(using).filter(
+                **{recipients.m2m_field_name(): instance.pk}).values_list(recipients.m2m_reverse_name(), flat=True))
+    # same signal as .add(): websocket event, "updated" for the sync
+    m2m_changed.send(sender=recipients.remote_field.through, instance=instance, action='post_add',
+                     reverse=False, model=recipients.related_model, pk_set=pk_set, using=using)
+    # the response lists the recipients: one query with their users
+    prefetch_related_objects(
+        [instance], Prefetch(field, queryset=recipients.related_model.objects.select_related('user')))
+    return pk_set
@@ -0,0 +1,107 @@
+import hashlib
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+# ============================================================================
+# Conditional GET (ETag / Last-Modified), 304 Not Modified without serializing
+# ============================================================================
+# Objects: ETag and Last-Modified from the "updated" field (one small query).
+# Lists: ETag from Max(updated) + Count of the rows (one aggregate query), so
+# deleted rows and removed recipients change it too. No Last-Modified for the
+# lists, a delete does not move Max(updated). The related rows in the response
+# (patient names, care team users) are not in "updated": the versions of their
+# scopes (users/response_cache.py) go into the ETag, and there is no
+# Last-Modified: a change of those rows does not move it.
+def make_etag(*parts):
+    return quote_etag(hashlib.md5('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest())
+
+
+def not_modified(request, etag, last_modified=None):
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag, last_modified=None):
+    if response.status_code not in (200, 304):
+        return response
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # the client must ask again (with If-None-Match), the answer depends on the user
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def object_state_query(queryset, pk, field, fallback):
+    # pk and last change of the row
+    fields = ['pk', field] + ([fallback] if fallback else [])
+    return queryset.filter(pk=pk).values_list(*fields)
+
+
+def object_validators(queryset, state, parts, versions):
+    # no row (the view answers 404) or never updated: no validators
+    if state is None:
+        return None, None
+    pk, *values = state
+    last_modified = next((value for value in values if value is not None), None)
+    if last_modified is None:
+        return None, None
+    etag = make_etag(queryset.model._meta.label_lower, pk, last_modified.isoformat(), *parts, *versions)
+    return etag, None if versions else last_modified
+
+
+def list_validators(request, state, parts):
+    return make_etag(request.get_full_path(), request.user.pk, state['last_modified'], state['count'], *parts)
+
+
+def scope_versions(scopes):
+    if not scopes:
+        return []
+    # response_cache imports this module
+    from .response_cache import get_versions
+    return get_versions(scopes)
+
+
+def list_state_kwargs(field):
+    # COUNT(*): answered from an index on (filter, updated)
+    return {'last_modified': Max(field), 'count': Count('*')}
+
+
+# ---- Used by the APIViews: build() makes the full response
+def conditional_object(request, queryset, pk, build, *parts, field='updated', fallback=None, scopes=()):
+    state = object_state_query(queryset, pk, field, fallback).first()
+    etag, last_modified = object_validators(queryset, state, parts, scope_versions(scopes))
+    if etag is None:
+        return build()
+    response = not_modified(request, etag, last_modified) or build()
+    return set_validators(response, etag, last_modified)
+
+
+def conditional_list(request, queryset, build, *parts, field='updated', scopes=()):
+    state = queryset.order_by().aggregate(**list_state_kwargs(field))
+    etag = list_validators(request, state, [*parts, *scope_versions(scopes)])
+    response = not_modified(request, etag) or build()
+    return set_validators(response, etag)
+
+
+# ---- Async views (users/async_views.py), build() is a coroutine
+async def aconditional_object(request, queryset, pk, build, *parts, field='updated', fallback=None, scopes=()):
+    state = await object_state_query(queryset, pk, field, fallback).afirst()
+    versions = await sync_to_async(scope_versions)(scopes)
+    etag, last_modified = object_validators(queryset, state, parts, versions)
+    if etag is None:
+        return await build()
+    response = not_modified(request, etag, last_modified) or await build()
+    return set_validators(response, etag, last_modified)
+
+
+async def aconditional_list(request, queryset, build, *parts, field='updated', scopes=()):
+    state = await queryset.order_by().aaggregate(**list_state_kwargs(field))
+    versions = await sync_to_async(scope_versions)(scopes)
+    etag = list_validators(request, state, [*parts, *versions])
+    response = not_modified(request, etag) or await build()
+    return set_validators(response, etag)
@@ -0,0 +1,96 @@
+import uuid
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import CachedTokenAuthentication
+from .events import user_group, patient_group
+from .models import Patient
+
+
+# ----- ws://.../ws/care_team/?token=<token>
+class TokenAuthMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get('query_string', b'').decode())
+        key = query.get('token', [None])[0]
+        scope = dict(scope, user=await get_token_user(key))
+        return await super().__call__(scope, receive, send)
+
+
+@database_sync_to_async
+def get_token_user(key):
+    if not key:
+        return AnonymousUser()
+    try:
+        user, token = CachedTokenAuthentication().authenticate_credentials(key)
+    except AuthenticationFailed:
+        return AnonymousUser()
+    return user
+
+
+# ============================================================================
+# Care team events: the user group is joined on connect, the client sends
+# {"action": "subscribe", "patient": "<id>"} to get the events of a patient
+# ============================================================================
+class CareTeamConsumer(AsyncJsonWebsocketConsumer):
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if self.user is None or not self.user.is_authenticated:
+            await self.close()
+            return
+
+        self.joined = set()
+        await self.join(user_group(self.user.id))
+        await self.accept()
+        await self.send_json({'status': 'connected'})
+
+    async def disconnect(self, close_code):
+        for group in getattr(self, 'joined', ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        action = content.get('action')
+        patient = content.get('patient')
+        if action in ('subscribe', 'unsubscribe'):
+            # canonical form: the group the events are published to (patient_<uuid>)
+            try:
+                patient = str(uuid.UUID(str(patient)))
+            except ValueError:
+                await self.send_json({'error': 'Invalid patient', 'patient': patient})
+                return
+
+        if action == 'subscribe':
+            if not await self.can_watch(patient):
+                await self.send_json({'error': 'Not Have Access', 'patient': patient})
+                return
+            await self.join(patient_group(patient))
+            await self.send_json({'status': 'subscribed', 'patient': patient})
+
+        elif action == 'unsubscribe':
+            group = patient_group(patient)
+            if group in self.joined:
+                self.joined.discard(group)
+                await self.channel_layer.group_discard(group, self.channel_name)
+            await self.send_json({'status': 'unsubscribed', 'patient': patient})
+
+        else:
+            await self.send_json({'error': 'Unknown action'})
+
+    async def join(self, group):
+        self.joined.add(group)
+        await self.channel_layer.group_add(group, self.channel_name)
+
+    # ---- Sent by users.events.publish
+    async def care_team_event(self, message):
+        await self.send_json(message['event'])
+
+    @database_sync_to_async
+    def can_watch(self, patient_id):
+        try:
+            return Patient.objects.filter(pk=patient_id).visible_to(self.user).exists()
+        except (ValueError, ValidationError):
+            return False
@@ -1,24 +1,99 @@
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from datetime import timedelta
 import random
 from django.conf import settings
-from .models import User
+from .models import User, OutboxEmail
+
+
+# ============================================================================
+# Outbox: the views only save the email, the send_emails command sends it
+# ============================================================================
+def queue_email(subject, message, recipients):
+    email_from = settings.EMAIL_HOST_USER
+    return OutboxEmail.objects.bulk_create([
+        OutboxEmail(subject=subject, message=message,
+                    from_email=email_from, recipient=recipient)
+        for recipient in recipients
+    ])
 
 
 def send_via_email(email):
     subject = 'ICU application'
-    message = f'Accept you to use ICU application'
-    email_from = settings.EMAIL_HOST_USER
-    send_mail(subject, message, email_from, [email])
-    user_obj = User.objects.get(email=email)
-    user_obj.save()
+    message = 'Accept you to use ICU application'
+    queue_email(subject, message, [email])
 
 
 def send_otp_via_email(email):
     subject = 'Reset Password'
     otp = random.randint(1000, 9999)
     message = f'Your code is {otp}'
-    email_from = settings.EMAIL_HOST_USER
-    send_mail(subject, message, email_from, [email])
-    user_obj = User.objects.get(email=email)
-    user_obj.otp = otp
-    user_obj.save()
+    User.objects.filter(email=email).update(otp=otp)
+    queue_email(subject, message, [email])
+
+
+# ---- Sending
+def claim_emails(batch_size):
+    # Take the due emails and move their next attempt after the lease,
+    # so another worker does not take them (and they come back if we crash)
+    lease = getattr(settings, 'EMAIL_OUTBOX_LEASE', 300)
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(OutboxEmail.objects.select_for_update(skip_locked=True).filter(
+            status=OutboxEmail.PENDING, next_attempt__lte=now).order_by('next_attempt')[:batch_size])
+        OutboxEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            next_attempt=now + timedelta(seconds=lease))
+    return emails
+
+
+def retry_delay(attempts):
+    # 1 min, 2 min, 4 min, ... (max 1 hour)
+    return timedelta(seconds=min(60 * 2 ** (attempts - 1), 60 * 60))
+
+
+def attempt_failed(email, error):
+    email.last_error = str(error)
+    if email.attempts >= getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5):
+        email.status = OutboxEmail.FAILED
+    else:
+        email.next_attempt = timezone.now() + retry_delay(email.attempts)
+
+
+def send_pending_emails(batch_size=50):
+    return send_emails(claim_emails(batch_size))
+
+
+def send_emails(emails):
+    # emails claimed by claim_emails(), returns the number sent
+    if not emails:
+        return 0
+
+    sent = 0
+    for email in emails:
+        email.attempts += 1
+    # one SMTP connection for the whole batch
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as error:
+        # could not connect: an attempt of every email of the batch
+        for email in emails:
+            attempt_failed(email, error)
+    else:
+        for email in emails:
+            try:
+                EmailMessage(email.subject, email.message, email.from_email or None,
+                             [email.recipient], connection=connection).send()
+            except Exception as error:
+                attempt_failed(email, error)
+            else:
+                email.status = OutboxEmail.SENT
+                email.sent = timezone.now()
+                email.last_error = ''
+                sent += 1
+        connection.close()
+
+    OutboxEmail.objects.bulk_update(
+        emails, ['status', 'attempts', 'last_error', 'next_attempt', 'sent'])
+    return sent
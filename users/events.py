@@ -0,0 +1,54 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+
+# ============================================================================
+# Care team events (sent to the websocket clients, see consumers.py)
+# ============================================================================
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def patient_group(patient_id):
+    return f'patient_{patient_id}'
+
+
+def send(groups, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    for group in groups:
+        async_to_sync(channel_layer.group_send)(
+            group, {'type': 'care_team.event', 'event': event})
+
+
+def publish(groups, event):
+    # after the commit: the client reading the row finds it, nothing sent on a rollback
+    groups = list(groups)
+    transaction.on_commit(lambda: send(groups, event))
+
+
+def make_event(name, instance):
+    return {
+        'event': name,
+        'id': str(instance.pk),
+        'patient': str(instance.patient_id) if instance.patient_id else None,
+    }
+
+
+# ---- Used by the signals of the reports, medicine and rays apps
+def publish_patient_event(name, instance):
+    # everyone watching the patient
+    if instance.patient_id:
+        publish([patient_group(instance.patient_id)], make_event(name, instance))
+
+
+def publish_recipients_event(name, instance, model, pk_set):
+    # the nurses / doctors (model) the row was sent to
+    if not pk_set:
+        return
+    users = model.objects.filter(
+        pk__in=pk_set).values_list('user_id', flat=True)
+    publish([user_group(user_id) for user_id in users if user_id],
+            make_event(name, instance))
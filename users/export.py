@@ -0,0 +1,231 @@
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+
+
+# ============================================================================
+# Exports of an admin (patients, reports, medicines) as CSV or XLSX
+# ============================================================================
+# Rows read as tuples (values_list, no model instances) with .iterator() and
+# written to the response while they are read (StreamingHttpResponse): the
+# memory does not grow with the number of rows. The doctors / nurses of a chunk
+# of EXPORT_CHUNK_SIZE rows in one query per team. XLSX is written by hand (one
+# sheet, inline strings) into a zip streamed with data descriptors, no library
+# keeps the whole workbook. In the CSV a text starting with = + - @ (tab, CR)
+# gets a ' in front: spreadsheets would run it as a formula (the XLSX inline
+# strings are never formulas, they are kept as they are).
+FORMULA_START = ('=', '+', '-', '@', '\t', '\r')
+# not allowed in XML 1.0 (the sheet would not open)
+XML_INVALID_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+
+class Team:
+    # usernames of the doctors / nurses of the row (ManyToManyField name)
+    def __init__(self, field):
+        self.field = field
+
+    def usernames(self, model, ids):
+        field = model._meta.get_field(self.field)
+        through = field.remote_field.through
+        source, target = field.m2m_field_name(), field.m2m_reverse_name()
+        members = {}
+        for row_id, username in (through.objects.filter(**{f'{source}__in': ids}).order_by('pk')
+                                 .values_list(f'{source}_id', f'{target}__user__username')):
+            if username:
+                members.setdefault(row_id, []).append(username)
+        return {row_id: '; '.join(names) for row_id, names in members.items()}
+
+
+class ExportDataset:
+    def __init__(self, name, model, admin_field, columns, ordering):
+        self.name = name
+        self.model = model
+        # field of the row going to the Admin
+        self.admin_field = admin_field
+        # (header, lookup of values_list or Team(...))
+        self.columns = columns
+        self.ordering = ordering
+
+    @property
+    def installed(self):
+        return apps.is_installed(self.model.split('.')[0])
+
+    @property
+    def header(self):
+        return [header for header, path in self.columns]
+
+    def get_queryset(self, admin):
+        model = apps.get_model(self.model)
+        fields = [path for header, path in self.columns if isinstance(path, str)]
+        return model.objects.filter(**{self.admin_field: admin}).order_by(*self.ordering).values_list('pk', *fields)
+
+    def rows(self, admin):
+        chunk = []
+        for row in self.get_queryset(admin).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            chunk.append(row)
+            if len(chunk) >= settings.EXPORT_CHUNK_SIZE:
+                yield from self.chunk_rows(chunk)
+                chunk = []
+        yield from self.chunk_rows(chunk)
+
+    def chunk_rows(self, chunk):
+        if not chunk:
+            return
+        model = apps.get_model(self.model)
+        ids = [row[0] for row in chunk]
+        teams = {path: path.usernames(model, ids) for header, path in self.columns if isinstance(path, Team)}
+        for row in chunk:
+            values = iter(row[1:])
+            yield [teams[path].get(row[0], '') if isinstance(path, Team) else next(values)
+                   for header, path in self.columns]
+
+
+# ordered by their indexes: (added_by, -date_joined), (patient, -created)
+EXPORT_DATASETS = {dataset.name: dataset for dataset in [
+    ExportDataset('patients', 'users.Patient', 'added_by', [
+        ('id', 'id'), ('name', 'name'), ('nat_id', 'nat_id'), ('age', 'age'), ('gender', 'gender'),
+        ('status', 'status'), ('room_number', 'room_number'), ('disease_type', 'disease_type'),
+        ('phone', 'phone'), ('address', 'address'), ('date_joined', 'date_joined'),
+        ('doctors', Team('doctor')), ('nurses', Team('nurse')),
+    ], ['-date_joined']),
+    ExportDataset('doctor_reports', 'reports.DoctorReport', 'patient__added_by', [
+        ('id', 'id'), ('created', 'created'), ('patient_id', 'patient_id'), ('patient', 'patient__name'),
+        ('doctor', 'added_by__user__username'), ('title', 'title'), ('nurses', Team('nurse')),
+    ], ['patient', '-created']),
+    ExportDataset('nurse_reports', 'reports.NurseReport', 'patient__added_by', [
+        ('id', 'id'), ('created', 'created'), ('patient_id', 'patient_id'), ('patient', 'patient__name'),
+        ('nurse', 'added_by__user__username'), ('title', 'title'), ('doctors', Team('doctor')),
+    ], ['patient', '-created']),
+    ExportDataset('medicines', 'medicine.Medicine', 'patient__added_by', [
+        ('id', 'id'), ('created', 'created'), ('patient_id', 'patient_id'), ('patient', 'patient__name'),
+        ('medicine', 'name__name'), ('quantity', 'quantity'), ('dosage', 'dosage'),
+        ('start_date', 'start_date'), ('end_date', 'end_date'), ('doctor', 'doctor__username'),
+        ('nurses', Team('nurse')),
+    ], ['patient', '-created']),
+]}
+
+
+def cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat() if timezone.is_aware(value) else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+# ---- CSV
+class Echo:
+    # csv.writer writes a line, we give it back to the response
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    text = cell_text(value)
+    if isinstance(value, str) and text.startswith(FORMULA_START):
+        return "'" + text
+    return text
+
+
+def csv_stream(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([csv_cell(value) for value in row])
+
+
+# ---- XLSX
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>')
+XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+    'officeDocument" Target="xl/workbook.xml"/></Relationships>')
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>')
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/'
+    'worksheet" Target="worksheets/sheet1.xml"/></Relationships>')
+
+
+class ZipOutput:
+    # write-only file for ZipFile, the bytes are taken by the generator
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def xlsx_cell(value):
+    if isinstance(value, bool) or value is None or not isinstance(value, (int, float)):
+        text = escape(XML_INVALID_RE.sub('', cell_text(value)))
+        return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+    return f'<c><v>{value}</v></c>'
+
+
+def xlsx_stream(name, header, rows, rows_per_write=500):
+    output = ZipOutput()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr('[Content_Types].xml', XLSX_CONTENT_TYPES)
+        workbook.writestr('_rels/.rels', XLSX_RELS)
+        workbook.writestr('xl/workbook.xml', XLSX_WORKBOOK.format(name=escape(name[:31])))
+        workbook.writestr('xl/_rels/workbook.xml.rels', XLSX_WORKBOOK_RELS)
+        yield output.take()
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        b'<sheetData>')
+            lines = [f'<row>{"".join(xlsx_cell(value) for value in header)}</row>']
+            for row in rows:
+                lines.append(f'<row>{"".join(xlsx_cell(value) for value in row)}</row>')
+                if len(lines) >= rows_per_write:
+                    sheet.write(''.join(lines).encode('utf-8'))
+                    lines = []
+                    data = output.take()
+                    if data:
+                        yield data
+            sheet.write(''.join(lines).encode('utf-8') + b'</sheetData></worksheet>')
+    yield output.take()
+
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', lambda dataset, rows: csv_stream(dataset.header, rows)),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+             lambda dataset, rows: xlsx_stream(dataset.name, dataset.header, rows)),
+}
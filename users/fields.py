@@ -0,0 +1,46 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+
+# ============================================================================
+# Doctors / nurses given by their user ids (many=True)
+# ============================================================================
+# SlugRelatedField(many=True) runs queryset.get() once per slug. With
+# BulkSlugRelatedField the list is read with one "__in" query and every
+# missing slug is in the same error.
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        return self.child_relation.to_internal_value_many(data)
+
+
+class BulkSlugRelatedField(serializers.SlugRelatedField):
+    default_error_messages = {
+        'does_not_exist_many': 'Object with {slug_name} not found: {values}.',
+    }
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    def to_internal_value_many(self, data):
+        # same order (and duplicates) as the request
+        model_field = self.get_queryset().model._meta.get_field(self.slug_field)
+        try:
+            values = [model_field.to_python(value) for value in data]
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail('invalid')
+        found = {getattr(instance, self.slug_field): instance for instance in self.get_queryset().filter(
+            **{f'{self.slug_field}__in': set(values)})}
+        missing = list(dict.fromkeys(str(value) for value in values if value not in found))
+        if missing:
+            self.fail('does_not_exist_many', slug_name=self.slug_field, values=', '.join(missing))
+        return [found[value] for value in values]
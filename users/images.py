@@ -0,0 +1,138 @@
+import hashlib
+import os
+from functools import lru_cache
+from io import BytesIO
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from .email_Send import retry_delay
+from .models import ImageJob
+
+
+# ============================================================================
+# Photos of the users / patients
+# ============================================================================
+# On upload (pre_save, users/signals.py): EXIF orientation applied, metadata
+# (GPS, camera, ...) dropped, at most IMAGE_MAX_SIZE pixels, saved as
+# images/<sha256>.<ext>. Same content = same name: the URLs never change and
+# can be cached for ever. An ImageJob is queued, the process_images command
+# makes the WebP thumbnail (IMAGE_THUMBNAIL_SIZE) and saves its name in the
+# "thumbnail" field. The lists send the thumbnail (or the photo until then).
+def strip_metadata(file):
+    file.seek(0)
+    with Image.open(file) as picture:
+        picture = ImageOps.exif_transpose(picture)
+        picture.thumbnail((settings.IMAGE_MAX_SIZE, settings.IMAGE_MAX_SIZE))
+        picture.info = {}
+        output = BytesIO()
+        if picture.mode in ('RGBA', 'LA', 'P'):
+            picture.save(output, 'PNG', optimize=True)
+            extension = 'png'
+        else:
+            picture.convert('RGB').save(output, 'JPEG', quality=settings.IMAGE_QUALITY, optimize=True)
+            extension = 'jpg'
+    return output.getvalue(), extension
+
+
+def prepare_image(instance):
+    # new upload only (an image read from the database is committed)
+    image = instance.image
+    if not image or image._committed:
+        return False
+    data, extension = strip_metadata(image)
+    name = image.field.generate_filename(instance, f'{hashlib.sha256(data).hexdigest()[:32]}.{extension}')
+    if image.storage.exists(name):
+        instance.image = name
+    else:
+        instance.image = ContentFile(data, name=os.path.basename(name))
+    instance.thumbnail = ''
+    return True
+
+
+def queue_thumbnail(instance):
+    ImageJob.objects.create(kind=instance._meta.label_lower, object_id=str(instance.pk),
+                            image=instance.image.name)
+
+
+def thumbnail_name(image):
+    width, height = settings.IMAGE_THUMBNAIL_SIZE
+    stem = os.path.splitext(os.path.basename(image))[0]
+    return f'{os.path.dirname(image)}/thumbs/{stem}_{width}x{height}.webp'
+
+
+def make_thumbnail(image, storage=default_storage):
+    name = thumbnail_name(image)
+    if storage.exists(name):
+        return name
+    with storage.open(image) as file, Image.open(file) as picture:
+        has_alpha = picture.mode in ('RGBA', 'LA', 'P')
+        picture = ImageOps.fit(picture.convert('RGBA' if has_alpha else 'RGB'),
+                               settings.IMAGE_THUMBNAIL_SIZE, Image.LANCZOS)
+        output = BytesIO()
+        picture.save(output, 'WEBP', quality=settings.IMAGE_THUMBNAIL_QUALITY, method=4)
+    return storage.save(name, ContentFile(output.getvalue()))
+
+
+# ---- URLs (the names never change, storage.url() once per name)
+@lru_cache(maxsize=10000)
+def image_url(name):
+    return default_storage.url(name)
+
+
+def thumbnail_url(instance):
+    # the thumbnail, the photo while it is made, None without photo
+    if instance.thumbnail:
+        return image_url(instance.thumbnail)
+    if instance.image:
+        return image_url(instance.image.name)
+    return None
+
+
+# ---- Worker (python manage.py process_images)
+def claim_jobs(batch_size):
+    # same lease as the email outbox: another worker does not take them, they come back if we crash
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(ImageJob.objects.select_for_update(skip_locked=True).filter(
+            status=ImageJob.PENDING, next_attempt__lte=now).order_by('next_attempt')[:batch_size])
+        ImageJob.objects.filter(id__in=[job.id for job in jobs]).update(
+            next_attempt=now + timedelta(seconds=settings.IMAGE_JOB_LEASE))
+    return jobs
+
+
+def save_thumbnail(job, name):
+    model = apps.get_model(job.kind)
+    instance = model.objects.filter(pk=job.object_id).first()
+    # deleted, or a new photo (its own job)
+    if instance is None or instance.image.name != job.image:
+        return
+    instance.thumbnail = name
+    fields = ['thumbnail'] + (['updated'] if hasattr(instance, 'updated') else [])
+    # post_save: response cache / auth cache of the user
+    instance.save(update_fields=fields)
+
+
+def process_pending_images(batch_size=20):
+    jobs = claim_jobs(batch_size)
+    done = 0
+    for job in jobs:
+        job.attempts += 1
+        try:
+            save_thumbnail(job, make_thumbnail(job.image))
+        except Exception as error:
+            job.last_error = str(error)
+            if job.attempts >= settings.IMAGE_JOB_MAX_ATTEMPTS:
+                job.status = ImageJob.FAILED
+            else:
+                job.next_attempt = timezone.now() + retry_delay(job.attempts)
+        else:
+            job.status = ImageJob.DONE
+            job.last_error = ''
+            done += 1
+    ImageJob.objects.bulk_update(jobs, ['status', 'attempts', 'last_error', 'next_attempt'])
+    return done
@@ -0,0 +1,57 @@
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Send concurrent GET requests to a running server and report the throughput. '
+            'Run it once against "gunicorn" (WSGI) and once against "ICU_SERVER=asgi gunicorn".')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--token', required=True,
+                            help='Token of a nurse (or doctor for the doctor endpoints)')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Endpoint to call (can be repeated)')
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--json', action='store_true', help='Print the result as JSON')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/api/patient_user/', '/api/reports/nurse_reports/',
+                                     '/api/medicine/medicines_nurse']
+        headers = {'Authorization': f"Token {options['token']}"}
+        local = threading.local()
+
+        def call(index):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            url = options['base_url'] + paths[index % len(paths)]
+            start = time.perf_counter()
+            response = local.session.get(url, headers=headers)
+            return response.status_code, (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['clients']) as executor:
+            results = list(executor.map(call, range(options['requests'])))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for code, latency in results)
+        result = {
+            'clients': options['clients'],
+            'requests': len(results),
+            'errors': sum(1 for code, latency in results if code >= 400),
+            'requests_per_second': round(len(results) / elapsed, 1),
+            'p50_ms': round(statistics.median(latencies), 1),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 1),
+            'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1], 1),
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(result))
+        else:
+            for name, value in result.items():
+                self.stdout.write(f'{name}: {value}')
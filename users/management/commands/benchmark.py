@@ -0,0 +1,45 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from users.benchmark import Benchmark, compare
+
+
+class Command(BaseCommand):
+    help = ('Measure p50 / p95 / p99 latency and queries of every endpoint of users, reports and medicine '
+            'on the current database (generate_data first) and print the result as JSON. '
+            'With --compare, fail on the regressions against a previous result.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5, help='Requests per endpoint before measuring')
+        parser.add_argument('--password', default='password', help='Password of the users (login endpoint)')
+        parser.add_argument('--filter', action='append', dest='only',
+                            help='Only the endpoints with this text in their name (can be repeated)')
+        parser.add_argument('--output', help='Write the JSON to this file')
+        parser.add_argument('--compare', help='JSON of a previous run')
+        parser.add_argument('--threshold', type=float, default=20,
+                            help='p95 increase (percent) counted as a regression')
+
+    def handle(self, *args, **options):
+        log = self.stderr.write if options['verbosity'] > 1 else None
+        benchmark = Benchmark(requests=options['requests'], warmup=options['warmup'],
+                              password=options['password'], only=options['only'], log=log)
+        try:
+            result = benchmark.run()
+        except ValueError as e:
+            raise CommandError(e)
+
+        output = json.dumps(result, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            regressions = compare(baseline, result, options['threshold'])
+            for regression in regressions:
+                self.stderr.write(regression)
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}')
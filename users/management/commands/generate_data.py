@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from users.synthetic import Generator
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with a synthetic ICU (admins, doctors, nurses, patients and their care '
+            'teams, reports, medicines, rays) for the load tests and the benchmark command. '
+            '--scale 0.01 gives a small dataset.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--admins', type=int, default=10)
+        parser.add_argument('--doctors', type=int, default=2000)
+        parser.add_argument('--nurses', type=int, default=5000)
+        parser.add_argument('--patients', type=int, default=30000)
+        parser.add_argument('--reports', type=int, default=2000000,
+                            help='Doctor and nurse reports (half each)')
+        parser.add_argument('--medicines', type=int, default=1000000)
+        parser.add_argument('--rays', type=int, default=500000, help='Only with the rays app installed')
+        parser.add_argument('--scale', type=float, default=1.0, help='Multiplies every count but --admins')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='synthetic',
+                            help='Usernames and emails of the users (another prefix to generate twice)')
+        parser.add_argument('--password', default='password', help='Password of every generated user')
+
+    def handle(self, *args, **options):
+        counts = {name: options[name] if name == 'admins' else max(int(options[name] * options['scale']), 1)
+                  for name in ['admins', 'doctors', 'nurses', 'patients', 'reports', 'medicines', 'rays']}
+        verbose = options['verbosity'] > 1
+        generator = Generator(seed=options['seed'], batch_size=options['batch_size'], prefix=options['prefix'],
+                              password=options['password'], log=self.stdout.write if verbose else None)
+        start = time.perf_counter()
+        try:
+            created = generator.run(**counts)
+        except ValueError as e:
+            raise CommandError(e)
+        for name, count in created.items():
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(f'{time.perf_counter() - start:.1f} s')
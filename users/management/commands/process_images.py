@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from users.images import process_pending_images
+
+
+class Command(BaseCommand):
+    help = 'Make the WebP thumbnails of the uploaded user / patient photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Images claimed at the same time')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Seconds to wait when there is nothing to do')
+        parser.add_argument('--once', action='store_true',
+                            help='Make the pending thumbnails then exit')
+
+    def handle(self, *args, **options):
+        while True:
+            done = process_pending_images(options['batch_size'])
+            if done:
+                self.stdout.write(f'{done} thumbnails made')
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['interval'])
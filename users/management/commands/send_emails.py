@@ -0,0 +1,46 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from users.email_Send import claim_emails, send_emails
+
+
+class Command(BaseCommand):
+    help = 'Send the queued emails of the outbox (accept admin, reset password code)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Emails sent over one SMTP connection')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Threads sending batches at the same time')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Send the due emails then exit')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        workers = options['workers']
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                results = list(executor.map(self.send_batch, [batch_size] * workers))
+                sent = sum(sent for claimed, sent in results)
+                if sent:
+                    self.stdout.write(f'{sent} emails sent')
+
+                # nothing due any more (the failed emails are due later)
+                claimed = sum(claimed for claimed, sent in results)
+                if options['once'] and not claimed:
+                    break
+                if not claimed:
+                    time.sleep(options['interval'])
+
+    @staticmethod
+    def send_batch(batch_size):
+        # (emails claimed, emails sent)
+        try:
+            emails = claim_emails(batch_size)
+            return len(emails), send_emails(emails)
+        finally:
+            connection.close()
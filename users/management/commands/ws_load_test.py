@@ -0,0 +1,61 @@
+import asyncio
+import statistics
+import time
+import uuid
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing.websocket import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from users.consumers import CareTeamConsumer
+from users.events import user_group
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Open many care team websocket connections and measure the event fan-out '
+            'through the configured channel layer (in memory, or Redis when REDIS_URL is set)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=20)
+
+    def handle(self, *args, **options):
+        async_to_sync(self.run)(options['connections'], options['events'])
+
+    async def run(self, connections, events):
+        # the same (not saved) user on every connection, one group_send reaches all of them
+        user = User(id=uuid.uuid4(), is_active=True)
+        consumer = CareTeamConsumer.as_asgi()
+
+        async def app(scope, receive, send):
+            return await consumer(dict(scope, user=user), receive, send)
+
+        communicators = [WebsocketCommunicator(app, '/ws/care_team/')
+                         for i in range(connections)]
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[c.connect(timeout=30) for c in communicators])
+        await asyncio.gather(*[c.receive_json_from(timeout=30) for c in communicators])
+        connect_time = time.perf_counter() - start
+        connected = sum(1 for ok, code in results if ok)
+
+        channel_layer = get_channel_layer()
+        latencies = []
+        for i in range(events):
+            sent = time.perf_counter()
+            await channel_layer.group_send(user_group(user.id), {
+                'type': 'care_team.event',
+                'event': {'event': 'load_test', 'id': str(i), 'patient': None},
+            })
+            await asyncio.gather(*[c.receive_json_from(timeout=30) for c in communicators])
+            latencies.append((time.perf_counter() - sent) * 1000)
+
+        await asyncio.gather(*[c.disconnect() for c in communicators])
+
+        latencies.sort()
+        self.stdout.write(f'connections: {connected}/{connections} in {connect_time:.2f}s')
+        self.stdout.write(
+            f'fan-out of one event to all connections (ms): '
+            f'p50={statistics.median(latencies):.1f} '
+            f'p95={latencies[int(len(latencies) * 0.95) - 1]:.1f} '
+            f'max={latencies[-1]:.1f}')
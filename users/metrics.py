@@ -0,0 +1,231 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+
+# ============================================================================
+# Queries, database time and serialization time of every request
+# ============================================================================
+# MetricsMiddleware counts the queries of the request on every database
+# (execute_wrapper) and sends them in the Server-Timing header:
+#   Server-Timing: db;dur=12.1;desc="7 queries", serialize;dur=4.2, render;dur=3.0, total;dur=25.4
+# "serialize" is the time in the .data of the DRF serializers (to_representation,
+# with the queries it runs), "render" the rendering of the DRF / template
+# response (JSON encoding).
+# The totals of every endpoint (url name) are served as Prometheus text by
+# /metrics, per process: every gunicorn worker has its own.
+# A view declares its budget: query_budget = 5 or {'GET': 3, 'POST': 8}.
+# Over it the request is counted (icu_query_budget_exceeded_total), and fails
+# with QueryBudgetExceeded when QUERY_BUDGET_STRICT (the tests, see
+# users/testing.py TestRunner). The queries of a streamed body run after the
+# response left the middleware: not counted.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+# QueryCounter of the current request (MetricsMiddleware)
+current_counter = ContextVar('current_counter', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.serialize = 0.0
+        self.render = 0.0
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def timed_data(data):
+    # the outermost .data only: a serializer used in another one is in its time
+    @wraps(data)
+    def wrapper(serializer):
+        counter = current_counter.get()
+        if counter is None or counter.serializing:
+            return data(serializer)
+        counter.serializing = True
+        start = time.perf_counter()
+        try:
+            return data(serializer)
+        finally:
+            counter.serializing = False
+            counter.serialize += time.perf_counter() - start
+    wrapper.timed = True
+    return wrapper
+
+
+def time_serializers():
+    # Serializer.data and ListSerializer.data go through BaseSerializer.data (users/apps.py)
+    from rest_framework.serializers import BaseSerializer
+    if not getattr(BaseSerializer.data.fget, 'timed', False):
+        BaseSerializer.data = property(timed_data(BaseSerializer.data.fget))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = defaultdict(int)
+        self.durations = defaultdict(lambda: Histogram(DURATION_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.db_seconds = defaultdict(float)
+        self.serialize_seconds = defaultdict(float)
+        self.render_seconds = defaultdict(float)
+        self.response_bytes = defaultdict(int)
+        self.budget_exceeded = defaultdict(int)
+
+    def observe(self, endpoint, method, status, duration, counter, size, exceeded):
+        key = (endpoint, method)
+        with self.lock:
+            self.requests[(endpoint, method, str(status))] += 1
+            self.durations[key].observe(duration)
+            self.queries[key].observe(counter.count)
+            self.db_seconds[key] += counter.duration
+            self.serialize_seconds[key] += counter.serialize
+            self.render_seconds[key] += counter.render
+            self.response_bytes[key] += size
+            if exceeded:
+                self.budget_exceeded[key] += 1
+
+    # ---- Prometheus text format
+    def render(self):
+        lines = []
+        with self.lock:
+            self.counter(lines, 'icu_http_requests_total', 'Requests by endpoint, method and status',
+                         self.requests, ('endpoint', 'method', 'status'))
+            self.histogram(lines, 'icu_http_request_duration_seconds', 'Time of the requests', self.durations)
+            self.histogram(lines, 'icu_http_db_queries', 'Database queries per request', self.queries)
+            self.counter(lines, 'icu_http_db_seconds_total', 'Time of the database queries', self.db_seconds)
+            self.counter(lines, 'icu_http_serialize_seconds_total', 'Time of the serializers (.data)',
+                         self.serialize_seconds)
+            self.counter(lines, 'icu_http_render_seconds_total', 'Time of the rendering of the responses',
+                         self.render_seconds)
+            self.counter(lines, 'icu_http_response_bytes_total', 'Size of the responses (not streamed)',
+                         self.response_bytes)
+            self.counter(lines, 'icu_query_budget_exceeded_total', 'Requests over the query budget of the view',
+                         self.budget_exceeded)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def labels(names, values, **extra):
+        pairs = list(zip(names, values)) + list(extra.items())
+        return ','.join(f'{name}="{escape(value)}"' for name, value in pairs)
+
+    def counter(self, lines, name, help, values, names=('endpoint', 'method')):
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} counter']
+        for key, value in sorted(values.items()):
+            lines.append(f'{name}{{{self.labels(names, key)}}} {value:g}')
+
+    def histogram(self, lines, name, help, values, names=('endpoint', 'method')):
+        lines += [f'# HELP {name} {help}', f'# TYPE {name} histogram']
+        for key, histogram in sorted(values.items()):
+            total = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                total += count
+                lines.append(f'{name}_bucket{{{self.labels(names, key, le=bound)}}} {total}')
+            lines.append(f'{name}_sum{{{self.labels(names, key)}}} {histogram.sum:g}')
+            lines.append(f'{name}_count{{{self.labels(names, key)}}} {total}')
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+metrics = Metrics()
+
+
+def get_budget(view_class, method):
+    budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        return budget.get(method)
+    return budget
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = request.query_counter = QueryCounter()
+        start = time.perf_counter()
+        token = current_counter.set(counter)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(counter))
+                response = self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        duration = time.perf_counter() - start
+
+        response['Server-Timing'] = ', '.join(filter(None, [
+            response.get('Server-Timing'),
+            f'db;dur={counter.duration * 1000:.1f};desc="{counter.count} queries"',
+            f'serialize;dur={counter.serialize * 1000:.1f}',
+            f'render;dur={counter.render * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ]))
+
+        match = request.resolver_match
+        endpoint = (match.view_name or match.route) if match else 'unmatched'
+        budget = getattr(request, 'query_budget', None)
+        exceeded = budget is not None and counter.count > budget
+        size = 0 if response.streaming else len(response.content)
+        metrics.observe(endpoint, request.method, response.status_code, duration, counter, size, exceeded)
+        if exceeded and settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(
+                f'{request.method} {endpoint}: {counter.count} queries, budget {budget}')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        request.query_budget = get_budget(view_class, request.method)
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def rendered(response):
+            request.query_counter.render += time.perf_counter() - started
+        response.add_post_render_callback(rendered)
+        return response
+
+
+# ---- GET /metrics (METRICS_TOKEN as "Authorization: Bearer ...", or a staff session)
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    header = request.headers.get('Authorization', '')
+    if not (token and constant_time_compare(header, f'Bearer {token}')) and not request.user.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
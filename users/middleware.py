@@ -0,0 +1,12 @@
+from django.utils.functional import SimpleLazyObject
+from .actor import resolve_actor
+
+
+# ----- request.actor, resolved on first use (after DRF authentication)
+class ActorMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.actor = SimpleLazyObject(lambda: resolve_actor(request.user))
+        return self.get_response(request)
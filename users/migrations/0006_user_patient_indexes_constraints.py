@@ -0,0 +1,56 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def dedupe(users, field, default):
+    # the oldest user keeps a duplicated value, the others get the default
+    duplicated = (users.values(field).annotate(count=Count('pk')).filter(count__gt=1)
+                  .values_list(field, flat=True))
+    for value in duplicated:
+        keep = users.filter(**{field: value}).order_by('date_joined', 'pk').values_list('pk', flat=True)[0]
+        users.filter(**{field: value}).exclude(pk=keep).update(**{field: default})
+
+
+def dedupe_phones(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    users = User.objects.using(schema_editor.connection.alias)
+    users.filter(phone='').update(phone=None)
+    dedupe(users.exclude(phone=None), 'phone', None)
+
+
+def dedupe_nat_ids(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    users = User.objects.using(schema_editor.connection.alias).filter(is_admin=False).exclude(nat_id=1)
+    dedupe(users, 'nat_id', 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['added_by', 'role', '-date_joined'], name='users_added_by_role_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['nat_id'], name='users_nat_id_idx'),
+        ),
+        migrations.RunPython(dedupe_phones, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(fields=('phone',), name='users_unique_phone'),
+        ),
+        migrations.RunPython(dedupe_nat_ids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_admin', False), models.Q(('nat_id', 1), _negated=True)), fields=('nat_id',), name='users_unique_nat_id'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['added_by', '-date_joined'], name='patient_added_by_joined_idx'),
+        ),
+    ]
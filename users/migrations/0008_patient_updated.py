@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_tombstone'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['added_by', 'updated'], name='patient_added_by_updated_idx'),
+        ),
+    ]
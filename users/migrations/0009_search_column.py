@@ -0,0 +1,47 @@
+from django.db import migrations, models
+
+
+def fill_search(apps, schema_editor):
+    # same text as User.set_search / Patient.set_search
+    from users.search import search_text
+    User = apps.get_model('users', 'User')
+    Patient = apps.get_model('users', 'Patient')
+    for model, fields in [(User, ['name', 'username', 'gender', 'specialization']),
+                          (Patient, ['name', 'disease_type'])]:
+        rows = []
+        for row in model.objects.only('pk', *fields).iterator(chunk_size=2000):
+            row.search = search_text(*[getattr(row, field) for field in fields])
+            rows.append(row)
+            if len(rows) == 2000:
+                model.objects.bulk_update(rows, ['search'])
+                rows = []
+        model.objects.bulk_update(rows, ['search'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_patient_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='search',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1000),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='search',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1000),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['added_by', 'room_number'], name='patient_added_by_room_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['added_by', 'nat_id'], name='patient_added_by_nat_id_idx'),
+        ),
+        migrations.RunPython(fill_search, migrations.RunPython.noop),
+    ]
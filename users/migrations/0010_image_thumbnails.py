@@ -0,0 +1,58 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def queue_existing(apps, schema_editor):
+    # thumbnails of the photos uploaded before (python manage.py process_images)
+    ImageJob = apps.get_model('users', 'ImageJob')
+    for label, model in [('users.user', apps.get_model('users', 'User')),
+                         ('users.patient', apps.get_model('users', 'Patient'))]:
+        rows = model.objects.exclude(image='').exclude(image=None).values_list('pk', 'image')
+        ImageJob.objects.bulk_create(
+            [ImageJob(kind=label, object_id=str(pk), image=image) for pk, image in rows.iterator()],
+            batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_search_column'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='thumbnail',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='thumbnail',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=100)),
+                ('object_id', models.CharField(max_length=64)),
+                ('image', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Image Job',
+                'verbose_name_plural': 'Image Jobs',
+                'db_table': 'ImageJob',
+                'ordering': ['created'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='imagejob',
+            index=models.Index(fields=['status', 'next_attempt'], name='imagejob_status_next_idx'),
+        ),
+        migrations.RunPython(queue_existing, migrations.RunPython.noop),
+    ]
@@ -7,6 +7,7 @@ from django.conf import settings
 from django.dispatch import receiver
 import uuid
 from phonenumber_field.modelfields import PhoneNumberField
+from .search import search_text
 
 User = settings.AUTH_USER_MODEL
 
@@ -57,6 +58,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     role = models.CharField(max_length=30)
     specialization = models.CharField(max_length=300)
     image = models.ImageField(upload_to=upload_to, null=True, blank=True)
+    # WebP thumbnail of the image (users/images.py)
+    thumbnail = models.CharField(max_length=255, blank=True, default='', editable=False)
 
     added_by = models.ForeignKey('self', models.CASCADE, null=True, blank=True)
 
@@ -64,6 +67,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     age = models.CharField(max_length=3, blank=True, null=True)
     nat_id = models.IntegerField(default=1)
     date_joined = models.DateTimeField(default=timezone.now)
+    # normalized name / username / gender / specialization (users/search.py)
+    search = models.CharField(max_length=1000, blank=True, default='', editable=False)
 
     otp = models.CharField(max_length=4, null=True, blank=True)
 
@@ -86,10 +91,27 @@ class User(AbstractBaseUser, PermissionsMixin):
         verbose_name_plural = 'Users'
         db_table = u'Users'
         ordering = ['-date_joined']
+        indexes = [
+            # AllDoctors / AllNurses: added_by=admin, role=..., newest first
+            models.Index(fields=['added_by', 'role', '-date_joined'],
+                         name='users_added_by_role_idx'),
+            # signup check of the national id (all users)
+            models.Index(fields=['nat_id'], name='users_nat_id_idx'),
+        ]
+        constraints = [
+            # checked by the signup serializers, enforced here against races
+            models.UniqueConstraint(fields=['phone'], name='users_unique_phone'),
+            # admins and superusers (createsuperuser) keep the default nat_id
+            models.UniqueConstraint(fields=['nat_id'], condition=models.Q(is_admin=False) & ~models.Q(nat_id=1),
+                                    name='users_unique_nat_id'),
+        ]
 
     def __str__(self):
         return self.username
 
+    def set_search(self):
+        self.search = search_text(self.name, self.username, self.gender, self.specialization)
+
 
 # Admin Class
 class Admin(models.Model):
@@ -126,12 +148,38 @@ class Doctor(models.Model):
         return self.user.username
 
 
+# Patient QuerySet
+class PatientQuerySet(models.QuerySet):
+    def with_care_team(self, doctors=True, nurses=True):
+        # Load the doctors / nurses with their user rows in one query each
+        lookups = []
+        if doctors:
+            lookups.append(models.Prefetch(
+                'doctor', queryset=Doctor.objects.select_related('user')))
+        if nurses:
+            lookups.append(models.Prefetch(
+                'nurse', queryset=Nurse.objects.select_related('user')))
+        return self.prefetch_related(*lookups)
+
+    def visible_to(self, user):
+        # patients of the admin, or of the doctor / nurse care team
+        if user.is_admin:
+            return self.filter(added_by__user=user)
+        return self.filter(models.Q(doctor__user=user) | models.Q(nurse__user=user))
+
+    def touch(self):
+        # bulk changes of the care team (no save, no auto_now)
+        return self.update(updated=timezone.now())
+
+
 # Patient
 class Patient(models.Model):
     id = models.UUIDField(
         primary_key=True, default=uuid.uuid4, editable=False)
 
     image = models.ImageField(upload_to=upload_to, null=True, blank=True)
+    # WebP thumbnail of the image (users/images.py)
+    thumbnail = models.CharField(max_length=255, blank=True, default='', editable=False)
     name = models.CharField(max_length=220)
     age = models.IntegerField()
     gender = models.CharField(max_length=7)
@@ -143,6 +191,10 @@ class Patient(models.Model):
     phone = PhoneNumberField(null=True)
     address = models.CharField(max_length=500)
     date_joined = models.DateTimeField(default=timezone.now)
+    # also changed when the doctors / nurses of the patient change (ETag)
+    updated = models.DateTimeField(auto_now=True, null=True)
+    # normalized name / disease type (users/search.py)
+    search = models.CharField(max_length=1000, blank=True, default='', editable=False)
 
     added_by = models.ForeignKey(
         Admin, related_name='added_admin', on_delete=models.CASCADE)
@@ -156,10 +208,140 @@ class Patient(models.Model):
         related_name='nurse'
     )
 
+    objects = PatientQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Patients'
         verbose_name_plural = 'Patients'
         ordering = ['-date_joined']
+        indexes = [
+            # Patients of the admin, newest first
+            models.Index(fields=['added_by', '-date_joined'],
+                         name='patient_added_by_joined_idx'),
+            # ETag of the patients list (Max(updated))
+            models.Index(fields=['added_by', 'updated'],
+                         name='patient_added_by_updated_idx'),
+            # ?search=<number>: room number / national id
+            models.Index(fields=['added_by', 'room_number'],
+                         name='patient_added_by_room_idx'),
+            models.Index(fields=['added_by', 'nat_id'],
+                         name='patient_added_by_nat_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+    def set_search(self):
+        self.search = search_text(self.name, self.disease_type)
+
+
+# Outgoing Email (sent by the send_emails command)
+class OutboxEmail(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    message = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipient = models.EmailField(max_length=254)
+
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt = models.DateTimeField(default=timezone.now)
+
+    created = models.DateTimeField(auto_now_add=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Outbox Email'
+        verbose_name_plural = 'Outbox Emails'
+        db_table = u'OutboxEmail'
+        ordering = ['created']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt'],
+                         name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {self.recipient}'
+
+
+# Thumbnail to make (sent by the process_images command)
+class ImageJob(models.Model):
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=64)
+    image = models.CharField(max_length=255)
+
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Image Job'
+        verbose_name_plural = 'Image Jobs'
+        db_table = u'ImageJob'
+        ordering = ['created']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt'],
+                         name='imagejob_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+
+
+# Deleted rows (or rows a user no longer receives), read by the delta sync
+class Tombstone(models.Model):
+    kind = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=64)
+    # the doctor / nurse the row is no longer sent to (deleted or recipients changed)
+    user = models.ForeignKey(
+        User, related_name='tombstones', on_delete=models.CASCADE, null=True, blank=True)
+    deleted = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Tombstone'
+        verbose_name_plural = 'Tombstones'
+        db_table = u'Tombstone'
+        indexes = [
+            models.Index(fields=['kind', 'deleted'],
+                         name='tombstone_kind_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+
+
+# Versions of the response cache scopes (users/response_cache.py) when no
+# shared cache is configured: every worker reads the same rows
+class CacheVersion(models.Model):
+    scope = models.CharField(max_length=50, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Cache Version'
+        verbose_name_plural = 'Cache Versions'
+        db_table = u'CacheVersion'
+
+    def __str__(self):
+        return f'{self.scope} {self.version}'
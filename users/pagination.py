@@ -0,0 +1,173 @@
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+# ============================================================================
+# Keyset (cursor) pagination
+# ============================================================================
+# Pagination is used only when the client sends ?cursor= or ?page_size=,
+# otherwise the endpoints return the full list like before.
+# The cursor holds the ordering value and the primary key of the last row,
+# so the next page is a simple indexed range query (no OFFSET).
+# ?count=true adds the total number of rows in the X-Total-Count header.
+class KeysetCursorPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE or 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    count_header = 'X-Total-Count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, ordering=None):
+        self.ordering = ordering
+        self.paginating = False
+        self.next_cursor = None
+        self.total_count = None
+
+    def get_ordering(self, queryset, view=None):
+        # ordering field of the model (created, date_joined, ...) + pk as tie-breaker
+        ordering = self.ordering or getattr(view, 'cursor_ordering', None)
+        if ordering is None:
+            ordering = queryset.model._meta.ordering[0] if queryset.model._meta.ordering else '-pk'
+        if isinstance(ordering, (list, tuple)):
+            ordering = ordering[0]
+        return ordering
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def encode_cursor(self, value, pk):
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        data = json.dumps([value, str(pk)]).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def parse_cursor(self, model, value, pk):
+        # values of the fields: a cursor that decodes can still hold anything
+        field = model._meta.pk if self.field == 'pk' else model._meta.get_field(self.field)
+        try:
+            value, pk = field.to_python(value), model._meta.pk.to_python(pk)
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None or pk is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def get_page_queryset(self, queryset, request, view=None):
+        # queryset of the requested page (+1 row to know if there is a next page)
+        if not self.is_requested(request):
+            return None
+
+        self.paginating = True
+        self.request = request
+        ordering = self.get_ordering(queryset, view)
+        descending = ordering.startswith('-')
+        self.field = ordering.lstrip('-')
+        pk_ordering = '-pk' if descending else 'pk'
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            value, pk = self.parse_cursor(queryset.model, *cursor)
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value}) |
+                Q(**{self.field: value, f'pk__{lookup}': pk}))
+
+        self.size = self.get_page_size(request)
+        return queryset.order_by(ordering, pk_ordering)[:self.size + 1]
+
+    def wants_count(self, request):
+        return request.query_params.get(self.count_query_param) in ('1', 'true', 'True')
+
+    def get_page(self, rows):
+        if len(rows) > self.size:
+            rows = rows[:self.size]
+            last = rows[-1]
+            self.next_cursor = self.encode_cursor(
+                getattr(last, self.field), last.pk)
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        if self.wants_count(request):
+            # count without ordering or prefetching
+            self.total_count = queryset.order_by().count()
+        return self.get_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        if self.wants_count(request):
+            self.total_count = await queryset.order_by().acount()
+        return self.get_page([row async for row in page_queryset])
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_headers(self):
+        if self.total_count is None:
+            return {}
+        return {self.count_header: str(self.total_count)}
+
+    def get_paginated_response(self, data):
+        return Response({"result": len(data), "next": self.get_next_link(), "results": data},
+                        headers=self.get_headers())
+
+    # ---- Used by the APIViews that build their own response
+    def get_list_data(self, data, key, result_key='result'):
+        response = {}
+        if result_key:
+            response[result_key] = len(data)
+        response[key] = data
+        if self.paginating:
+            response['next'] = self.get_next_link()
+        return response
+
+    def get_list_response(self, request, queryset, serializer_class, key, result_key='result', **kwargs):
+        page = self.paginate_queryset(queryset, request)
+        if page is None:
+            page = queryset
+        data = serializer_class(page, many=True, **kwargs).data
+        return Response(self.get_list_data(data, key, result_key), headers=self.get_headers())
+
+    # ---- Async views (the rows must be prefetched, the serializer can not query)
+    async def aget_list_data(self, request, queryset, serializer_class, key, result_key='result', **kwargs):
+        page = await self.apaginate_queryset(queryset, request)
+        if page is None:
+            page = [row async for row in queryset]
+        data = serializer_class(page, many=True, **kwargs).data
+        return self.get_list_data(data, key, result_key)
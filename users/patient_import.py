@@ -0,0 +1,160 @@
+import codecs
+import csv
+import json
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from .models import Doctor, Nurse, Patient, User
+from .response_cache import bump
+from .serializer import ImportPatientSerializer
+
+
+# ============================================================================
+# Bulk import of patients (CSV or JSON lines upload)
+# ============================================================================
+# The file is read line by line and imported in batches: one query per batch
+# for the duplicate checks and the doctors / nurses, bulk_create for the
+# patients and their care team. Everything runs in one transaction, when a row
+# is not valid nothing is saved and the errors of all the rows are returned.
+class PatientImport:
+    batch_size = 500
+
+    def __init__(self, admin, batch_size=None):
+        self.admin = admin
+        self.batch_size = batch_size or self.batch_size
+        self.serializer = ImportPatientSerializer()
+        self.phone_field = Patient._meta.get_field('phone')
+        self.errors = []
+        self.created = 0
+        # phones / ids already in the file
+        self.phones = set()
+        self.nat_ids = set()
+        # user id -> Doctor / Nurse id
+        self.doctors = {}
+        self.nurses = {}
+
+    # ---- Read the upload
+    @staticmethod
+    def read_rows(upload, file_format=None):
+        if file_format is None:
+            name = (upload.name or '').lower()
+            file_format = 'csv' if name.endswith('.csv') or upload.content_type == 'text/csv' else 'jsonl'
+
+        lines = codecs.iterdecode(upload, 'utf-8-sig')
+        if file_format == 'csv':
+            for row in csv.DictReader(lines):
+                # empty cells are missing values
+                yield {key.strip(): value for key, value in row.items() if key and value not in ('', None)}
+        else:
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+
+    # ---- Import
+    def run(self, rows):
+        with transaction.atomic():
+            batch = []
+            try:
+                for number, row in enumerate(rows, start=1):
+                    batch.append((number, row))
+                    if len(batch) >= self.batch_size:
+                        self.import_batch(batch)
+                        batch = []
+            # the file itself can not be read: nothing saved (rollback), 400
+            except UnicodeDecodeError:
+                raise ValidationError({"message": "The file must be UTF-8 text"})
+            except csv.Error as error:
+                raise ValidationError({"message": f"Invalid CSV file: {error}"})
+            if batch:
+                self.import_batch(batch)
+
+            if self.errors:
+                transaction.set_rollback(True)
+                self.created = 0
+            elif self.created:
+                # bulk_create sends no signals
+                bump('patients')
+        return not self.errors
+
+    def add_error(self, number, errors):
+        self.errors.append({"row": number, "errors": errors})
+
+    def validate_batch(self, batch):
+        valid = []
+        for number, row in batch:
+            if not isinstance(row, dict):
+                self.add_error(number, {"message": "Invalid row"})
+                continue
+            try:
+                data = self.serializer.run_validation(row)
+            except ValidationError as error:
+                self.add_error(number, error.detail)
+                continue
+            if data.get('phone'):
+                data['phone'] = self.phone_field.to_python(data['phone'])
+            valid.append((number, data))
+        return valid
+
+    def load_care_team(self, valid):
+        # Doctor / Nurse ids of the users not seen in the previous batches
+        doctors = {user_id for number, data in valid for user_id in data['doctor']} - set(self.doctors)
+        nurses = {user_id for number, data in valid for user_id in data['nurse']} - set(self.nurses)
+        if doctors:
+            self.doctors.update(Doctor.objects.filter(user_id__in=doctors).values_list('user_id', 'id'))
+        if nurses:
+            self.nurses.update(Nurse.objects.filter(user_id__in=nurses).values_list('user_id', 'id'))
+
+    def import_batch(self, batch):
+        valid = self.validate_batch(batch)
+        if not valid:
+            return
+
+        # same checks as AddPatient, for the whole batch
+        phones = [data['phone'] for number, data in valid if data.get('phone')]
+        nat_ids = {data['nat_id'] for number, data in valid}
+        used_phones = {str(phone) for phone in User.objects.filter(
+            phone__in=phones).values_list('phone', flat=True)}
+        used_nat_ids = set(User.objects.filter(nat_id__in=nat_ids).values_list('nat_id', flat=True))
+        self.load_care_team(valid)
+
+        patients = []
+        doctor_links = []
+        nurse_links = []
+        for number, data in valid:
+            phone = str(data['phone']) if data.get('phone') else None
+            if phone and (phone in used_phones or phone in self.phones):
+                self.add_error(number, {"message": "Phone has already been used"})
+                continue
+            if data['nat_id'] in used_nat_ids or data['nat_id'] in self.nat_ids:
+                self.add_error(number, {"message": "ID must be unique"})
+                continue
+            missing = [str(user_id) for user_id in data['doctor'] if user_id not in self.doctors] + \
+                [str(user_id) for user_id in data['nurse'] if user_id not in self.nurses]
+            if missing:
+                self.add_error(number, {"message": f"Doctor or nurse not found: {', '.join(missing)}"})
+                continue
+
+            if phone:
+                self.phones.add(phone)
+            self.nat_ids.add(data['nat_id'])
+            doctors = data.pop('doctor')
+            nurses = data.pop('nurse')
+            patient = Patient(added_by=self.admin, **data)
+            patient.set_search()
+            patients.append(patient)
+            doctor_links += [Patient.doctor.through(patient_id=patient.id, doctor_id=self.doctors[user_id])
+                             for user_id in set(doctors)]
+            nurse_links += [Patient.nurse.through(patient_id=patient.id, nurse_id=self.nurses[user_id])
+                            for user_id in set(nurses)]
+
+        # after the first error the rest of the file is only validated
+        if self.errors:
+            return
+        Patient.objects.bulk_create(patients)
+        Patient.doctor.through.objects.bulk_create(doctor_links)
+        Patient.nurse.through.objects.bulk_create(nurse_links)
+        self.created += len(patients)
@@ -0,0 +1,177 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from rest_framework.response import Response
+from .conditional import not_modified
+from .models import CacheVersion
+
+
+# ============================================================================
+# Response cache of the per user read endpoints
+# ============================================================================
+# Key: endpoint, user, url and the versions of the data the endpoint reads
+# ("scopes": patients, care_team, users). The signals bump the version of a
+# scope (users/signals.py), the old keys are never read again and expire by
+# themselves: no key scans. The versions are in the RESPONSE_CACHE_VERSIONS
+# cache (Redis: shared by the workers) or, without one, in the CacheVersion
+# table: a local memory cache would not see the bumps of the other workers.
+# The responses are in a local LRU and, when RESPONSE_CACHE_SHARED is set, in
+# that cache too.
+
+
+class LocalLRU:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalLRU(getattr(settings, 'RESPONSE_CACHE_LOCAL_SIZE', 1000))
+
+stats_lock = threading.Lock()
+cache_stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+
+def count(name):
+    with stats_lock:
+        cache_stats[name] += 1
+
+
+def get_stats():
+    with stats_lock:
+        return dict(cache_stats)
+
+
+def get_versions_cache():
+    alias = getattr(settings, 'RESPONSE_CACHE_VERSIONS', None)
+    return caches[alias] if alias else None
+
+
+def get_shared_cache():
+    alias = getattr(settings, 'RESPONSE_CACHE_SHARED', None)
+    return caches[alias] if alias else None
+
+
+def version_key(scope):
+    return f'resp:version:{scope}'
+
+
+def initial_version():
+    # never an old value, even when the version key was evicted
+    return time.time_ns()
+
+
+def get_versions(scopes):
+    cache = get_versions_cache()
+    if cache is None:
+        versions = dict(CacheVersion.objects.filter(scope__in=scopes).values_list('scope', 'version'))
+        return [versions.get(scope, 0) for scope in scopes]
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, initial_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def increment(scopes):
+    cache = get_versions_cache()
+    if cache is None:
+        rows = CacheVersion.objects.filter(scope__in=scopes)
+        if rows.update(version=F('version') + 1) < len(set(scopes)):
+            # first bump of a scope: the row is created (once by concurrent workers) then bumped
+            missing = set(scopes) - set(rows.values_list('scope', flat=True))
+            CacheVersion.objects.bulk_create([CacheVersion(scope=scope) for scope in missing],
+                                             ignore_conflicts=True)
+            CacheVersion.objects.filter(scope__in=missing).update(version=F('version') + 1)
+        return
+    for scope in scopes:
+        try:
+            cache.incr(version_key(scope))
+        except ValueError:
+            cache.add(version_key(scope), initial_version(), None)
+
+
+def bump(*scopes):
+    in_transaction = transaction.get_connection().in_atomic_block
+    # CacheVersion rows: only after the commit, the row would stay locked until then
+    if get_versions_cache() is not None or not in_transaction:
+        increment(scopes)
+    # again after the commit: a response cached before the commit (old data) is dropped
+    if in_transaction:
+        transaction.on_commit(lambda: increment(scopes))
+
+
+def response_key(endpoint, request, scopes, args, kwargs):
+    versions = get_versions(scopes)
+    parts = [endpoint, request.user.pk, request.get_full_path(), args, sorted(kwargs.items()), versions]
+    return 'resp:' + hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+# ---- Decorator of the get() of the APIViews
+def cached_response(endpoint, scopes):
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300)
+            key = response_key(endpoint, request, scopes, args, kwargs)
+            shared = get_shared_cache()
+
+            cached = local_cache.get(key)
+            if cached is not None:
+                count('local_hits')
+            elif shared is not None:
+                cached = shared.get(key)
+                if cached is not None:
+                    count('shared_hits')
+                    local_cache.set(key, cached, timeout)
+
+            if cached is not None:
+                data, headers = cached
+                etag = headers.get('ETag')
+                response = (etag and not_modified(request, etag)) or Response(data, headers=headers)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            count('misses')
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == 200 and isinstance(response, Response):
+                headers = {name: value for name, value in response.items()
+                           if name in ('ETag', 'Cache-Control', 'Vary')}
+                local_cache.set(key, (response.data, headers), timeout)
+                if shared is not None:
+                    shared.set(key, (response.data, headers), timeout)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
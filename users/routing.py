@@ -0,0 +1,6 @@
+from django.urls import path
+from .consumers import CareTeamConsumer
+
+websocket_urlpatterns = [
+    path('ws/care_team/', CareTeamConsumer.as_asgi()),
+]
@@ -0,0 +1,74 @@
+import re
+import unicodedata
+from django.db import connections
+from django.db.models import Q
+from rest_framework import filters
+
+
+# ============================================================================
+# Search of the users / patients lists (?search=...)
+# ============================================================================
+# SearchFilter ORs an icontains (UPPER(col) LIKE '%x%') per field, the room
+# number cast to text: a scan of every row of the admin. Here the text fields
+# are normalized once, on save, in one "search" column (" word word "):
+#   numbers:  exact match on the indexed fields (room number, national id), when
+#             the number fits them (else as a word)
+#   words:    every word is the start of a word of the column
+# On PostgreSQL the column has a trigram GIN index (install(), post_migrate).
+WORD_RE = re.compile(r'\w+')
+
+
+def normalize(value):
+    # lower case, no accents, words separated by one space
+    value = unicodedata.normalize('NFKD', str(value or ''))
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(WORD_RE.findall(value.casefold()))
+
+
+def search_text(*values):
+    return f" {' '.join(filter(None, (normalize(value) for value in values)))} "
+
+
+def fits(queryset, field, number):
+    # range of the field type (integer_field_range() is unbounded on SQLite, its driver is 64 bits)
+    internal_type = queryset.model._meta.get_field(field).get_internal_type()
+    low, high = connections[queryset.db].ops.integer_field_ranges[internal_type]
+    return low <= number <= high
+
+
+class IndexedSearchFilter(filters.BaseFilterBackend):
+    # view: search_column = 'search', search_exact_fields = ['room_number', 'nat_id']
+    search_param = filters.SearchFilter.search_param
+
+    def filter_queryset(self, request, queryset, view):
+        query = normalize(request.query_params.get(self.search_param, ''))
+        if not query:
+            return queryset
+        if query.isdecimal():
+            # only the fields the number fits in (the database raises on an overflow)
+            number = int(query)
+            fields = [field for field in getattr(view, 'search_exact_fields', [])
+                      if fits(queryset, field, number)]
+            if fields:
+                return queryset.filter(Q(*[(field, number) for field in fields], _connector=Q.OR))
+        column = getattr(view, 'search_column', 'search')
+        for word in query.split():
+            queryset = queryset.filter(**{f'{column}__contains': f' {word}'})
+        return queryset
+
+
+# ---- Trigram index of the search column (PostgreSQL only)
+SEARCH_TABLES = ['Users', 'users_patient']
+
+
+def install(using='default', **kwargs):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    tables = connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in SEARCH_TABLES:
+            if table in tables:
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS {table.lower()}_search_trgm '
+                               f'ON "{table}" USING gin (search gin_trgm_ops)')
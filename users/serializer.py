@@ -1,16 +1,24 @@
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from rest_framework.validators import ValidationError
 from .models import (Admin, User, Doctor, Nurse, Patient)
+from .fields import BulkSlugRelatedField
+from .images import thumbnail_url
 
 
 # --------- User Serializer
 class UserSerializer(serializers.ModelSerializer):
     added_by = serializers.StringRelatedField()
+    thumbnail = serializers.SerializerMethodField()
 
     class Meta:
         model = User
         fields = ["id", "email", "username", "name", "phone", "added_by",
-                  'nat_id', 'image', 'specialization', "role",  "gender", "age"]
+                  'nat_id', 'image', 'thumbnail', 'specialization', "role",  "gender", "age"]
+
+    @staticmethod
+    def get_thumbnail(obj):
+        return thumbnail_url(obj)
 
 
 # --------- Simple User Serializer
@@ -21,6 +29,16 @@ class SimpleUserSerializer(serializers.ModelSerializer):
         fields = ["id", "email", "name", "phone"]
 
 
+# --------- Create the user, phone / nat_id used at the same time by another request
+def create_unique_user(create, validated_data):
+    try:
+        with transaction.atomic():
+            return create(validated_data)
+    except IntegrityError:
+        raise ValidationError(
+            {"message": "Email, username, phone or ID has already been used"})
+
+
 # --------- SignUp Admin Serializer
 class SignUpAdminSerializer(serializers.ModelSerializer):
     password = serializers.CharField(min_length=8, write_only=True)
@@ -54,7 +72,7 @@ class SignUpAdminSerializer(serializers.ModelSerializer):
             validated_data['is_superuser'] = True
             validated_data['is_active'] = False
 
-        user = super().create(validated_data)
+        user = create_unique_user(super().create, validated_data)
         user.set_password(password)
 
         if user.is_admin == True:
@@ -96,7 +114,7 @@ class SignUpUserSerializer(serializers.ModelSerializer):
         elif validated_data['role'] == 'nurse':
             validated_data['is_nurse'] = True
 
-        user = super().create(validated_data)
+        user = create_unique_user(super().create, validated_data)
         user.set_password(password)
 
         if user.is_doctor == True:
@@ -112,7 +130,7 @@ class SignUpUserSerializer(serializers.ModelSerializer):
 
 # Add Nurse to doctor
 class AddNurseSerializer(serializers.ModelSerializer):
-    nurse = serializers.SlugRelatedField(
+    nurse = BulkSlugRelatedField(
         queryset=Nurse.objects.all(), many=True, slug_field='user_id')
 
     class Meta:
@@ -173,9 +191,9 @@ class UpdateUserSerializer(serializers.ModelSerializer):
 
 # --------- Add Patient
 class AddPatient(serializers.ModelSerializer):
-    doctor = serializers.SlugRelatedField(
+    doctor = BulkSlugRelatedField(
         queryset=Doctor.objects.all(), many=True, slug_field='user_id')
-    nurse = serializers.SlugRelatedField(
+    nurse = BulkSlugRelatedField(
         queryset=Nurse.objects.all(), many=True, slug_field='user_id')
 
     class Meta:
@@ -199,83 +217,104 @@ class AddPatient(serializers.ModelSerializer):
         return patient
 
 
+# --------- Row of the patients import (see patient_import.py)
+# doctor / nurse: user ids, a list (JSON lines) or separated by ";" (CSV)
+class UserIdListField(serializers.ListField):
+    child = serializers.UUIDField()
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [item for item in data.replace(',', ';').split(';') if item.strip()]
+        return super().to_internal_value(data)
+
+
+class ImportPatientSerializer(serializers.ModelSerializer):
+    doctor = UserIdListField(required=False, default=list)
+    nurse = UserIdListField(required=False, default=list)
+
+    class Meta:
+        model = Patient
+        fields = ["name", "doctor", 'nurse', 'address',
+                  'disease_type', 'room_number', 'nat_id', 'phone', 'gender', 'age', 'status']
+
+
+# ========= Care team (doctors / nurses) of the patient
+# Use with Patient.objects.with_care_team() so the users come from the prefetch
+def care_team_data(members):
+    team_list = []
+    for i in members:
+        data = i.user
+        # the thumbnail (None without photo)
+        team_list.append({"id": data.id, "username": data.username,
+                          "image": thumbnail_url(data), 'phone': f'{data.phone}'})
+    return team_list
+
+
 # Patient ---------
 class PatientSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
     nurse = serializers.SerializerMethodField(source='get_nurse')
     doctor = serializers.SerializerMethodField(source='get_doctor')
 
     class Meta:
         model = Patient
-        fields = ['id', 'name', 'image', 'disease_type', 'room_number', 'address',
+        fields = ['id', 'name', 'image', 'thumbnail', 'disease_type', 'room_number', 'address',
                   'nat_id', 'phone', 'gender', 'age', 'status', 'doctor', 'nurse']
         depth = 1
 
+    @staticmethod
+    def get_thumbnail(obj):
+        return thumbnail_url(obj)
+
     # ========= Get Doctor Information
     @staticmethod
     def get_doctor(obj):
-        doctor_list = []
-        doctor = obj.doctor.all()
-        for i in list(doctor):
-            data = i.user
-            doctor_list.append({"id": data.id, "username": data.username,
-                                "image": data.image.url,  'phone': f'{data.phone}'})
-
-        return doctor_list
+        return care_team_data(obj.doctor.all())
 
     # ========= Get Nurse Information
     @staticmethod
     def get_nurse(obj):
-        nurse_list = []
-        nurse = obj.nurse.all()
-        for i in nurse:
-            data = i.user
-            print(data.phone)
-            nurse_list.append({"id": data.id, "username": data.username,
-                               "image": data.image.url, 'phone': f'{data.phone}'})
-        return nurse_list
+        return care_team_data(obj.nurse.all())
 
 
 # ----- Return Patient for doctor and nurse
 class PatientDoctorsSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
     nurse = serializers.SerializerMethodField(source='get_nurse')
 
     class Meta:
         model = Patient
-        fields = ['id', 'name', 'image', 'disease_type', 'room_number', 'address',
+        fields = ['id', 'name', 'image', 'thumbnail', 'disease_type', 'room_number', 'address',
                   'phone',  'age', 'status', 'nurse']
 
-    # ========= Get Nurse Information
+    @staticmethod
+    def get_thumbnail(obj):
+        return thumbnail_url(obj)
 
+    # ========= Get Nurse Information
     @staticmethod
     def get_nurse(obj):
-        nurse_list = []
-        nurse = obj.nurse.all()
-        for i in nurse:
-            data = i.user
-            nurse_list.append({"id": data.id, "username": data.username,
-                               "image": data.image.url, 'phone': f'{data.phone}'})
-        return nurse_list
+        return care_team_data(obj.nurse.all())
 
 
 # ----- Return Patient for doctor and nurse
 class PatientNurseSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
     doctor = serializers.SerializerMethodField(source='get_doctor')
 
     class Meta:
         model = Patient
-        fields = ['id', 'name', 'image', 'disease_type', 'room_number',
+        fields = ['id', 'name', 'image', 'thumbnail', 'disease_type', 'room_number',
                   'phone',  'age', 'status', 'doctor']
 
+    @staticmethod
+    def get_thumbnail(obj):
+        return thumbnail_url(obj)
+
     # ========= Get Doctor Information
     @staticmethod
     def get_doctor(obj):
-        doctor_list = []
-        doctor = obj.doctor.all()
-        for i in list(doctor):
-            data = i.user
-            doctor_list.append({"id": data.id, "username": data.username,
-                                "image": data.image.url, 'phone': f'{data.phone}'})
-        return doctor_list
+        return care_team_data(obj.doctor.all())
 
 
 class UsersName(serializers.ModelSerializer):
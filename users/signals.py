@@ -0,0 +1,101 @@
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import invalidate_token, invalidate_user
+from .models import Admin, Doctor, Nurse, User, Patient
+from .response_cache import bump
+from .images import prepare_image, queue_thumbnail
+
+
+# ========= Search column of the users / patients lists (users/search.py)
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Patient)
+def set_search(sender, instance, **kwargs):
+    instance.set_search()
+
+
+# ========= Photos: metadata stripped, content hash name, thumbnail queued (users/images.py)
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=Patient)
+def photo_uploaded(sender, instance, **kwargs):
+    instance._new_photo = prepare_image(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Patient)
+def queue_photo_thumbnail(sender, instance, **kwargs):
+    if getattr(instance, '_new_photo', False):
+        instance._new_photo = False
+        queue_thumbnail(instance)
+
+
+# ========= Auth cache (user or role profile changed / deleted, logout, admin accepted)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_auth_cache(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token_auth_cache(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Nurse)
+@receiver(post_save, sender=Admin)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Nurse)
+@receiver(post_delete, sender=Admin)
+def invalidate_profile_auth_cache(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        invalidate_user(instance.user_id)
+
+
+# ========= Care team of the patient changed (new ETag for the patient)
+@receiver(m2m_changed, sender=Patient.doctor.through)
+@receiver(m2m_changed, sender=Patient.nurse.through)
+def patient_care_team_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Patient.objects.filter(pk=instance.pk).touch()
+    elif action in ('post_add', 'post_remove'):
+        Patient.objects.filter(pk__in=pk_set).touch()
+    elif action == 'pre_clear':
+        # doctor.doctor.clear(): the patients of the doctor / nurse
+        field = 'doctor' if sender is Patient.doctor.through else 'nurse'
+        Patient.objects.filter(**{field: instance}).touch()
+
+
+# ========= Response cache (users/response_cache.py), new version of the changed data
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def patients_changed(sender, **kwargs):
+    bump('patients')
+
+
+@receiver(m2m_changed, sender=Patient.doctor.through)
+@receiver(m2m_changed, sender=Patient.nurse.through)
+def patients_team_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump('patients')
+
+
+@receiver(m2m_changed, sender=Doctor.nurse.through)
+def care_team_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        bump('care_team')
+
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Nurse)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Nurse)
+def care_team_profile_changed(sender, **kwargs):
+    bump('care_team', 'patients')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def users_changed(sender, **kwargs):
+    bump('users')
@@ -0,0 +1,112 @@
+import base64
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import ValidationError
+from .models import Tombstone
+
+
+# ============================================================================
+# Delta sync: rows created / updated / deleted since the last refresh
+# ============================================================================
+# The token is the time of the previous sync minus SYNC_OVERLAP seconds, so a
+# row saved by a transaction still running at that time is sent next time
+# (clients upsert by id, a row can come twice). Deletes come from the
+# Tombstone table, one row per doctor / nurse that received the deleted row,
+# kept SYNC_TOMBSTONE_DAYS days: an older token gets a full list ("reset": true).
+class SyncFeed:
+    def __init__(self, name, model, serializer, recipient, select_related=()):
+        self.name = name
+        self.model = model
+        self.serializer = serializer
+        # M2M field of the model with the Doctor / Nurse receiving the row
+        self.recipient = recipient
+        self.select_related = select_related
+
+    @cached_property
+    def kind(self):
+        return apps.get_model(self.model)._meta.label_lower
+
+    @cached_property
+    def serializer_class(self):
+        return import_string(self.serializer)
+
+    def get_queryset(self, profile):
+        model = apps.get_model(self.model)
+        return model.objects.filter(**{self.recipient: profile}).select_related(*self.select_related)
+
+
+# feeds of the nurses / doctors (same rows as GetNurseReport, GetMedicineNurse and GetDoctorReport)
+SYNC_FEEDS = {
+    'nurse': [
+        SyncFeed('reports', 'reports.DoctorReport',
+                 'reports.serializer.ResultNurseReportAddedDoctorSerializer', 'nurse',
+                 select_related=['added_by__user', 'patient']),
+        SyncFeed('medicines', 'medicine.Medicine',
+                 'medicine.serializer.NurseResultMedicineSerializer', 'nurse',
+                 select_related=['doctor', 'patient', 'name']),
+    ],
+    'doctor': [
+        SyncFeed('reports', 'reports.NurseReport',
+                 'reports.serializer.ResultDoctorReportAddedNurseSerializer', 'doctor',
+                 select_related=['added_by__user', 'patient']),
+    ],
+}
+
+
+def encode_token(value):
+    return base64.urlsafe_b64encode(value.isoformat().encode('utf-8')).decode('ascii')
+
+
+def decode_token(token):
+    try:
+        value = parse_datetime(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+    except ValueError:
+        value = None
+    if value is None or timezone.is_naive(value):
+        raise ValidationError({"message": "Invalid sync token"})
+    return value
+
+
+def get_changes(user, profile, token=None):
+    now = timezone.now()
+    since = decode_token(token) if token else None
+    reset = since is None or since < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+
+    response = {"reset": reset}
+    for feed in SYNC_FEEDS.get(user.role, []):
+        rows = feed.get_queryset(profile)
+        deleted = []
+        if not reset:
+            rows = rows.filter(updated__gte=since)
+            deleted = Tombstone.objects.filter(
+                kind=feed.kind, user=user, deleted__gte=since).values_list('object_id', flat=True)
+        changed = feed.serializer_class(rows, many=True).data
+        # removed then sent again: only in "changed"
+        deleted = set(deleted) - {str(row['id']) for row in changed}
+        response[feed.name] = {"changed": changed, "deleted": sorted(deleted)}
+    response["token"] = encode_token(now - timedelta(seconds=settings.SYNC_OVERLAP))
+    return response
+
+
+# ---- Used by the signals of the reports and medicine apps
+def record_deleted(instance, recipients):
+    # pre_delete: recipients (M2M manager) still has the doctors / nurses of the row
+    record_recipients_removed(instance, recipients.model, recipients.values_list('pk', flat=True))
+
+
+def record_recipients_removed(instance, model, pk_set):
+    # the row is no longer sent to these doctors / nurses
+    users = model.objects.filter(pk__in=pk_set).values_list('user_id', flat=True)
+    Tombstone.objects.bulk_create(
+        [Tombstone(kind=instance._meta.label_lower, object_id=str(instance.pk), user_id=user_id)
+         for user_id in users if user_id])
+
+
+def touch(instance):
+    # new recipients: the row is sent to them on their next sync
+    type(instance).objects.filter(pk=instance.pk).update(updated=timezone.now())
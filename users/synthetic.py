@@ -0,0 +1,281 @@
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import islice
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+from medicine.models import Medicine, Medicines
+from reports.models import DoctorReport, NurseReport
+from reports.search import SEARCH_MODELS, get_backend
+from .models import Admin, Doctor, Nurse, Patient, User
+from .response_cache import bump
+
+
+# ============================================================================
+# Synthetic ICU data (load tests and benchmarks, generate_data command)
+# ============================================================================
+# Every admin has its own doctors, nurses and patients. A patient has 2-4
+# doctors and 3-6 nurses of its admin (a window turning over the staff, so the
+# teams overlap as in a ward), a report / medicine goes to the whole care team
+# of the patient. Everything is written with bulk_create in chunks of
+# batch_size rows: no signals, the search index and the cached versions are
+# refreshed at the end. The same seed gives the same rows (ids included), the
+# dates are relative to the start of the run.
+SPECIALIZATIONS = ['Intensive care', 'Anesthesiology', 'Cardiology', 'Pulmonology', 'Neurology',
+                   'Nephrology', 'Internal medicine', 'Emergency medicine', 'Surgery', 'Infectious diseases']
+DISEASES = ['Sepsis', 'Pneumonia', 'ARDS', 'Heart failure', 'Stroke', 'Trauma', 'Renal failure',
+            'Diabetic ketoacidosis', 'COPD exacerbation', 'Post-operative care', 'Myocardial infarction']
+STATUSES = ['critical', 'serious', 'stable', 'improving']
+FIRST_NAMES = ['Ahmed', 'Mona', 'Omar', 'Sara', 'Youssef', 'Nour', 'Karim', 'Laila', 'Hassan', 'Mariam',
+               'Ali', 'Huda', 'Tarek', 'Salma', 'Mostafa', 'Rana', 'Khaled', 'Dina', 'Amr', 'Yasmin']
+LAST_NAMES = ['Hassan', 'Ibrahim', 'Mahmoud', 'Saleh', 'Farouk', 'Nasser', 'Adel', 'Fathy', 'Zaki',
+              'Kamal', 'Mansour', 'Shawky', 'Ragab', 'Sabry', 'Gamal', 'Lotfy']
+STREETS = ['Tahrir St', 'Nile Corniche', 'Ramses St', 'Qasr El Nil St', 'Salah Salem Rd', 'Abbas Bridge Rd']
+REPORT_TITLES = [
+    'Blood pressure {a}/{b}, heart rate {c}', 'Temperature {t} C, antipyretic given',
+    'SpO2 {c}% on {a} L oxygen', 'Ventilator settings changed, PEEP {a}', 'Urine output {b} ml in 6 hours',
+    'Sedation reduced, patient responsive', 'Blood culture sent, waiting for the results',
+    'Potassium {t} mmol/L, replacement started', 'Wound dressing changed, no signs of infection',
+    'Chest x-ray requested for the pneumonia follow-up', 'Pain score {a}/10 after morphine',
+    'Central line checked, site clean', 'Family informed of the condition of the patient',
+]
+MEDICINE_NAMES = ['Amoxicillin', 'Ceftriaxone', 'Meropenem', 'Vancomycin', 'Piperacillin', 'Paracetamol',
+                  'Morphine', 'Fentanyl', 'Midazolam', 'Propofol', 'Noradrenaline', 'Dobutamine', 'Heparin',
+                  'Enoxaparin', 'Insulin', 'Furosemide', 'Pantoprazole', 'Omeprazole', 'Metoclopramide',
+                  'Ondansetron', 'Dexamethasone', 'Hydrocortisone', 'Salbutamol', 'Amiodarone', 'Digoxin',
+                  'Potassium chloride', 'Magnesium sulfate', 'Albumin', 'Metronidazole', 'Levetiracetam']
+STRENGTHS = ['5 mg', '10 mg', '40 mg', '250 mg', '500 mg', '1 g']
+DOSAGES = ['once a day', 'twice a day', 'every 8 hours', 'every 6 hours', 'when needed', 'continuous infusion']
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@contextmanager
+def given_dates(*models):
+    # created / updated of the rows given by the generator (no auto_now)
+    fields = [(field, field.auto_now, field.auto_now_add) for model in models
+              for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    for field, auto_now, auto_now_add in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Generator:
+    def __init__(self, seed=0, batch_size=5000, prefix='synthetic', password='password', days=365,
+                 log=None):
+        # another prefix, other ids
+        self.rng = random.Random(f'{prefix}:{seed}')
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.password = password
+        self.days = days
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+        self.using = router.db_for_write(User)
+        self.counts = {}
+
+    # ---- Values
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def when(self, days=None):
+        return self.now - timedelta(seconds=self.rng.uniform(0, (days or self.days) * 86400))
+
+    def person(self):
+        return f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}'
+
+    def title(self):
+        rng = self.rng
+        return rng.choice(REPORT_TITLES).format(a=rng.randint(2, 15), b=rng.randint(60, 180),
+                                                c=rng.randint(85, 100), t=round(rng.uniform(3, 40), 1))
+
+    def team(self, staff, index, low, high):
+        # window of the staff of the admin, moved by every patient
+        size = min(len(staff), self.rng.randint(low, high))
+        start = (index * low) % len(staff)
+        return [staff[(start + offset) % len(staff)] for offset in range(size)]
+
+    # ---- Writes
+    def insert(self, model, rows, label=None):
+        total = 0
+        for chunk in chunks(rows, self.batch_size):
+            model.objects.using(self.using).bulk_create(chunk, batch_size=self.batch_size)
+            total += len(chunk)
+            self.log(f'{label or model._meta.verbose_name_plural}: {total}')
+        if label:
+            self.counts[label] = self.counts.get(label, 0) + total
+        return total
+
+    def profile_ids(self, model, user_ids):
+        # Admin / Doctor / Nurse id of every user
+        ids = {}
+        for chunk in chunks(user_ids, self.batch_size):
+            ids.update(model.objects.using(self.using).filter(user_id__in=chunk).values_list('user_id', 'id'))
+        return [ids[user_id] for user_id in user_ids]
+
+    # ---- Users
+    def users(self, role, count, nat_ids, password, added_by=None, **extra):
+        users = []
+        for index in range(count):
+            user = User(
+                id=self.uuid(), email=f'{self.prefix}.{role}{index}@example.com',
+                username=f'{self.prefix}_{role}{index}', name=self.person(), role=role, password=password,
+                specialization=self.rng.choice(SPECIALIZATIONS) if role == 'doctor' else '',
+                gender=self.rng.choice(['male', 'female']), age=str(self.rng.randint(25, 65)),
+                nat_id=next(nat_ids) if role != 'admin' else 1, date_joined=self.when(),
+                added_by=added_by[index % len(added_by)] if added_by else None, **extra)
+            user.set_search()
+            users.append(user)
+        self.insert(User, users, label='users')
+        return users
+
+    def staff(self, admins, doctors, nurses, password, nat_ids):
+        admin_users = self.users('admin', admins, nat_ids, password, is_admin=True, is_staff=True)
+        self.insert(Admin, (Admin(user=user) for user in admin_users), label='admins')
+        doctor_users = self.users('doctor', doctors, nat_ids, password, added_by=admin_users, is_doctor=True)
+        self.insert(Doctor, (Doctor(user=user) for user in doctor_users), label='doctors')
+        nurse_users = self.users('nurse', nurses, nat_ids, password, added_by=admin_users, is_nurse=True)
+        self.insert(Nurse, (Nurse(user=user) for user in nurse_users), label='nurses')
+
+        # {admin id: [doctor ids]}, {admin id: [nurse ids]}, user id of every doctor
+        admin_ids = self.profile_ids(Admin, [user.pk for user in admin_users])
+        doctor_ids = self.profile_ids(Doctor, [user.pk for user in doctor_users])
+        nurse_ids = self.profile_ids(Nurse, [user.pk for user in nurse_users])
+        self.doctor_users = dict(zip(doctor_ids, (user.pk for user in doctor_users)))
+        self.doctors = {admin_id: doctor_ids[index::len(admin_ids)] for index, admin_id in enumerate(admin_ids)}
+        self.nurses = {admin_id: nurse_ids[index::len(admin_ids)] for index, admin_id in enumerate(admin_ids)}
+        self.admin_ids = [admin_id for admin_id in admin_ids if self.doctors[admin_id] and self.nurses[admin_id]]
+
+        # nurses working with the doctor
+        through = Doctor.nurse.through
+        self.insert(through, (through(doctor_id=doctor_id, nurse_id=nurse_id)
+                              for admin_id in self.admin_ids
+                              for index, doctor_id in enumerate(self.doctors[admin_id])
+                              for nurse_id in self.team(self.nurses[admin_id], index, 3, 6)),
+                    label='doctor_nurses')
+
+    # ---- Patients and their care team
+    def patients(self, count, nat_ids):
+        # [(patient id, doctor ids, nurse ids)]
+        self.care_teams = []
+        patients = []
+        for index in range(count):
+            admin_id = self.admin_ids[index % len(self.admin_ids)]
+            patient = Patient(
+                id=self.uuid(), name=self.person(), age=self.rng.randint(18, 95),
+                gender=self.rng.choice(['male', 'female']), status=self.rng.choice(STATUSES),
+                nat_id=next(nat_ids), room_number=index % 500 + 1, disease_type=self.rng.choice(DISEASES),
+                address=f'{self.rng.randint(1, 200)} {self.rng.choice(STREETS)}', added_by_id=admin_id)
+            patient.date_joined = patient.updated = self.when()
+            patient.set_search()
+            patients.append(patient)
+            self.care_teams.append((patient.pk, self.team(self.doctors[admin_id], index, 2, 4),
+                                    self.team(self.nurses[admin_id], index, 3, 6)))
+        with given_dates(Patient):
+            self.insert(Patient, patients, label='patients')
+        self.insert(Patient.doctor.through, (
+            Patient.doctor.through(patient_id=patient_id, doctor_id=doctor_id)
+            for patient_id, doctors, nurses in self.care_teams for doctor_id in doctors), label='patient_doctors')
+        self.insert(Patient.nurse.through, (
+            Patient.nurse.through(patient_id=patient_id, nurse_id=nurse_id)
+            for patient_id, doctors, nurses in self.care_teams for nurse_id in nurses), label='patient_nurses')
+
+    # ---- Reports, medicines, rays (fan-out to the care team of the patient)
+    def fan_out(self, model, count, label, row, team_field):
+        # row(patient id, doctors, nurses) -> (instance, [team ids])
+        # bulk_create gives back the ids (PostgreSQL, SQLite) for the through rows
+        m2m = model._meta.get_field(team_field)
+        through = m2m.remote_field.through
+        source, target = f'{m2m.m2m_field_name()}_id', f'{m2m.m2m_reverse_field_name()}_id'
+        total = 0
+        with given_dates(model):
+            for chunk in chunks(range(count), self.batch_size):
+                rows = [row(*self.rng.choice(self.care_teams)) for index in chunk]
+                model.objects.using(self.using).bulk_create([instance for instance, team in rows])
+                through.objects.using(self.using).bulk_create(
+                    [through(**{source: instance.pk, target: member}) for instance, team in rows for member in team],
+                    batch_size=self.batch_size)
+                total += len(rows)
+                self.log(f'{label}: {total}')
+        self.counts[label] = total
+
+    def doctor_report(self, patient_id, doctors, nurses):
+        created = self.when(180)
+        return DoctorReport(patient_id=patient_id, added_by_id=self.rng.choice(doctors), title=self.title(),
+                            created=created, updated=created), nurses
+
+    def nurse_report(self, patient_id, doctors, nurses):
+        created = self.when(180)
+        return NurseReport(patient_id=patient_id, added_by_id=self.rng.choice(nurses), title=self.title(),
+                           created=created, updated=created), doctors
+
+    def medicine(self, patient_id, doctors, nurses):
+        created = self.when(180)
+        start = created.date()
+        return Medicine(id=self.uuid(), name_id=self.rng.choice(self.catalog),
+                        quantity=self.rng.randint(1, 4), dosage=self.rng.choice(DOSAGES),
+                        doctor_id=self.doctor_users[self.rng.choice(doctors)], patient_id=patient_id,
+                        start_date=start, end_date=start + timedelta(days=self.rng.randint(1, 21)),
+                        created=created, updated=created), nurses
+
+    def medicines_catalog(self):
+        names = [f'{name} {strength}' for name in MEDICINE_NAMES for strength in STRENGTHS]
+        existing = set(Medicines.objects.using(self.using).filter(name__in=names).values_list('name', flat=True))
+        created = self.when()
+        self.insert(Medicines, (Medicines(id=self.uuid(), name=name, created=created, updated=created)
+                                for name in names if name not in existing), label='medicines_catalog')
+        self.catalog = list(Medicines.objects.using(self.using).filter(name__in=names).values_list('pk', flat=True))
+
+    def ray(self, patient_id, doctors, nurses):
+        created = self.when(180)
+        rays = apps.get_model('rays', 'Rays')
+        return rays(name=f'{self.rng.choice(["Chest", "Abdomen", "Head CT", "Spine"])} x-ray',
+                    patient_id=patient_id, doctor_id=self.rng.choice(doctors),
+                    created=created, updated=created), nurses
+
+    # ---- All
+    def run(self, admins, doctors, nurses, patients, reports, medicines, rays):
+        features = connections[self.using].features
+        if not features.can_return_rows_from_bulk_insert:
+            raise ValueError('bulk_create must give back the ids (PostgreSQL or SQLite)')
+        # one hash for everybody: hashing millions of passwords is hours
+        password = make_password(self.password)
+        last = User.objects.using(self.using).aggregate(nat_id=Max('nat_id'))['nat_id'] or 1
+        nat_ids = iter(range(last + 1, 2 ** 31))
+
+        with transaction.atomic(using=self.using):
+            self.users('superuser', 1, nat_ids, password, is_superuser=True, is_staff=True)
+            self.staff(admins, doctors, nurses, password, nat_ids)
+            self.patients(patients, nat_ids)
+            if self.care_teams:
+                self.fan_out(DoctorReport, reports // 2, 'doctor_reports', self.doctor_report, 'nurse')
+                self.fan_out(NurseReport, reports - reports // 2, 'nurse_reports', self.nurse_report, 'doctor')
+                self.medicines_catalog()
+                self.fan_out(Medicine, medicines, 'medicines', self.medicine, 'nurse')
+                if rays and apps.is_installed('rays'):
+                    self.fan_out(apps.get_model('rays', 'Rays'), rays, 'rays', self.ray, 'nurse')
+            # bulk_create: no signals
+            backend = get_backend(self.using)
+            for model in SEARCH_MODELS:
+                backend.rebuild(model, self.using)
+            bump('users', 'patients', 'care_team', 'medicines')
+        # statistics of the planner for the new tables
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('ANALYZE')
+        return self.counts
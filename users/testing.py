@@ -0,0 +1,121 @@
+import itertools
+import re
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+from .models import Admin, Doctor, Nurse, User, Patient
+
+
+# ============================================================================
+# Helpers for the tests of the users, reports and medicine apps
+# ============================================================================
+nat_ids = itertools.count(100000)
+
+
+def make_user(name, role, **extra):
+    extra.setdefault('nat_id', next(nat_ids))
+    return User.objects.create(
+        email=f'{name}@icu.com', username=name, name=name, role=role,
+        image='images/avatar.png', **extra)
+
+
+def make_patient(admin, number, **extra):
+    return Patient.objects.create(
+        name=f'patient{number}', age=40, gender='male', status='stable',
+        nat_id=number, room_number=number, disease_type='flu',
+        address='cairo', added_by=admin, **extra)
+
+
+def seed_care_team(doctors=20, nurses=20, patients=40):
+    # one admin with his doctors, nurses and patients (2 doctors, 2 nurses each)
+    admin_user = make_user('admin', 'admin', is_admin=True, is_staff=True)
+    admin = Admin.objects.create(user=admin_user)
+
+    users = ([User(email=f'doctor{i}@icu.com', username=f'doctor{i}', name=f'doctor{i}', role='doctor',
+                   is_doctor=True, nat_id=1000 + i, phone=f'+2010{i:08d}', added_by=admin_user,
+                   image='images/avatar.png')
+              for i in range(doctors)] +
+             [User(email=f'nurse{i}@icu.com', username=f'nurse{i}', name=f'nurse{i}', role='nurse',
+                   is_nurse=True, nat_id=5000 + i, phone=f'+2011{i:08d}', added_by=admin_user,
+                   image='images/avatar.png')
+              for i in range(nurses)])
+    # bulk_create sends no pre_save
+    for user in users:
+        user.set_search()
+    User.objects.bulk_create(users)
+    doctor_list = Doctor.objects.bulk_create(
+        [Doctor(user=user) for user in users if user.is_doctor])
+    nurse_list = Nurse.objects.bulk_create(
+        [Nurse(user=user) for user in users if user.is_nurse])
+
+    patient_list = [Patient(name=f'patient{i}', age=40, gender='male', status='stable', nat_id=i,
+                            room_number=i, disease_type='flu', address='cairo', added_by=admin)
+                    for i in range(patients)]
+    for patient in patient_list:
+        patient.set_search()
+    Patient.objects.bulk_create(patient_list)
+    Patient.doctor.through.objects.bulk_create(
+        [Patient.doctor.through(patient_id=patient.id, doctor_id=doctor_list[(i + k) % doctors].id)
+         for i, patient in enumerate(patient_list) for k in range(2)])
+    Patient.nurse.through.objects.bulk_create(
+        [Patient.nurse.through(patient_id=patient.id, nurse_id=nurse_list[(i + k) % nurses].id)
+         for i, patient in enumerate(patient_list) for k in range(2)])
+    return admin, doctor_list, nurse_list, patient_list
+
+
+def analyze():
+    # statistics for the query planner after seeding
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+# ============================================================================
+# EXPLAIN: fail when a query reads a whole table instead of using an index
+# ============================================================================
+def explain(sql):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # with seq scans disabled the planner only picks one if there is no usable index
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + sql)
+        else:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    if connection.vendor == 'postgresql':
+        pattern = r'Seq Scan on "?(\w+)"?'
+    else:
+        # "SCAN Users" (not "SCAN Users USING INDEX ...")
+        pattern = r'\bSCAN (?:TABLE )?"?(\w+)"?(?:\s+AS\s+\w+)?\s*$'
+    tables = []
+    for line in plan:
+        match = re.search(pattern, line)
+        if match:
+            tables.append(match.group(1))
+    return tables
+
+
+@contextmanager
+def assert_no_full_scans(testcase, ignore=()):
+    with CaptureQueriesContext(connection) as queries:
+        yield queries
+    for query in queries.captured_queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith('SELECT'):
+            continue
+        scanned = [table for table in full_scans(explain(sql)) if table not in ignore]
+        if scanned:
+            testcase.fail(f'Full scan of {", ".join(scanned)} in: {sql}')
+
+
+# ============================================================================
+# Test runner: the query_budget of the views are enforced (users/metrics.py)
+# ============================================================================
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_BUDGET_STRICT = True
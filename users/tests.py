@@ -1,3 +1,1206 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import re
+import time
+import zipfile
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from datetime import timedelta
+from django.contrib import admin
+from django.conf import settings
+from django.core import mail
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+from unittest import mock
+from asgiref.sync import async_to_sync
+from PIL import Image
+from channels.db import database_sync_to_async
+from channels.testing.websocket import WebsocketCommunicator
+from icu.asgi import application
+from medicine.models import Medicine, Medicines
+from reports.models import DoctorReport, NurseReport
+from reports.serializer import DoctorReportSerializer
+from .actor import resolve_actor
+from .async_views import PatientUserAsync
+from .benchmark import Benchmark, compare
+from .email_Send import send_pending_emails
+from .authentication import CachedTokenAuthentication
+from .models import (Admin, Doctor, Nurse, User, Patient, OutboxEmail, ImageJob, CacheVersion)
+from .sync import encode_token as sync_token
+from . import response_cache
+from .care_team import change_care_team
+from .images import process_pending_images
+from .metrics import QueryBudgetExceeded, metrics
+from .views import AllDoctors
+from .serializer import PatientSerializer, UserSerializer
+from .testing import make_user, make_patient, seed_care_team, analyze, assert_no_full_scans
 
-# Create your tests here.
+
+# ========= Patients list stays at a fixed number of queries
+class PatientCareTeamQueriesTest(TestCase):
+    def setUp(self):
+        self.admin_user = make_user(
+            'admin', 'admin', is_admin=True, is_staff=True)
+        self.admin = Admin.objects.create(user=self.admin_user)
+        self.client = APIClient()
+        self.user = self.admin_user
+
+    def add_patients(self, count):
+        for i in range(count):
+            number = Patient.objects.count()
+            patient = Patient.objects.create(
+                name=f'patient{number}', age=40, gender='male', status='stable',
+                nat_id=number, room_number=number, disease_type='flu',
+                address='cairo', added_by=self.admin)
+            doctor = Doctor.objects.create(
+                user=make_user(f'doctor{number}', 'doctor', is_doctor=True))
+            nurse = Nurse.objects.create(
+                user=make_user(f'nurse{number}', 'nurse', is_nurse=True))
+            patient.doctor.add(doctor)
+            patient.nurse.add(nurse)
+
+    def count_queries(self, url):
+        # fresh user every request, like a real authentication
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_patients_list_queries_do_not_grow(self):
+        url = reverse('patients')
+        self.add_patients(2)
+        few = self.count_queries(url)
+        self.add_patients(10)
+        many = self.count_queries(url)
+        self.assertEqual(few, many)
+
+    def test_patient_user_list_queries_do_not_grow(self):
+        self.add_patients(2)
+        doctor = Doctor.objects.first()
+        self.user = doctor.user
+        url = reverse('patients_user')
+        for patient in Patient.objects.all():
+            patient.doctor.add(doctor)
+        few = self.count_queries(url)
+        # response cache: new version after the commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_patients(10)
+            for patient in Patient.objects.all():
+                patient.doctor.add(doctor)
+        many = self.count_queries(url)
+        self.assertEqual(few, many)
+
+
+# ========= Cursor pagination
+class KeysetCursorPaginationTest(TestCase):
+    def setUp(self):
+        self.admin_user = make_user(
+            'admin', 'admin', is_admin=True, is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin_user)
+        joined = self.admin_user.date_joined
+        # same date_joined for all, pages must still not repeat or skip rows
+        for i in range(7):
+            make_user(f'doctor{i}', 'doctor', is_doctor=True,
+                      added_by=self.admin_user, date_joined=joined)
+
+    def test_without_cursor_returns_full_list(self):
+        response = self.client.get(reverse('doctors'))
+        self.assertEqual(len(response.data), 7)
+
+    def test_pages_cover_all_rows_once(self):
+        url = reverse('doctors') + '?page_size=3&count=true'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response['X-Total-Count'], '7')
+            seen += [user['username'] for user in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+    def test_invalid_cursor(self):
+        joined = self.admin_user.date_joined.isoformat()
+        for value in [['x', '1'], [joined, 'not-a-uuid'], [None, '1'], [[], {}]]:
+            cursor = base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+            response = self.client.get(reverse('doctors'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, value)
+        self.assertEqual(self.client.get(reverse('doctors'), {'cursor': '%%%'}).status_code, 404)
+
+
+# ========= Token authentication cache
+@override_settings(AUTH_TOKEN_CACHE='default')
+class CachedTokenAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('nurse', 'nurse', is_nurse=True)
+        self.token = Token.objects.create(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def test_second_lookup_uses_cache(self):
+        self.auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertTrue(user.is_nurse)
+
+    def test_user_save_invalidates(self):
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_logout_invalidates(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(client.post(reverse('logout')).status_code, 200)
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    @override_settings(AUTH_TOKEN_CACHE=None)
+    def test_without_shared_cache(self):
+        self.auth.authenticate_credentials(self.token.key)
+        # deactivated by another worker: its invalidation is not seen here
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        with self.assertNumQueries(1), self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+
+# ========= request.actor (Doctor / Nurse / Admin row of the user)
+class ActorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('nurse', 'nurse', is_nurse=True)
+        self.nurse = Nurse.objects.create(user=self.user)
+        self.token = Token.objects.create(user=self.user)
+
+    def test_token_user_needs_no_query(self):
+        auth = CachedTokenAuthentication()
+        auth.authenticate_credentials(self.token.key)
+        user, token = auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            actor = resolve_actor(user)
+            self.assertEqual(actor.nurse.pk, self.nurse.pk)
+        with self.assertRaises(Doctor.DoesNotExist):
+            actor.doctor
+
+    def test_other_user_loaded_in_one_query(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            actor = resolve_actor(user)
+            self.assertEqual(actor.nurse.pk, self.nurse.pk)
+            with self.assertRaises(Admin.DoesNotExist):
+                actor.admin
+
+
+# ========= Email outbox
+class OutboxEmailTest(TestCase):
+    def setUp(self):
+        self.user = make_user('admin', 'admin', is_admin=True, is_active=False)
+
+    def test_reset_password_queues_email(self):
+        response = APIClient().post(reverse('send_code'), {'email': self.user.email})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.PENDING)
+
+        self.assertEqual(send_pending_emails(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.user.refresh_from_db()
+        self.assertIn(self.user.otp, mail.outbox[0].body)
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.SENT)
+
+    def test_failed_send_is_retried_later(self):
+        APIClient().post(reverse('accept_admin'), {'email': self.user.email})
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('down')):
+            self.assertEqual(send_pending_emails(), 0)
+        email = OutboxEmail.objects.get()
+        self.assertEqual(email.status, OutboxEmail.PENDING)
+        self.assertEqual(email.attempts, 1)
+        # not due yet
+        self.assertEqual(send_pending_emails(), 0)
+        OutboxEmail.objects.update(next_attempt=email.created)
+        self.assertEqual(send_pending_emails(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_connection_failures_are_attempts(self):
+        APIClient().post(reverse('accept_admin'), {'email': self.user.email})
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('refused')):
+            for i in range(2):
+                OutboxEmail.objects.update(next_attempt=timezone.now())
+                self.assertEqual(send_pending_emails(), 0)
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts, email.last_error), (OutboxEmail.FAILED, 2, 'refused'))
+
+    def test_once_goes_on_after_a_failed_batch(self):
+        # (claimed, sent) of each round: stops when nothing is claimed, not when nothing is sent
+        rounds = [(1, 0), (1, 1), (0, 0)]
+        with mock.patch('users.management.commands.send_emails.Command.send_batch', side_effect=rounds) as batch:
+            call_command('send_emails', once=True, stdout=StringIO())
+        self.assertEqual(batch.call_count, 3)
+
+
+# ========= Websocket care team events
+class CareTeamConsumerTest(TestCase):
+    def setUp(self):
+        admin = Admin.objects.create(user=make_user('admin', 'admin', is_admin=True))
+        self.doctor = Doctor.objects.create(
+            user=make_user('doctor', 'doctor', is_doctor=True))
+        self.nurse = Nurse.objects.create(
+            user=make_user('nurse', 'nurse', is_nurse=True))
+        self.patient = Patient.objects.create(
+            name='patient', age=40, gender='male', status='stable', nat_id=1,
+            room_number=1, disease_type='flu', address='cairo', added_by=admin)
+        self.patient.nurse.add(self.nurse)
+        self.token = Token.objects.create(user=self.nurse.user)
+
+    def add_report(self):
+        # the events are sent on commit (TestCase: never without this)
+        with self.captureOnCommitCallbacks(execute=True):
+            report = DoctorReport.objects.create(
+                title='check', patient=self.patient, added_by=self.doctor)
+            report.nurse.add(self.nurse)
+        return report
+
+    def test_anonymous_rejected(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(application, '/ws/care_team/')
+            connected, code = await communicator.connect()
+            self.assertFalse(connected)
+        async_to_sync(scenario)()
+
+    def test_nurse_receives_report_events(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                application, f'/ws/care_team/?token={self.token.key}')
+            connected, code = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual(await communicator.receive_json_from(), {'status': 'connected'})
+
+            await communicator.send_json_to({'action': 'subscribe', 'patient': str(self.patient.id)})
+            self.assertEqual((await communicator.receive_json_from())['status'], 'subscribed')
+
+            report = await database_sync_to_async(self.add_report)()
+            events = [await communicator.receive_json_from() for i in range(2)]
+            self.assertEqual({event['event'] for event in events},
+                             {'doctor_report.created', 'doctor_report.received'})
+            self.assertTrue(all(event['id'] == str(report.id) for event in events))
+            await communicator.disconnect()
+        async_to_sync(scenario)()
+
+    def test_not_sent_on_rollback(self):
+        with mock.patch('users.events.send') as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(IntegrityError), transaction.atomic():
+                    report = DoctorReport.objects.create(
+                        title='check', patient=self.patient, added_by=self.doctor)
+                    report.nurse.add(self.nurse)
+                    raise IntegrityError
+        send.assert_not_called()
+
+    def test_subscribe_normalizes_the_patient_id(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                application, f'/ws/care_team/?token={self.token.key}')
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await communicator.send_json_to({'action': 'subscribe', 'patient': f'{{{str(self.patient.id).upper()}}}'})
+            self.assertEqual(await communicator.receive_json_from(),
+                             {'status': 'subscribed', 'patient': str(self.patient.id)})
+            await communicator.send_json_to({'action': 'subscribe', 'patient': 'abc'})
+            self.assertEqual((await communicator.receive_json_from())['error'], 'Invalid patient')
+
+            await database_sync_to_async(self.add_report)()
+            events = [await communicator.receive_json_from() for i in range(2)]
+            self.assertIn('doctor_report.created', {event['event'] for event in events})
+            await communicator.disconnect()
+        async_to_sync(scenario)()
+
+    def test_subscribe_other_patient_denied(self):
+        self.patient.nurse.remove(self.nurse)
+
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                application, f'/ws/care_team/?token={self.token.key}')
+            await communicator.connect()
+            await communicator.receive_json_from()
+            await communicator.send_json_to({'action': 'subscribe', 'patient': str(self.patient.id)})
+            self.assertIn('error', await communicator.receive_json_from())
+            await communicator.disconnect()
+        async_to_sync(scenario)()
+
+
+# ========= Async read views return the same data as the DRF views
+class PatientUserAsyncTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        admin = Admin.objects.create(user=make_user('admin', 'admin', is_admin=True))
+        self.doctor = Doctor.objects.create(
+            user=make_user('doctor', 'doctor', is_doctor=True))
+        nurse = Nurse.objects.create(user=make_user('nurse', 'nurse', is_nurse=True))
+        for i in range(3):
+            patient = Patient.objects.create(
+                name=f'patient{i}', age=40, gender='male', status='stable', nat_id=i,
+                room_number=i, disease_type='flu', address='cairo', added_by=admin)
+            patient.doctor.add(self.doctor)
+            patient.nurse.add(nurse)
+        self.token = Token.objects.create(user=self.doctor.user)
+
+    def test_same_response_as_sync_view(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        expected = client.get(reverse('patients_user')).json()
+
+        request = RequestFactory().get(
+            '/api/patient_user/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = async_to_sync(PatientUserAsync.as_view())(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), expected)
+        self.assertEqual(expected['result'], 3)
+
+    def test_anonymous_rejected(self):
+        request = RequestFactory().get('/api/patient_user/')
+        request.session = {}
+        response = async_to_sync(PatientUserAsync.as_view())(request)
+        self.assertEqual(response.status_code, 401)
+
+
+# ========= Index usage (EXPLAIN) of the admin lists and the signup checks
+class UsersIndexUsageTest(TestCase):
+    def setUp(self):
+        self.admin, doctors, nurses, patients = seed_care_team()
+        analyze()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin.user)
+
+    def test_all_doctors(self):
+        with assert_no_full_scans(self):
+            self.client.get(reverse('doctors'))
+
+    def test_patients(self):
+        # the care team of every listed patient covers most of the doctors / nurses,
+        # reading those tables is the right plan
+        with assert_no_full_scans(self, ignore=('users_doctor', 'users_nurse')):
+            self.client.get(reverse('patients'))
+
+    def test_signup_checks(self):
+        data = {'email': 'new@icu.com', 'username': 'new', 'name': 'new', 'phone': '+201099999999',
+                'nat_id': 99999, 'password': '12345678abc', 'role': 'doctor', 'gender': 'male',
+                'age': '30', 'specialization': 'icu'}
+        with assert_no_full_scans(self):
+            response = self.client.post(reverse('signup_user'), data)
+        self.assertEqual(response.status_code, 201)
+
+
+# ========= Unique national id (users_unique_nat_id), users created without make_user
+class NatIdConstraintTest(TestCase):
+    def test_superusers_keep_the_default(self):
+        User.objects.create_superuser('root1@icu.com', 'password', 'root1')
+        User.objects.create_superuser('root2@icu.com', 'password', 'root2')
+        self.assertEqual(User.objects.filter(nat_id=1).count(), 2)
+
+    def test_unique_for_the_staff(self):
+        User.objects.create(email='d1@icu.com', username='d1', role='doctor', nat_id=42)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create(email='d2@icu.com', username='d2', role='doctor', nat_id=42)
+
+
+# ========= ?search= of the admin lists (users/search.py)
+class IndexedSearchTest(TestCase):
+    def setUp(self):
+        self.admin, self.doctors, nurses, self.patients = seed_care_team()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin.user)
+
+    def search(self, name, query):
+        response = self.client.get(reverse(name), {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_words(self):
+        user = self.doctors[3].user
+        user.name = 'Mona Abd El-Rahman'
+        user.specialization = 'Cardiology'
+        user.save()
+        for query in ['mona', 'MONA rahm', 'cardio', 'el rahman', 'Móna']:
+            self.assertEqual([doctor['id'] for doctor in self.search('doctors', query)], [str(user.id)], query)
+        # the start of a word only, all the words
+        self.assertEqual(self.search('doctors', 'ona'), [])
+        self.assertEqual(self.search('doctors', 'mona neuro'), [])
+        self.assertEqual(len(self.search('nurses', 'nurse')), 20)
+
+    def test_numbers_are_exact(self):
+        patients = self.search('patients', '12')
+        self.assertEqual([patient['name'] for patient in patients], ['patient12'])
+
+    def test_number_out_of_range(self):
+        self.assertEqual(self.search('patients', '99999999999999999999999'), [])
+        self.assertEqual(self.search('doctors', '99999999999999999999999'), [])
+        self.assertEqual(len(self.search('patients', 'flu')), 40)
+        self.assertEqual([doctor['id'] for doctor in self.search('doctors', '1003')], [str(self.doctors[3].user_id)])
+
+    def test_index_usage(self):
+        analyze()
+        with assert_no_full_scans(self, ignore=('users_doctor', 'users_nurse')):
+            self.client.get(reverse('patients'), {'search': '12'})
+        with assert_no_full_scans(self):
+            self.client.get(reverse('doctors'), {'search': '1003'})
+
+
+# ========= Bulk import of patients
+class ImportPatientsTest(TestCase):
+    def setUp(self):
+        self.admin, self.doctors, self.nurses, patients = seed_care_team(patients=0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin.user)
+
+    def upload(self, name, content, **params):
+        upload = SimpleUploadedFile(name, content.encode('utf-8'))
+        return self.client.post(reverse('import_patients') + (f"?type={params['type']}" if params else ''),
+                                {'file': upload}, format='multipart')
+
+    def csv_rows(self, count, start=0):
+        lines = ['name,age,gender,status,nat_id,room_number,disease_type,address,phone,doctor,nurse']
+        for i in range(start, start + count):
+            lines.append(f'patient{i},40,male,stable,{70000 + i},{i},flu,cairo,+2012{i:08d},'
+                         f'{self.doctors[i % 20].user_id};{self.doctors[(i + 1) % 20].user_id},'
+                         f'{self.nurses[i % 20].user_id}')
+        return '\n'.join(lines)
+
+    def test_csv(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upload('patients.csv', self.csv_rows(1200))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['result'], 1200)
+        self.assertEqual(Patient.objects.filter(added_by=self.admin).count(), 1200)
+        self.assertEqual(Patient.doctor.through.objects.count(), 2400)
+        self.assertEqual(self.doctors[0].doctor.count(), 120)
+        # queries per batch, not per row
+        self.assertLess(len(queries), 100)
+
+    def test_json_lines(self):
+        rows = [{'name': 'patient', 'age': 40, 'gender': 'male', 'status': 'stable', 'nat_id': 70000,
+                 'room_number': 1, 'disease_type': 'flu', 'address': 'cairo',
+                 'doctor': [str(self.doctors[0].user_id)], 'nurse': []}]
+        response = self.upload('patients.jsonl', '\n'.join(json.dumps(row) for row in rows))
+        self.assertEqual(response.status_code, 201)
+        patient = Patient.objects.get(nat_id=70000)
+        self.assertEqual(list(patient.doctor.all()), [self.doctors[0]])
+
+    def test_errors_are_reported_and_nothing_is_saved(self):
+        content = self.csv_rows(3) + '\n' + self.csv_rows(1).splitlines()[1] + \
+            '\npatient,x,male,stable,1000,1,flu,cairo,,,\n'
+        response = self.upload('patients.txt', content, type='csv')
+        self.assertEqual(response.status_code, 400)
+        errors = {error['row']: error['errors'] for error in response.data['errors']}
+        # duplicate phone in the file, age not a number
+        self.assertEqual(set(errors), {4, 5})
+        self.assertEqual(errors[4], {'message': 'Phone has already been used'})
+        self.assertIn('age', errors[5])
+        self.assertFalse(Patient.objects.exists())
+
+    def test_unknown_doctor(self):
+        content = self.csv_rows(1).replace(str(self.doctors[0].user_id), str(self.nurses[5].user_id))
+        response = self.upload('patients.csv', content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not found', response.data['errors'][0]['errors']['message'])
+
+    def test_unreadable_file(self):
+        latin1 = SimpleUploadedFile('patients.csv', self.csv_rows(1).replace('cairo', 'caïro').encode('latin-1'))
+        too_long = self.csv_rows(1).replace('cairo', 'x' * 200000)
+        messages = []
+        for upload in [latin1, SimpleUploadedFile('patients.csv', too_long.encode('utf-8'))]:
+            response = self.client.post(reverse('import_patients'), {'file': upload}, format='multipart')
+            self.assertEqual(response.status_code, 400)
+            messages.append(response.data['message'])
+        self.assertEqual(messages[0], 'The file must be UTF-8 text')
+        self.assertTrue(messages[1].startswith('Invalid CSV file'))
+        self.assertFalse(Patient.objects.exists())
+
+
+# ========= Care team assignment
+class CareTeamTest(TestCase):
+    def setUp(self):
+        self.admin, self.doctors, self.nurses, self.patients = seed_care_team(patients=4)
+        self.admin.user.is_staff = True
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin.user)
+
+    def user_ids(self, profiles):
+        return [str(profile.user_id) for profile in profiles]
+
+    def send(self, method, data):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(reverse('care_team'), data, format='json')
+        return response, len(queries)
+
+    def test_assign_nurses_to_doctors(self):
+        response, few = self.send('post', {'doctors': self.user_ids(self.doctors[:2]),
+                                           'nurses': self.user_ids(self.nurses[:2])})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['changes']['doctor_nurse']['added']), 4)
+        response, many = self.send('post', {'doctors': self.user_ids(self.doctors),
+                                            'nurses': self.user_ids(self.nurses)})
+        # the 4 pairs above already exist
+        self.assertEqual(len(response.data['changes']['doctor_nurse']['added']), 396)
+        self.assertEqual(few, many)
+        self.assertEqual(self.doctors[0].nurse.count(), 20)
+
+        response, count = self.send('delete', {'doctors': self.user_ids(self.doctors[:1]),
+                                               'nurses': self.user_ids(self.nurses)})
+        self.assertEqual(len(response.data['changes']['doctor_nurse']['removed']), 20)
+        self.assertEqual(self.doctors[0].nurse.count(), 0)
+
+    def test_replace_team_of_patients(self):
+        patients = [str(patient.id) for patient in self.patients]
+        response, count = self.send('put', {'patients': patients,
+                                            'doctors': self.user_ids(self.doctors[10:11]),
+                                            'nurses': self.user_ids(self.nurses[10:12])})
+        changes = response.data['changes']
+        self.assertEqual(len(changes['patient_doctor']['added']), 4)
+        # seeded with 2 doctors and 2 nurses each
+        self.assertEqual(len(changes['patient_doctor']['removed']), 8)
+        self.assertEqual(len(changes['patient_nurse']['removed']), 8)
+        self.assertEqual(changes['patient_doctor']['added'][0]['doctor'], str(self.doctors[10].user_id))
+        for patient in self.patients:
+            self.assertEqual(list(patient.doctor.all()), [self.doctors[10]])
+            self.assertEqual(patient.nurse.count(), 2)
+
+    def test_unknown_user(self):
+        response, count = self.send('post', {'doctors': self.user_ids(self.nurses[:1]), 'nurses': []})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_ids(self):
+        response, count = self.send('post', {'doctors': ['abc'], 'nurses': self.user_ids(self.nurses[:1])})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('doctor', response.data)
+        response, count = self.send('delete', {'patients': ['abc'], 'nurses': self.user_ids(self.nurses[:1])})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('patient', response.data)
+
+    def test_other_admin(self):
+        other = Admin.objects.create(user=make_user('other', 'admin', is_admin=True))
+        doctor = Doctor.objects.create(user=make_user('other_doctor', 'doctor', added_by=other.user))
+        patient = make_patient(other, 900)
+        response, count = self.send('post', {'doctors': [str(doctor.user_id)],
+                                             'nurses': self.user_ids(self.nurses[:1])})
+        self.assertEqual(response.status_code, 400)
+        response, count = self.send('post', {'patients': [str(patient.id)],
+                                             'nurses': self.user_ids(self.nurses[:1])})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(doctor.nurse.exists())
+        self.assertFalse(patient.nurse.exists())
+
+    def test_delete_patient_user(self):
+        patient = self.patients[0]
+        response = self.client.delete(reverse('delete_patients_user'),
+                                      {'patient': str(patient.id), 'user': str(self.nurses[0].user_id)},
+                                      format='json')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(patient.nurse.count(), 1)
+
+    def test_delete_patient_user_unknown(self):
+        patient = self.patients[0]
+        unknown = '00000000-0000-0000-0000-000000000000'
+        response = self.client.delete(reverse('delete_patients_user'), {
+            'patient': str(patient.id),
+            'user': [str(self.nurses[0].user_id), unknown, str(self.admin.user_id)]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['message'],
+                         f"Doctor or nurse not found: {', '.join(sorted([unknown, str(self.admin.user_id)]))}")
+        self.assertEqual(patient.nurse.count(), 2)
+
+
+# ========= Timeline of the patient
+class PatientTimelineTest(TestCase):
+    def setUp(self):
+        self.admin, self.doctors, self.nurses, self.patients = seed_care_team(patients=2)
+        self.patient = self.patients[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctors[0].user)
+
+        name = Medicines.objects.create(name='paracetamol')
+        start = timezone.now() - timedelta(days=1)
+        rows = []
+        for i in range(9):
+            if i % 3 == 0:
+                row = DoctorReport.objects.create(patient=self.patient, added_by=self.doctors[0], title=f'd{i}')
+            elif i % 3 == 1:
+                row = NurseReport.objects.create(patient=self.patient, added_by=self.nurses[0], title=f'n{i}')
+            else:
+                row = Medicine.objects.create(patient=self.patient, doctor=self.doctors[0].user, name=name,
+                                              dosage='1')
+            type(row).objects.filter(pk=row.pk).update(created=start + timedelta(minutes=i))
+            rows.append(row)
+        # same time as the last medicine, the cursor must not skip it
+        report = DoctorReport.objects.create(patient=self.patient, added_by=self.doctors[1], title='same')
+        DoctorReport.objects.filter(pk=report.pk).update(created=start + timedelta(minutes=8))
+        # another patient
+        DoctorReport.objects.create(patient=self.patients[1], added_by=self.doctors[0], title='other')
+        self.url = reverse('patient_timeline', args=[self.patient.pk])
+
+    def test_pages(self):
+        events = []
+        response = self.client.get(self.url, {'page_size': 3})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            events += response.data['events']
+            if not response.data['next']:
+                break
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(response.data['next'])
+            self.assertLess(len(queries), 12)
+
+        self.assertEqual(len(events), 10)
+        self.assertEqual(len({(event['type'], event['data']['id']) for event in events}), 10)
+        created = [event['created'] for event in events]
+        self.assertEqual(created, sorted(created, reverse=True))
+        self.assertEqual([event['type'] for event in events[:2]], ['medicine', 'doctor_report'])
+
+    def test_since(self):
+        since = (timezone.now() - timedelta(days=1) + timedelta(minutes=6, seconds=30)).isoformat()
+        response = self.client.get(self.url, {'since': since})
+        self.assertEqual(response.data['result'], 3)
+
+    def test_not_in_care_team(self):
+        self.client.force_authenticate(self.doctors[5].user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_pks(self):
+        self.assertEqual(self.client.get(reverse('patient_timeline', args=['abc'])).status_code, 404)
+        for kind, pk in [('doctor_report', 'abc'), ('unknown', '1'), ('medicine', None)]:
+            value = f'{timezone.now().isoformat()}|{kind}'
+            cursor = base64.urlsafe_b64encode(json.dumps([value, pk]).encode('utf-8')).decode('ascii')
+            response = self.client.get(self.url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+    def test_index_usage(self):
+        analyze()
+        with assert_no_full_scans(self, ignore=('users_doctor', 'users_nurse')):
+            self.client.get(self.url, {'page_size': 3})
+
+
+# ========= Delta sync
+class DeltaSyncTest(TestCase):
+    def setUp(self):
+        self.admin, self.doctors, self.nurses, self.patients = seed_care_team(patients=2)
+        self.nurse = self.nurses[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.nurse.user)
+        self.reports = []
+        for i in range(3):
+            report = DoctorReport.objects.create(patient=self.patients[0], added_by=self.doctors[0], title=f'r{i}')
+            report.nurse.add(self.nurse)
+            self.reports.append(report)
+
+    def sync(self, token=None):
+        response = self.client.get(reverse('sync'), {'token': token} if token else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def age(self, rows, **delta):
+        # rows saved before the last sync (outside of the overlap)
+        type(rows[0]).objects.filter(pk__in=[row.pk for row in rows]).update(
+            updated=timezone.now() - timedelta(**delta))
+
+    def test_full_then_delta(self):
+        data = self.sync()
+        self.assertTrue(data['reset'])
+        self.assertEqual(len(data['reports']['changed']), 3)
+        self.assertEqual(data['medicines'], {'changed': [], 'deleted': []})
+
+        self.age(self.reports, minutes=1)
+        token = self.sync()['token']
+
+        self.reports[0].title = 'edited'
+        self.reports[0].save()
+        deleted = str(self.reports[1].pk)
+        self.reports[1].delete()
+        self.reports[2].nurse.remove(self.nurse)
+        other = DoctorReport.objects.create(patient=self.patients[0], added_by=self.doctors[0], title='other')
+        other.nurse.add(self.nurses[1])
+
+        data = self.sync(token)
+        self.assertFalse(data['reset'])
+        self.assertEqual([row['title'] for row in data['reports']['changed']], ['edited'])
+        self.assertEqual(data['reports']['deleted'],
+                         sorted([deleted, str(self.reports[2].pk)]))
+
+    def test_added_recipient_is_sent(self):
+        report = DoctorReport.objects.create(patient=self.patients[0], added_by=self.doctors[0], title='new')
+        self.age(self.reports + [report], minutes=1)
+        token = self.sync()['token']
+        report.nurse.add(self.nurse)
+        self.assertEqual([row['id'] for row in self.sync(token)['reports']['changed']], [report.pk])
+
+    def test_old_token(self):
+        token = sync_token(timezone.now() - timedelta(days=31))
+        data = self.sync(token)
+        self.assertTrue(data['reset'])
+        self.assertEqual(len(data['reports']['changed']), 3)
+
+    def test_invalid_token(self):
+        response = self.client.get(reverse('sync'), {'token': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_deleted_only_to_recipients(self):
+        self.age(self.reports, minutes=1)
+        self.client.force_authenticate(self.nurses[1].user)
+        token = self.sync()['token']
+        self.reports[0].delete()
+        self.assertEqual(self.sync(token)['reports']['deleted'], [])
+
+    def test_missing_profile(self):
+        self.client.force_authenticate(make_user('noprofile', 'nurse'))
+        response = self.client.get(reverse('sync'))
+        self.assertEqual(response.status_code, 403)
+
+
+# ========= Conditional requests (ETag / Last-Modified)
+class ConditionalRequestsTest(TestCase):
+    def setUp(self):
+        self.admin, self.doctors, self.nurses, self.patients = seed_care_team(patients=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin.user)
+        self.url = reverse('patient-details', args=[self.patients[0].pk])
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_patient_details(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        # the care team users are not in "updated"
+        self.assertNotIn('Last-Modified', response)
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.revalidate(self.url, response)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        # the patient row and the scope versions, nothing serialized
+        self.assertEqual(len(queries), 2)
+
+    def test_care_team_user_renamed(self):
+        url = reverse('patients')
+        details, patients = self.client.get(self.url), self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nurses[0].user.name = 'renamed'
+            self.nurses[0].user.save()
+        self.assertEqual(self.revalidate(self.url, details).status_code, 200)
+        self.assertEqual(self.revalidate(url, patients).status_code, 200)
+
+    def test_patient_renamed(self):
+        report = DoctorReport.objects.create(patient=self.patients[0], added_by=self.doctors[0], title='r')
+        self.client.force_authenticate(self.doctors[0].user)
+        # AddDoctorReport: the reports of the doctor
+        url = '/api/reports/doctor_report/'
+        response = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patients[0].name = 'renamed'
+            self.patients[0].save()
+        response = self.revalidate(url, response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reports'][0]['patient'], str(Patient.objects.get(pk=report.patient_id)))
+
+    def test_care_team_change(self):
+        response = self.client.get(self.url)
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=2)):
+            self.patients[0].doctor.add(self.doctors[10])
+        self.assertEqual(self.revalidate(self.url, response).status_code, 200)
+
+        response = self.client.get(self.url)
+        with mock.patch('django.utils.timezone.now', return_value=timezone.now() + timedelta(seconds=4)):
+            self.client.delete(reverse('care_team'), {'patients': [str(self.patients[0].pk)],
+                                                      'nurses': [str(self.nurses[0].user_id)]}, format='json')
+        self.assertEqual(self.revalidate(self.url, response).status_code, 200)
+
+    def test_patients_list(self):
+        url = reverse('patients')
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        self.assertNotEqual(self.revalidate(url + '?search=patient1', response).status_code, 304)
+        self.patients[2].delete()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_nurse_reports(self):
+        report = DoctorReport.objects.create(patient=self.patients[0], added_by=self.doctors[0], title='r')
+        report.nurse.add(self.nurses[0])
+        self.client.force_authenticate(self.nurses[0].user)
+        url = reverse('nurse_reports')
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        report.nurse.remove(self.nurses[0])
+        response = self.revalidate(url, response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reports'], [])
+
+
+# ========= Response cache
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        self.admin, self.doctors, self.nurses, self.patients = seed_care_team(patients=2)
+        self.doctor = self.doctors[0]
+        self.doctor.nurse.add(self.nurses[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.doctor.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_hit_and_invalidation(self):
+        url = reverse('nurses_doctor')
+        stats = response_cache.get_stats()
+        first, _ = self.get(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        second, queries = self.get(url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        # the versions (CacheVersion rows without a shared cache)
+        self.assertEqual(queries, 1)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(response_cache.get_stats()['local_hits'], stats['local_hits'] + 1)
+
+        # care team changed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.nurse.add(self.nurses[1])
+        response, _ = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['result'], 2)
+
+        # name of a nurse changed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.nurses[1].user.name = 'renamed'
+            self.nurses[1].user.save()
+        response, _ = self.get(url)
+        self.assertIn('renamed', [nurse['nurse']['name'] for nurse in response.data['nurses']])
+
+    def test_per_user(self):
+        url = reverse('patients_user')
+        self.get(url)
+        self.client.force_authenticate(self.doctors[1].user)
+        response, _ = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_bulk_care_team_changes(self):
+        url = reverse('nurses_doctor')
+        self.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            change_care_team('add', doctors=[self.doctor.user_id], nurses=[self.nurses[2].user_id])
+        response, _ = self.get(url)
+        self.assertEqual(response.data['result'], 2)
+
+    def test_bump_seen_by_other_workers(self):
+        url = reverse('nurses_doctor')
+        self.get(url)
+        # bump of another worker: only the CacheVersion row changes
+        CacheVersion.objects.update_or_create(scope='users', defaults={'version': 100})
+        response, _ = self.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    @override_settings(RESPONSE_CACHE_VERSIONS='default')
+    def test_versions_in_shared_cache(self):
+        url = reverse('nurses_doctor')
+        self.get(url)
+        response, queries = self.get(url)
+        self.assertEqual((response['X-Cache'], queries), ('HIT', 0))
+        response_cache.bump('users')
+        self.assertEqual(self.get(url)[0]['X-Cache'], 'MISS')
+
+    def test_local_lru(self):
+        lru = response_cache.LocalLRU(2)
+        lru.set('a', 1, 60)
+        lru.set('b', 2, 60)
+        lru.get('a')
+        lru.set('c', 3, 60)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+        lru.set('d', 4, -1)
+        self.assertIsNone(lru.get('d'))
+
+
+# ========= Photos: metadata stripped, hashed names, WebP thumbnails
+class ImagePipelineTest(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT=self.media)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.admin, self.doctors, self.nurses, self.patients = seed_care_team(doctors=2, nurses=2, patients=2)
+
+    def photo(self, color='red'):
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        output = BytesIO()
+        Image.new('RGB', (640, 480), color).save(output, 'JPEG', exif=exif)
+        return SimpleUploadedFile('IMG_0001.jpg', output.getvalue(), content_type='image/jpeg')
+
+    def test_upload_then_thumbnail(self):
+        user = self.doctors[0].user
+        user.image = self.photo()
+        user.save()
+        self.assertRegex(user.image.name, r'^images/[0-9a-f]{32}\.jpg$')
+        with default_storage.open(user.image.name) as file, Image.open(file) as picture:
+            self.assertEqual(len(picture.getexif()), 0)
+        self.assertEqual(ImageJob.objects.filter(object_id=str(user.pk)).count(), 1)
+
+        # same photo: same file
+        other = self.doctors[1].user
+        other.image = self.photo()
+        other.save()
+        self.assertEqual(other.image.name, user.image.name)
+
+        call_command('process_images', '--once', stdout=StringIO())
+        user.refresh_from_db()
+        self.assertTrue(user.thumbnail.endswith('_160x160.webp'))
+        with default_storage.open(user.thumbnail) as file, Image.open(file) as picture:
+            self.assertEqual((picture.format, picture.size), ('WEBP', (160, 160)))
+        self.assertFalse(ImageJob.objects.filter(status=ImageJob.PENDING).exists())
+
+        patient = Patient.objects.with_care_team().get(pk=self.patients[0].pk)
+        doctors = {doctor['id']: doctor['image'] for doctor in PatientSerializer(patient).data['doctor']}
+        self.assertTrue(doctors[user.id].endswith(user.thumbnail))
+
+    def test_new_photo_before_thumbnail(self):
+        patient = self.patients[0]
+        patient.image = self.photo('red')
+        patient.save()
+        patient.image = self.photo('blue')
+        patient.save()
+        self.assertEqual(process_pending_images(), 2)
+        patient.refresh_from_db()
+        self.assertIn(patient.image.name.split('/')[-1][:-4], patient.thumbnail)
+
+    def test_care_team_without_photo(self):
+        User.objects.filter(pk=self.doctors[0].user_id).update(image='')
+        patient = Patient.objects.with_care_team().get(pk=self.patients[0].pk)
+        doctors = {doctor['id']: doctor['image'] for doctor in PatientSerializer(patient).data['doctor']}
+        self.assertIsNone(doctors[self.doctors[0].user_id])
+
+
+# ========= Streamed exports of the admin
+class ExportTest(TestCase):
+    def setUp(self):
+        self.admin, doctors, nurses, self.patients = seed_care_team()
+        DoctorReport.objects.create(patient=self.patients[0], added_by=doctors[0], title='stable, "no" fever')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin.user)
+
+    def export(self, dataset, **params):
+        response = self.client.get(reverse('export', args=[dataset]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        with self.settings(EXPORT_CHUNK_SIZE=7):
+            rows = list(csv.reader(self.export('patients').decode('utf-8').splitlines()))
+        self.assertEqual(rows[0][:3], ['id', 'name', 'nat_id'])
+        self.assertEqual(len(rows), 41)
+        patient = next(row for row in rows if row[1] == 'patient0')
+        self.assertEqual((patient[-2], patient[-1]), ('doctor0; doctor1', 'nurse0; nurse1'))
+
+        rows = list(csv.reader(self.export('doctor_reports').decode('utf-8').splitlines()))
+        self.assertEqual([row[-2] for row in rows], ['title', 'stable, "no" fever'])
+
+    def test_xlsx(self):
+        data = self.export('patients', type='xlsx')
+        with zipfile.ZipFile(BytesIO(data)) as workbook:
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode('utf-8')
+            self.assertIn('xl/workbook.xml', workbook.namelist())
+        self.assertEqual(sheet.count('<row>'), 41)
+        self.assertIn('<t xml:space="preserve">patient0</t>', sheet)
+
+    def test_formulas_and_control_characters(self):
+        DoctorReport.objects.update(title='=HYPERLINK("http://x")\x01')
+        rows = list(csv.reader(self.export('doctor_reports').decode('utf-8').splitlines()))
+        self.assertEqual(rows[1][-2], '\'=HYPERLINK("http://x")\x01')
+        self.assertEqual(rows[1][2], str(self.patients[0].pk))
+
+        data = self.export('doctor_reports', type='xlsx')
+        with zipfile.ZipFile(BytesIO(data)) as workbook:
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode('utf-8')
+        self.assertIn('<t xml:space="preserve">=HYPERLINK("http://x")</t>', sheet)
+
+    def test_queries_per_chunk(self):
+        with self.settings(EXPORT_CHUNK_SIZE=10):
+            response = self.client.get(reverse('export', args=['patients']))
+            with CaptureQueriesContext(connection) as queries:
+                b''.join(response.streaming_content)
+        # one read, then the doctors and the nurses of each chunk of 10
+        self.assertEqual(len(queries), 1 + 2 * 4)
+
+    def test_unknown(self):
+        self.assertEqual(self.client.get(reverse('export', args=['users'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('export', args=['patients']), {'type': 'pdf'}).status_code, 400)
+
+
+class AdminQueryBudgetTest(TestCase):
+    # session, user, the two counts of the changelist and the page
+    budget = 5
+
+    def setUp(self):
+        self.admin, doctors, nurses, patients = seed_care_team()
+        name = Medicines.objects.create(name='paracetamol')
+        for i, patient in enumerate(patients[:15]):
+            report = DoctorReport.objects.create(patient=patient, added_by=doctors[i], title=f'd{i}')
+            report.nurse.set(nurses[i:i + 2])
+            report = NurseReport.objects.create(patient=patient, added_by=nurses[i], title=f'n{i}')
+            report.doctor.set(doctors[i:i + 2])
+            medicine = Medicine.objects.create(patient=patient, doctor=doctors[i].user, name=name, dosage='1')
+            medicine.nurse.set(nurses[i:i + 2])
+        self.admin.user.is_superuser = True
+        self.admin.user.save()
+        self.client.force_login(self.admin.user)
+
+    def test_changelists(self):
+        for model in admin.site._registry:
+            url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist')
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertLessEqual(len(queries), self.budget, url)
+
+    def test_team_names(self):
+        response = self.client.get(reverse('admin:users_patient_changelist'), {'q': 'patient0'})
+        self.assertContains(response, 'doctor0, doctor1')
+        self.assertContains(response, 'nurse0, nurse1')
+        response = self.client.get(reverse('admin:reports_doctorreport_changelist'))
+        self.assertContains(response, 'nurse3, nurse4')
+
+
+class BulkSlugRelatedFieldTest(TestCase):
+    def setUp(self):
+        self.admin, self.doctors, self.nurses, self.patients = seed_care_team(patients=1)
+
+    def serializer(self, nurses):
+        return DoctorReportSerializer(data={'title': 'x', 'patient': str(self.patients[0].pk), 'nurse': nurses})
+
+    def test_one_query(self):
+        nurses = [str(nurse.user_id) for nurse in self.nurses[:10]]
+        serializer = self.serializer(nurses + nurses[:1])
+        # the patient and the nurses
+        with self.assertNumQueries(2):
+            self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data['nurse'], self.nurses[:10] + self.nurses[:1])
+
+    def test_every_missing_id(self):
+        missing = ['00000000-0000-0000-0000-000000000001', str(self.doctors[0].user_id)]
+        serializer = self.serializer([str(self.nurses[0].user_id)] + missing)
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['nurse'], [f'Object with user_id not found: {", ".join(missing)}.'])
+
+        serializer = self.serializer(['not-a-uuid'])
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors['nurse'][0].code, 'invalid')
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.admin, self.doctors, self.nurses, self.patients = seed_care_team(patients=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin.user)
+        metrics.reset()
+
+    def test_server_timing(self):
+        response = self.client.get(reverse('doctors'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", serialize;dur=[\d.]+, render;dur=[\d.]+, '
+                         r'total;dur=[\d.]+$')
+
+    def test_serialize_time(self):
+        # the time of to_representation is in "serialize", not only the JSON encoding
+        to_representation = UserSerializer.to_representation
+
+        def slow(serializer, instance):
+            time.sleep(0.01)
+            return to_representation(serializer, instance)
+        with mock.patch.object(UserSerializer, 'to_representation', slow):
+            response = self.client.get(reverse('doctors'))
+        timings = dict(re.findall(r'(\w+);dur=([\d.]+)', response['Server-Timing']))
+        self.assertGreaterEqual(float(timings['serialize']), 10 * len(self.doctors))
+        self.assertLessEqual(float(timings['serialize']), float(timings['total']))
+        self.assertGreaterEqual(metrics.serialize_seconds[('doctors', 'GET')], 0.01 * len(self.doctors))
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_prometheus(self):
+        self.client.get(reverse('doctors'))
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('icu_http_requests_total{endpoint="doctors",method="GET",status="200"} 1', text)
+        self.assertIn('icu_http_db_queries_bucket{endpoint="doctors",method="GET",le="+Inf"} 1', text)
+        self.assertIn('icu_http_request_duration_seconds_count{endpoint="doctors",method="GET"} 1', text)
+
+    def test_budget(self):
+        # the test runner enforces the budgets
+        self.assertTrue(settings.QUERY_BUDGET_STRICT)
+        with mock.patch.object(AllDoctors, 'query_budget', {'GET': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('doctors'))
+            with self.settings(QUERY_BUDGET_STRICT=False):
+                self.assertEqual(self.client.get(reverse('doctors')).status_code, 200)
+        self.assertEqual(metrics.budget_exceeded[('doctors', 'GET')], 2)
+
+
+class SyntheticDataTest(TestCase):
+    def setUp(self):
+        call_command('generate_data', admins=2, doctors=6, nurses=10, patients=20, reports=40, medicines=10,
+                     rays=0, stdout=StringIO())
+
+    def test_generate(self):
+        self.assertEqual(User.objects.filter(is_superuser=True).count(), 1)
+        self.assertEqual((Admin.objects.count(), Doctor.objects.count(), Nurse.objects.count()), (2, 6, 10))
+        self.assertEqual(Patient.objects.count(), 20)
+        self.assertEqual(DoctorReport.objects.count() + NurseReport.objects.count(), 40)
+        for patient in Patient.objects.prefetch_related('doctor__user', 'nurse__user'):
+            self.assertTrue(2 <= patient.doctor.count() <= 3)
+            self.assertTrue(3 <= patient.nurse.count() <= 5)
+            # the care team of the patient comes from its admin
+            self.assertEqual({doctor.user.added_by_id for doctor in patient.doctor.all()},
+                             {patient.added_by.user_id})
+        # a report goes to the whole care team of its patient
+        for report in DoctorReport.objects.prefetch_related('nurse', 'patient__nurse'):
+            self.assertEqual(set(report.nurse.all()), set(report.patient.nurse.all()))
+            self.assertIn(report.added_by, report.patient.doctor.all())
+        for medicine in Medicine.objects.prefetch_related('nurse', 'patient__nurse'):
+            self.assertEqual(set(medicine.nurse.all()), set(medicine.patient.nurse.all()))
+
+    def test_benchmark(self):
+        reports = DoctorReport.objects.count()
+        benchmark = Benchmark(requests=3, warmup=1, only=['GET /api/patients/?', 'POST /api/reports/doctor_report/'])
+        result = benchmark.run()
+        self.assertEqual(result['dataset']['patients'], 20)
+        endpoints = {endpoint['name']: endpoint for endpoint in result['endpoints']}
+        self.assertEqual(set(endpoints), {'GET /api/patients/?search=sepsis', 'POST /api/reports/doctor_report/'})
+        self.assertEqual(endpoints['GET /api/patients/?search=sepsis']['status'], 200)
+        self.assertEqual(endpoints['POST /api/reports/doctor_report/']['status'], 201)
+        self.assertGreater(endpoints['POST /api/reports/doctor_report/']['queries'], 0)
+        # the writes are rolled back
+        self.assertEqual(DoctorReport.objects.count(), reports)
+        self.assertIn({'name': 'POST /api/logout', 'reason': 'deletes the token of the benchmark user'},
+                      result['skipped'])
+
+        slower = json.loads(json.dumps(result))
+        endpoint = slower['endpoints'][0]
+        endpoint.update(p95_ms=endpoint['p95_ms'] * 2 + 10, queries=endpoint['queries'] + 1)
+        self.assertEqual(compare(result, result), [])
+        self.assertEqual(len(compare(result, slower)), 2)
@@ -0,0 +1,148 @@
+import heapq
+from django.apps import apps
+from django.core import exceptions
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import NotFound, ValidationError
+from .pagination import KeysetCursorPagination
+
+
+# ============================================================================
+# Patient timeline: reports, medicines and rays of one patient, newest first
+# ============================================================================
+# Every source is read with one query ordered by its (patient, -created) index
+# and limited to the page, the rows are merged in Python (k-way merge).
+class TimelineSource:
+    def __init__(self, kind, model, serializer, select_related=(), prefetch_related=()):
+        self.kind = kind
+        self.model = model
+        self.serializer = serializer
+        self.select_related = select_related
+        self.prefetch_related = prefetch_related
+
+    @property
+    def installed(self):
+        return apps.is_installed(self.model.split('.')[0])
+
+    def get_queryset(self, patient):
+        model = apps.get_model(self.model)
+        return (model.objects.filter(patient=patient, created__isnull=False)
+                .select_related(*self.select_related).prefetch_related(*self.prefetch_related))
+
+    @cached_property
+    def serializer_class(self):
+        return import_string(self.serializer)
+
+
+TIMELINE_SOURCES = [
+    TimelineSource('doctor_report', 'reports.DoctorReport',
+                   'reports.serializer.ResultDoctorReportSerializer',
+                   prefetch_related=['nurse__user']),
+    TimelineSource('nurse_report', 'reports.NurseReport',
+                   'reports.serializer.ResultNurseReportSerializer',
+                   prefetch_related=['doctor__user']),
+    TimelineSource('medicine', 'medicine.Medicine',
+                   'medicine.serializer.ResultMedicineSerializer',
+                   select_related=['name'], prefetch_related=['nurse__user']),
+    TimelineSource('rays', 'rays.Rays',
+                   'rays.serializer.ResultDoctorRaysSerializer',
+                   prefetch_related=['nurse__user']),
+]
+
+
+# ---- Cursor of the timeline: created, kind and pk of the last event
+class TimelinePagination(KeysetCursorPagination):
+    def __init__(self, sources=None):
+        super().__init__()
+        self.sources = sources or TIMELINE_SOURCES
+
+    def encode_cursor(self, value, pk):
+        created, kind = value
+        return super().encode_cursor(f'{created.isoformat()}|{kind}', pk)
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        value, pk = cursor
+        if not isinstance(value, str):
+            raise NotFound(self.invalid_cursor_message)
+        created, _, kind = value.partition('|')
+        try:
+            created = parse_datetime(created)
+        except ValueError:
+            created = None
+        if created is None:
+            raise NotFound(self.invalid_cursor_message)
+        # pk of a row of the kind (compared with its pk column)
+        source = next((source for source in self.sources if source.kind == kind), None)
+        if source is None:
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            pk = apps.get_model(source.model)._meta.pk.to_python(pk)
+        except (exceptions.ValidationError, LookupError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pk is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created, kind, pk
+
+    def is_requested(self, request):
+        return True
+
+
+def after_cursor(queryset, kind, cursor):
+    # rows after (created, kind, pk) in the order -created, -kind, -pk
+    created, cursor_kind, pk = cursor
+    if kind < cursor_kind:
+        return queryset.filter(created__lte=created)
+    if kind > cursor_kind:
+        return queryset.filter(created__lt=created)
+    return queryset.filter(Q(created__lt=created) | Q(created=created, pk__lt=pk))
+
+
+def get_timeline(request, patient, sources=None):
+    paginator = TimelinePagination(sources)
+    size = paginator.get_page_size(request)
+    cursor = paginator.decode_cursor(request)
+    since = request.query_params.get('since')
+    if since:
+        try:
+            since = parse_datetime(since)
+        except ValueError:
+            since = None
+        if since is None:
+            raise ValidationError({"message": "since must be a date time (ISO 8601)"})
+
+    streams = []
+    for source in sources or TIMELINE_SOURCES:
+        if not source.installed:
+            continue
+        queryset = source.get_queryset(patient)
+        if since:
+            queryset = queryset.filter(created__gt=since)
+        if cursor is not None:
+            queryset = after_cursor(queryset, source.kind, cursor)
+        rows = queryset.order_by('-created', '-pk')[:size + 1]
+        streams.append([((row.created, source.kind, row.pk), source, row) for row in rows])
+
+    # every stream is sorted, merge them newest first
+    merged = list(heapq.merge(*streams, key=lambda event: event[0], reverse=True))
+    page = merged[:size]
+
+    events = []
+    for (created, kind, pk), source, row in page:
+        # all the rows are of this patient (no join)
+        row.patient = patient
+        events.append({
+            "type": kind,
+            "created": created,
+            "data": source.serializer_class(row).data,
+        })
+
+    paginator.request = request
+    if len(merged) > size:
+        created, kind, pk = page[-1][0]
+        paginator.next_cursor = paginator.encode_cursor((created, kind), pk)
+    return {"result": len(events), "next": paginator.get_next_link(), "events": events}
@@ -1,10 +1,15 @@
+from django.conf import settings
 from django.urls import path
 from .views import (SignUpAdminView, GetActiveAdminUser, SignUpUserView, Login,
                     LogoutView, LoginUser, AddDeleteNurseUser, NurseDoctor, DoctorNurse, AllDoctors, AllNurses,
                     GetPendingAdminUser, DetailsAdminUser, AccepterAdminUser, UserDetails, SignupPatients,
                     Patients, PatientDetailsAPI, PatientDeleteUser, GetUsersPatient, GetRelatedUser,
-                    PasswordResetView, VerifyOTP, PasswordView, DoctorsName, NursesName, PatientUser
+                    ImportPatients, ExportData, CareTeamView, PatientTimeline, PasswordResetView, VerifyOTP, PasswordView,
+                    DoctorsName, NursesName, PatientUser, DeltaSync
                     )
+from .async_views import PatientUserAsync
+
+PatientUserView = PatientUserAsync if settings.ASYNC_VIEWS else PatientUser
 
 
 urlpatterns = [
@@ -54,6 +59,9 @@ urlpatterns = [
     path("add_nurses", AddDeleteNurseUser.as_view(), name="nurse_doctor"),
     path("delete_nurses_doctor", AddDeleteNurseUser.as_view(), name="nurse_doctor"),
 
+    # Assign / unassign many doctors, nurses and patients
+    path("care_team", CareTeamView.as_view(), name="care_team"),
+
     # Return Nurse For doctor
     path("nurse/", NurseDoctor.as_view(), name="nurses_doctor"),
     path("nurse/<str:pk>", NurseDoctor.as_view(), name="nurses_doctor"),
@@ -65,16 +73,22 @@ urlpatterns = [
 
     # ----------------PatientAPI---------------
     path("add-patient", SignupPatients.as_view(), name="add_patient"),
+    path("import-patients", ImportPatients.as_view(), name="import_patients"),
+    path("export/<str:dataset>", ExportData.as_view(), name="export"),
     path("patients/", Patients.as_view(), name="patients"),
     path("patients/<str:pk>", PatientDetailsAPI.as_view(), name="patient-details"),
+    path("patients/<str:pk>/timeline", PatientTimeline.as_view(), name="patient_timeline"),
     path("delete_patients_user", PatientDeleteUser.as_view(),
          name="delete_patients_user"),
     # ====== (Admin) Return Patient For one (nurse , or doctor)
     path("get_patients_user/<str:pk>",
          GetUsersPatient.as_view(), name="patients_user"),
 
+    # =================== Reports / medicines changed since the last sync (doctor or nurse) =========
+    path("sync", DeltaSync.as_view(), name="sync"),
+
     # =================== Return Patient For one doctor or nurse (Login) =========
-    path("patient_user/", PatientUser.as_view(), name="patients_user"),
+    path("patient_user/", PatientUserView.as_view(), name="patients_user"),
     path("patient_user/<str:pk>",
-         PatientUser.as_view(), name="patients_user"),
+         PatientUserView.as_view(), name="patients_user"),
 ]
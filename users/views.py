@@ -3,6 +3,7 @@ from rest_framework.views import APIView
 from .email_Send import send_via_email, send_otp_via_email
 from django.contrib.auth.hashers import make_password
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.parsers import MultiPartParser
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
@@ -11,12 +12,25 @@ from .serializer import (SignUpAdminSerializer, SignUpUserSerializer, AddNurseSe
                          UserSerializer, SimpleUserSerializer, NurseSerializer, DoctorSerializer, UsersName,
                          AddPatient, PatientSerializer, PatientDoctorsSerializer, PatientNurseSerializer,
                          ResetPasswordSerializer, VerifyOtpSerializer, PasswordSerializer)
-from .models import (Admin, Doctor, Nurse, User, Patient)
+from .models import (Doctor, Nurse, User, Patient)
+from .care_team import change_care_team, parse_ids
+from .conditional import conditional_list, conditional_object
+from .patient_import import PatientImport
+from .export import EXPORT_DATASETS, EXPORT_FORMATS
+from .response_cache import cached_response
+from .search import IndexedSearchFilter
+from .sync import SYNC_FEEDS, get_changes
+from .timeline import get_timeline
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 User = get_user_model()
 
+# in the ETags: the patients show the users of their care team
+PATIENT_SCOPES = ['users', 'care_team']
+
 
 # ---------- SignUp Admin View
 class SignUpAdminView(generics.GenericAPIView):
@@ -138,33 +152,45 @@ class AddDeleteNurseUser(generics.RetrieveUpdateDestroyAPIView):
 
     def post(self, request: Request):
         data = request.data
-        doctor = data.get('doctor')
-        nurses_ids = data.get('nurse')
-
-        doctor_instance = Doctor.objects.get(user=doctor)
-        for nurse_id in nurses_ids:
-            nurse_instance = Nurse.objects.get(user_id=nurse_id)
-            doctor_instance.nurse.add(nurse_instance)
-            self.serializer_class(data=data)
-            doctor_instance.save()
+        change_care_team('add', doctors=data.get('doctor'), nurses=data.get('nurse'), admin_user=request.user)
         return Response({"message": "Nurse Added successfully"}, status=status.HTTP_201_CREATED)
 
     def delete(self, request, pk=None):
         data = request.data
-        # Get Doctor
-        doctor_instance = Doctor.objects.get(user=data['doctor'])
-        # Get Nurse For Delete
-        nurse_instance = Nurse.objects.get(user=data['nurse'])
-        doctor_instance.nurse.remove(nurse_instance)
+        change_care_team('remove', doctors=data['doctor'], nurses=data['nurse'], admin_user=request.user)
         return Response({"message": "Nurse deleted"}, status=status.HTTP_204_NO_CONTENT)
 
 
+# ----- Assign / unassign care teams (many doctors, nurses and patients at once)
+# {"doctors": [...], "nurses": [...]}: nurses of the doctors
+# {"patients": [...], "doctors": [...], "nurses": [...]}: doctors / nurses of the patients
+# POST adds, DELETE removes, PUT replaces the team (shift handover)
+class CareTeamView(generics.GenericAPIView):
+    permission_classes = [IsAdminRole, IsAuthenticated]
+
+    def change(self, request, action):
+        data = request.data
+        changes = change_care_team(action, doctors=data.get('doctors'), nurses=data.get('nurses'),
+                                   patients=data.get('patients'), admin_user=request.user)
+        return Response({"changes": changes}, status=status.HTTP_200_OK)
+
+    def post(self, request: Request):
+        return self.change(request, 'add')
+
+    def put(self, request: Request):
+        return self.change(request, 'replace')
+
+    def delete(self, request: Request):
+        return self.change(request, 'remove')
+
+
 # ----- Return Nurses for doctor
 class NurseDoctor(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsDoctor]
+    query_budget = {'GET': 6}
 
+    @cached_response('nurses_doctor', ['care_team', 'users'])
     def get(self, request, pk=None):
-        user = request.user
 
         if pk:
             queryset = Nurse.objects.prefetch_related(
@@ -173,7 +199,7 @@ class NurseDoctor(generics.ListCreateAPIView):
 
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
-            doctor = Doctor.objects.get(user_id=user.id)
+            doctor = request.actor.doctor
             queryset = doctor.nurse.prefetch_related('doctor_nurse')
             nurses = self.filter_queryset(queryset)
             serializer = NurseSerializer(nurses, many=True)
@@ -184,8 +210,8 @@ class NurseDoctor(generics.ListCreateAPIView):
 class DoctorNurse(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsNurse]
 
+    @cached_response('doctors_nurse', ['care_team', 'users'])
     def get(self, request, pk=None):
-        user = request.user
         list_doctors = []
 
         if pk:
@@ -194,7 +220,7 @@ class DoctorNurse(generics.ListCreateAPIView):
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         else:
-            nurse = Nurse.objects.get(user_id=user.id)
+            nurse = request.actor.nurse
             doctors = Doctor.objects.filter(nurse=nurse)
 
             for doctor in doctors:
@@ -208,14 +234,15 @@ class DoctorNurse(generics.ListCreateAPIView):
 # -------- Get Doctors (Admin)
 class AllDoctors(generics.ListCreateAPIView):
     permission_classes = [IsAdminRole, IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    search_fields = ['name', 'username', 'gender', 'specialization']
+    query_budget = {'GET': 2}
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter]
+    search_exact_fields = ['nat_id']
     serializer_class = UserSerializer
 
     def get_queryset(self, pk=None):
         user = self.request.user
         if user.role == 'admin':
-            return User.objects.filter(added_by=user).filter(role='doctor')
+            return User.objects.filter(added_by=user).filter(role='doctor').select_related('added_by')
         else:
             return Response({'message': 'Not Have Access'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -223,14 +250,15 @@ class AllDoctors(generics.ListCreateAPIView):
 # -------- Get Nurses (Admin)
 class AllNurses(generics.ListCreateAPIView):
     permission_classes = [IsAdminRole, IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    search_fields = ['name', 'username', 'gender', 'specialization']
+    query_budget = {'GET': 2}
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter]
+    search_exact_fields = ['nat_id']
     serializer_class = UserSerializer
 
     def get_queryset(self,  pk=None):
         user = self.request.user
         if user.role == 'admin':
-            return User.objects.filter(added_by=user).filter(role='nurse')
+            return User.objects.filter(added_by=user).filter(role='nurse').select_related('added_by')
         else:
             return Response({'message': 'Not Have Access'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -273,8 +301,7 @@ class SignupPatients(generics.GenericAPIView):
 
     def post(self, request: Request):
         data = request.data
-        user_added = request.user
-        admin = Admin.objects.get(user_id=user_added.id)
+        admin = request.actor.admin
         serializer = self.serializer_class(data=data)
         if serializer.is_valid(raise_exception=True):
             user = serializer.save(added_by=admin)
@@ -288,27 +315,111 @@ class SignupPatients(generics.GenericAPIView):
             return Response({serializer.errors})
 
 
+# ----- Import patients (CSV or JSON lines file) ---------
+class ImportPatients(generics.GenericAPIView):
+    permission_classes = [IsAdminRole, IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request: Request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"message": "Send the patients in a CSV or JSON lines file"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = request.query_params.get('type')
+        patient_import = PatientImport(request.actor.admin)
+        if not patient_import.run(patient_import.read_rows(upload, file_format)):
+            return Response({"message": "No patients created", "errors": patient_import.errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({"result": patient_import.created, "message": "Patients Created Successfully"},
+                        status=status.HTTP_201_CREATED)
+
+
+# ----- Export of the patients / reports / medicines of the admin (CSV or XLSX, streamed) ---------
+class ExportData(APIView):
+    permission_classes = [IsAdminRole, IsAuthenticated]
+    query_budget = 1
+
+    def get(self, request, dataset):
+        export = EXPORT_DATASETS.get(dataset)
+        if export is None or not export.installed:
+            return Response({"message": f"Unknown export, one of: {', '.join(EXPORT_DATASETS)}"},
+                            status=status.HTTP_404_NOT_FOUND)
+        file_format = request.query_params.get('type', 'csv')
+        if file_format not in EXPORT_FORMATS:
+            return Response({"message": "type must be csv or xlsx"}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type, stream = EXPORT_FORMATS[file_format]
+        response = StreamingHttpResponse(stream(export, export.rows(request.actor.admin)),
+                                         content_type=content_type)
+        filename = f'{dataset}-{timezone.localdate().isoformat()}.{file_format}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
 # ----- Patients for admin ---------
 class Patients(generics.ListCreateAPIView):
     permission_classes = [IsAdminRole, IsAuthenticated]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    search_fields = ['name', 'disease_type', 'room_number']
+    query_budget = {'GET': 6}
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter]
+    search_exact_fields = ['room_number', 'nat_id']
     serializer_class = PatientSerializer
 
     def get_queryset(self):
-        admin = Admin.objects.get(user_id=self.request.user)
-        return admin.added_admin.all()
+        admin = self.request.actor.admin
+        return admin.added_admin.with_care_team()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return conditional_list(request, queryset, lambda: super(Patients, self).list(request, *args, **kwargs),
+                                scopes=PATIENT_SCOPES)
+
+
+# ----- Delta sync of the reports / medicines of the doctor or nurse ---------
+class DeltaSync(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = 4
+
+    def get(self, request):
+        role = request.user.role
+        try:
+            profile = getattr(request.actor, role) if role in SYNC_FEEDS else None
+        except (Doctor.DoesNotExist, Nurse.DoesNotExist):
+            profile = None
+        if profile is None:
+            return Response({"message": "Not Have Access"}, status=status.HTTP_403_FORBIDDEN)
+        changes = get_changes(request.user, profile, request.query_params.get('token'))
+        return Response(changes, status=status.HTTP_200_OK)
+
+
+# ----- Timeline of the patient (reports, medicines and rays, newest first) ---------
+class PatientTimeline(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = 7
+
+    def get(self, request, pk=None):
+        try:
+            patient = Patient.objects.filter(pk=pk).visible_to(request.user).first()
+        except ValidationError:
+            # not a UUID
+            patient = None
+        if patient is None:
+            return Response({"message": "Not Have Access"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(get_timeline(request, patient), status=status.HTTP_200_OK)
 
 
 # ----- Patient Details ---------
 class PatientDetailsAPI(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AddPatient
     permission_classes = [IsAdminRole, IsAuthenticated]
+    query_budget = {'GET': 5}
 
     def get(self, request, pk=None):
-        queryset = Patient.objects.get(id=pk)
-        data = PatientSerializer(queryset).data
-        return Response(data=data, status=status.HTTP_200_OK)
+        def build():
+            queryset = Patient.objects.with_care_team().get(id=pk)
+            data = PatientSerializer(queryset).data
+            return Response(data=data, status=status.HTTP_200_OK)
+        return conditional_object(request, Patient.objects, pk, build, fallback='date_joined', scopes=PATIENT_SCOPES)
 
     def put(self, request, pk=None):
         patient = Patient.objects.get(id=pk)
@@ -339,22 +450,21 @@ class PatientDeleteUser(generics.RetrieveUpdateDestroyAPIView):
     def delete(self, request, pk=None):
         data = request.data
 
-        # Get patient
-        patient_instance = Patient.objects.get(id=data['patient'])
-
-        # Get User For Delete
-        user = data['user']
-        user_instance = User.objects.get(id=user)
-
-        if user_instance.role == 'doctor':
-            doctor = Doctor.objects.get(user=user_instance)
-            patient_instance.doctor.remove(doctor)
-            return Response({"message": "Doctor deleted"}, status=status.HTTP_204_NO_CONTENT)
-
-        else:
-            nurse = Nurse.objects.get(user=user_instance)
-            patient_instance.nurse.remove(nurse)
+        # Doctors / nurses removed from the patients
+        user_ids = parse_ids(data.get('user'), 'user')
+        users = {str(user_id): role for user_id, role in User.objects.filter(
+            id__in=user_ids, role__in=['doctor', 'nurse']).values_list('id', 'role')}
+        missing = user_ids - set(users)
+        if missing:
+            return Response({"message": f"Doctor or nurse not found: {', '.join(sorted(missing))}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        doctors = [user_id for user_id, role in users.items() if role == 'doctor']
+        nurses = [user_id for user_id, role in users.items() if role == 'nurse']
+        change_care_team('remove', doctors=doctors, nurses=nurses, patients=data.get('patient') or [],
+                         admin_user=request.user)
+        if nurses:
             return Response({"message": "Nurse deleted"}, status=status.HTTP_204_NO_CONTENT)
+        return Response({"message": "Doctor deleted"}, status=status.HTTP_204_NO_CONTENT)
 
 
 # (Admin) Return Patient For one (nurse , or doctor)
@@ -365,14 +475,16 @@ class GetUsersPatient(generics.ListCreateAPIView):
         user = User.objects.get(pk=pk)
         if user.role == 'doctor':
             doctor = Doctor.objects.get(user=user)
-            patients = Patient.objects.filter(doctor=doctor)
+            patients = Patient.objects.filter(
+                doctor=doctor).with_care_team(doctors=False)
             serializer = PatientDoctorsSerializer(
                 patients, many=True, context=self.get_serializer_context())
             return Response({"result": patients.count(), "patients_data": serializer.data}, status=status.HTTP_200_OK)
 
         else:
             nurse = Nurse.objects.get(user=user)
-            patients = Patient.objects.filter(nurse=nurse)
+            patients = Patient.objects.filter(
+                nurse=nurse).with_care_team(nurses=False)
             serializer = PatientNurseSerializer(
                 patients, many=True, context=self.get_serializer_context())
             return Response({"result": patients.count(), "patients_data": serializer.data}, status=status.HTTP_200_OK)
@@ -381,40 +493,47 @@ class GetUsersPatient(generics.ListCreateAPIView):
 # ----- Return Patient for doctor and nurse
 class PatientUser(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 7
 
+    @cached_response('patients_user', ['patients', 'users'])
     def get(self, request, pk=None):
         user = request.user
         if pk:
-            queryset = Patient.objects.prefetch_related(
-                'doctor').prefetch_related('nurse').get(id=pk)
+            def build():
+                queryset = Patient.objects.with_care_team().get(id=pk)
 
-            if user.role == 'doctor':
-                serializer = PatientDoctorsSerializer(queryset)
+                if user.role == 'doctor':
+                    serializer = PatientDoctorsSerializer(queryset)
 
-            elif user.role == 'nurse':
-                serializer = PatientNurseSerializer(queryset)
+                elif user.role == 'nurse':
+                    serializer = PatientNurseSerializer(queryset)
 
-            return Response(serializer.data, status=status.HTTP_200_OK)
+                return Response(serializer.data, status=status.HTTP_200_OK)
+            return conditional_object(request, Patient.objects, pk, build, user.role, fallback='date_joined',
+                                      scopes=PATIENT_SCOPES)
 
         else:
             # --------------------------------
             if user.role == 'doctor':
-                doctor = Doctor.objects.get(user_id=user.id)
-                patients = doctor.doctor.all()
+                doctor = request.actor.doctor
+                patients = doctor.doctor.with_care_team(doctors=False)
                 serializer = PatientDoctorsSerializer(patients, many=True,)
 
             # --------------------------------
             elif user.role == 'nurse':
-                nurse = Nurse.objects.get(user_id=user.id)
-                patients = nurse.nurse.all()
+                nurse = request.actor.nurse
+                patients = nurse.nurse.with_care_team(nurses=False)
                 serializer = PatientNurseSerializer(patients, many=True)
 
-            return Response({"result": patients.count(), "patients_data": serializer.data}, status=status.HTTP_200_OK)
+            return conditional_list(request, patients, lambda: Response(
+                {"result": patients.count(), "patients_data": serializer.data}, status=status.HTTP_200_OK),
+                scopes=PATIENT_SCOPES)
 
 
 class GetRelatedUser(generics.ListCreateAPIView):
     permission_classes = [IsAdminRole, IsAuthenticated]
 
+    @cached_response('related_user', ['care_team', 'users'])
     def get(self, request, pk=None):
         user = User.objects.get(id=pk)
         list_doctors = []
@@ -436,6 +555,7 @@ class GetRelatedUser(generics.ListCreateAPIView):
 class DoctorsName(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsAdminRole]
 
+    @cached_response('doctors_name', ['users'])
     def get(self, request):
         doctors = User.objects.filter(role='doctor')
         serializer = UsersName(doctors, many=True).data
@@ -445,6 +565,7 @@ class DoctorsName(generics.ListCreateAPIView):
 class NursesName(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated, IsAdminRole]
 
+    @cached_response('nurses_name', ['users'])
     def get(self, request):
         nurses = User.objects.filter(role='nurse')
         serializer = UsersName(nurses, many=True).data